@@ -0,0 +1,105 @@
+"""
+Throughput of the Java-free TIFF reader of the data structure step compared
+to the Bio-Formats reader on synthetic (OME-)TIFF files.
+
+Run with `python benchmarks/dataStruct_benchmark.py`. The Bio-Formats reader
+is skipped when javabridge is not installed. Its time includes the start of
+the Java VM, which is paid once per conversion.
+"""
+import os
+import time
+import tempfile
+import importlib.util
+
+import numpy as np
+import pandas as pd
+import tifffile
+
+from cellacdc import dataStruct
+
+def write_test_files(folder, SizeT=20, SizeZ=10, SizeC=2, shape=(512, 512)):
+    """Write a (T, Z, C, Y, X) uint16 time-lapse as uncompressed OME-TIFF,
+    zlib compressed OME-TIFF and ImageJ hyperstack. Returns {name: path}.
+    """
+    rng = np.random.default_rng(0)
+    data = rng.integers(
+        0, 4096, size=(SizeT, SizeZ, SizeC, *shape), dtype=np.uint16
+    )
+    files = {
+        'OME-TIFF': ('ome_raw.ome.tif', {'metadata': {'axes': 'TZCYX'}}),
+        'OME-TIFF zlib': (
+            'ome_zlib.ome.tif',
+            {'metadata': {'axes': 'TZCYX'}, 'compression': 'zlib'}
+        ),
+        'ImageJ': (
+            'imagej.tif', {'imagej': True, 'metadata': {'axes': 'TZCYX'}}
+        )
+    }
+    paths = {}
+    for name, (filename, kwargs) in files.items():
+        path = os.path.join(folder, filename)
+        tifffile.imwrite(path, data, **kwargs)
+        paths[name] = path
+    return paths
+
+def convert_file(rawFilePath, reader, metadataXML, dst_folder, to_h5):
+    """Convert every channel of the first series like `bioFormatsWorker`"""
+    Pixels = dataStruct.omexml.OMEXML(metadataXML).image(0).Pixels
+    ext = '.h5' if to_h5 else '.tif'
+    for c in range(Pixels.SizeC):
+        filePath = os.path.join(dst_folder, f'ch{c}{ext}')
+        dataStruct.save_bioformats_channel(
+            reader, 0, filePath, c, None, Pixels.SizeT, Pixels.SizeZ,
+            None, useIndex=False, to_h5=to_h5
+        )
+
+def _run_tiff_reader(rawFilePath, dst_folder, to_h5):
+    metadataXML = dataStruct.get_tiff_omexml_metadata(rawFilePath)
+    with dataStruct.TiffPlaneReader(rawFilePath) as reader:
+        convert_file(rawFilePath, reader, metadataXML, dst_folder, to_h5)
+
+def _run_bioformats(rawFilePath, dst_folder, to_h5):
+    import javabridge
+    from cellacdc import bioformats
+    if not _run_bioformats.isJavaVMrunning:
+        javabridge.start_vm(class_path=bioformats.JARS, run_headless=True)
+        _run_bioformats.isJavaVMrunning = True
+    metadataXML = bioformats.get_omexml_metadata(rawFilePath)
+    with bioformats.ImageReader(rawFilePath) as reader:
+        convert_file(rawFilePath, reader, metadataXML, dst_folder, to_h5)
+
+_run_bioformats.isJavaVMrunning = False
+
+def get_readers():
+    readers = {'TIFF reader': _run_tiff_reader}
+    if importlib.util.find_spec('javabridge') is not None:
+        readers['Bio-Formats'] = _run_bioformats
+    return readers
+
+def run_benchmark(**kwargs):
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = write_test_files(temp_dir, **kwargs)
+        dst_folder = os.path.join(temp_dir, 'Images')
+        os.makedirs(dst_folder)
+        for name, path in paths.items():
+            with tifffile.TiffFile(path) as tif:
+                nbytes = tif.series[0].size*tif.series[0].dtype.itemsize
+            for reader_name, run in get_readers().items():
+                for to_h5 in (False, True):
+                    t0 = time.perf_counter()
+                    run(path, dst_folder, to_h5)
+                    elapsed = time.perf_counter() - t0
+                    results.append({
+                        'file': name,
+                        'reader': reader_name,
+                        'output': '.h5' if to_h5 else '.tif',
+                        'MB_per_s': nbytes/elapsed/1e6
+                    })
+    if _run_bioformats.isJavaVMrunning:
+        import javabridge
+        javabridge.kill_vm()
+    return pd.DataFrame(results)
+
+if __name__ == '__main__':
+    print(run_benchmark().to_string(index=False))
@@ -0,0 +1,183 @@
+"""
+Throughput and accuracy of the KDTree tracker compared to the other bundled
+trackers on synthetic dense colonies of dividing rod-shaped cells.
+
+Run with `python benchmarks/trackers_benchmark.py`. Trackers whose
+optional packages are not installed (trackpy, btrack) are skipped.
+"""
+import os
+import time
+import importlib.util
+
+import numpy as np
+import pandas as pd
+
+import skimage.draw
+
+def simulate_colony(
+        num_frames=10, num_cells=500, shape=(1024, 1024), length=(6, 10),
+        width=4, speed=2.0, growth=0.03, division_prob=0.02, seed=0
+    ):
+    """Synthetic time-lapse of moving, growing and dividing cells.
+
+    At division the mother keeps its identity and the daughter gets a new
+    one (Cell-ACDC convention).
+
+    Returns
+    -------
+    tuple
+        (segm_video, gt_video, divisions) where `segm_video` has random IDs
+        in every frame (untracked), `gt_video` has the true identities and
+        `divisions` is a list of (frame_i, mother_gt_ID, daughter_gt_ID).
+    """
+    rng = np.random.default_rng(seed)
+    Y, X = shape
+    centers = rng.uniform((20, 20), (Y-20, X-20), size=(num_cells, 2))
+    lengths = rng.uniform(*length, size=num_cells)
+    angles = rng.uniform(0, np.pi, size=num_cells)
+    velocities = rng.normal(0, speed, size=(num_cells, 2))
+    gt_IDs = np.arange(1, num_cells+1)
+    next_gt_ID = num_cells + 1
+
+    segm_video = np.zeros((num_frames, Y, X), dtype=np.uint32)
+    gt_video = np.zeros((num_frames, Y, X), dtype=np.uint32)
+    divisions = []
+    for frame_i in range(num_frames):
+        if frame_i > 0:
+            centers += velocities + rng.normal(0, speed/4, size=centers.shape)
+            lengths *= 1 + growth
+            is_dividing = rng.random(len(gt_IDs)) < division_prob
+            idx = np.nonzero(is_dividing)[0]
+            offsets = np.column_stack(
+                (np.sin(angles[idx]), np.cos(angles[idx]))
+            ) * (lengths[idx, np.newaxis]/2)
+            daughters_IDs = np.arange(next_gt_ID, next_gt_ID+len(idx))
+            next_gt_ID += len(idx)
+            divisions.extend(
+                (frame_i, m, d) for m, d in zip(gt_IDs[idx], daughters_IDs)
+            )
+            lengths[idx] /= 2
+            centers = np.concatenate((centers, centers[idx] + offsets))
+            centers[idx] -= offsets
+            lengths = np.concatenate((lengths, lengths[idx]))
+            angles = np.concatenate((angles, angles[idx]))
+            velocities = np.concatenate((velocities, velocities[idx]))
+            gt_IDs = np.concatenate((gt_IDs, daughters_IDs))
+
+        # Random IDs in every frame simulate an untracked segmentation
+        random_IDs = rng.permutation(len(gt_IDs)) + 1
+        for center, l, angle, gt_ID, ID in zip(
+                centers, lengths, angles, gt_IDs, random_IDs
+            ):
+            rr, cc = skimage.draw.ellipse(
+                center[0], center[1], l, width, shape=shape, rotation=angle
+            )
+            segm_video[frame_i, rr, cc] = ID
+            gt_video[frame_i, rr, cc] = gt_ID
+    return segm_video, gt_video, divisions
+
+def _majority_IDs(gt_lab, tracked_lab):
+    """Tracked ID covering most of each ground truth object"""
+    gt = gt_lab.ravel().astype(np.int64)
+    tracked = tracked_lab.ravel().astype(np.int64)
+    is_fg = (gt > 0) & (tracked > 0)
+    num_tracked = tracked.max() + 1
+    keys, counts = np.unique(
+        gt[is_fg]*num_tracked + tracked[is_fg], return_counts=True
+    )
+    gt_IDs, tracked_IDs = keys // num_tracked, keys % num_tracked
+    order = np.lexsort((-counts, gt_IDs))
+    gt_IDs, tracked_IDs = gt_IDs[order], tracked_IDs[order]
+    is_first = np.ones(len(gt_IDs), dtype=bool)
+    is_first[1:] = gt_IDs[1:] != gt_IDs[:-1]
+    return pd.Series(tracked_IDs[is_first], index=gt_IDs[is_first])
+
+# Trackers that match every frame to the previous *input* frame, so that
+# their IDs at frame i are the IDs of the untracked frame i-1
+LINKS_TO_INPUT_TRACKERS = ('CellACDC',)
+
+def links_accuracy(gt_video, tracked_video, prev_video=None):
+    """Fraction of objects present in two consecutive frames whose ID in
+    `tracked_video` at frame i is their ID in `prev_video` at frame i-1
+    (higher is better). `prev_video` is `tracked_video` (default) for the
+    trackers that match every frame to the previous tracked frame and the
+    untracked video for `LINKS_TO_INPUT_TRACKERS`."""
+    if prev_video is None:
+        prev_video = tracked_video
+    num_correct = 0
+    num_links = 0
+    for frame_i in range(1, len(gt_video)):
+        prev_IDs = _majority_IDs(gt_video[frame_i-1], prev_video[frame_i-1])
+        IDs = _majority_IDs(gt_video[frame_i], tracked_video[frame_i])
+        common = prev_IDs.index.intersection(IDs.index)
+        num_correct += (prev_IDs[common] == IDs[common]).sum()
+        num_links += len(common)
+    return num_correct/num_links
+
+def get_trackers(shape):
+    """Trackers to compare as {name: (tracker, track kwargs, max cells)}.
+    Trackers with a dense cost matrix are skipped above `max cells`.
+    `shape` is the (Y, X) shape of the frames."""
+    trackers = {}
+    from cellacdc.trackers.KDTree import KDTree_tracker
+    from cellacdc.trackers.CellACDC import CellACDC_tracker
+    from cellacdc.trackers.YeaZ import YeaZ_tracker
+    trackers['KDTree'] = (KDTree_tracker.tracker(), {}, None)
+    trackers['CellACDC'] = (CellACDC_tracker.tracker(), {}, 2000)
+    trackers['YeaZ'] = (YeaZ_tracker.tracker(), {}, 2000)
+    if importlib.util.find_spec('trackpy') is not None:
+        from cellacdc.trackers.trackpy import trackpy_tracker
+        trackers['trackpy'] = (trackpy_tracker.tracker(), {}, None)
+    if importlib.util.find_spec('btrack') is not None:
+        from cellacdc.trackers.BayesianTracker import BayesianTracker_tracker
+        Y, X = shape
+        # Default parameters of `apps.BayesianTrackerParamsWin`
+        model_path = os.path.join(
+            os.path.dirname(BayesianTracker_tracker.__file__), 'model', 
+            'cell_config.json'
+        )
+        btrack_params = {
+            'model_path': model_path,
+            'verbose': False,
+            'volume': ((0, X), (0, Y), (-1e5, 1e5)),
+            'max_search_radius': 50,
+            'update_method': 'EXACT',
+            'step_size': 100,
+            'optimize': True,
+            'features': []
+        }
+        trackers['btrack'] = (
+            BayesianTracker_tracker.tracker(**btrack_params), {}, 2000
+        )
+    return trackers
+
+def run_benchmark(num_cells_list=(500, 2000, 10000), num_frames=10):
+    results = []
+    for num_cells in num_cells_list:
+        side = int(np.sqrt(num_cells)*40)
+        segm_video, gt_video, _ = simulate_colony(
+            num_frames=num_frames, num_cells=num_cells, shape=(side, side)
+        )
+        num_objects = sum(len(np.unique(lab))-1 for lab in segm_video)
+        trackers = get_trackers(segm_video.shape[1:])
+        for name, (tracker, params, max_cells) in trackers.items():
+            if max_cells is not None and num_cells > max_cells:
+                continue
+            t0 = time.perf_counter()
+            tracked_video = tracker.track(segm_video, **params)
+            elapsed = time.perf_counter() - t0
+            prev_video = None
+            if name in LINKS_TO_INPUT_TRACKERS:
+                prev_video = segm_video
+            accuracy = links_accuracy(gt_video, tracked_video, prev_video)
+            results.append({
+                'tracker': name,
+                'num_cells': num_cells,
+                'frames_per_s': (num_frames-1)/elapsed,
+                'objects_per_s': num_objects/elapsed,
+                'links_accuracy': accuracy
+            })
+    return pd.DataFrame(results)
+
+if __name__ == '__main__':
+    print(run_benchmark().to_string(index=False))
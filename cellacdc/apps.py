@@ -5705,7 +5705,7 @@ class postProcessSegmParams(QGroupBox):
 
     def __init__(
             self, title, useSliders=False, parent=None, maxSize=None,
-            SizeZ=None
+            SizeZ=None, stitch3D=False
         ):
         QGroupBox.__init__(self, title, parent)
         self.useSliders = useSliders
@@ -5818,6 +5818,30 @@ class postProcessSegmParams(QGroupBox):
             self.controlWidgets.append(minObjSizeZ_SB)
         else:
             self.minObjSizeZ_SB = widgets.NoneWidget()
+        
+        if SizeZ is not None and stitch3D:
+            row += 1
+            label = QLabel("Stitch z-slices (min. IoU) ")
+            layout.addWidget(label, row, 0, alignment=Qt.AlignRight)
+            stitchIoU_DSB = widgets.PostProcessSegmWidget(
+                0, 1.0, 0.0, useSliders, isFloat=True, normalize=True,
+                label=label
+            )
+            stitchIoU_DSB.setValue(0.0)
+            stitchIoU_DSB.setSingleStep(0.1)
+            stitchIoU_DSB.setToolTip(
+                'Objects segmented in adjacent z-slices are assigned the same '
+                'ID if their intersection over union (IoU) is greater or '
+                'equal than this value. Use this with models that segment '
+                'each z-slice independently.\n'
+                'Stitching is applied before the other filters. '
+                'Set to 0 to disable it.'
+            )
+            layout.addWidget(stitchIoU_DSB, row, 1)
+            self.stitchIoU_DSB = stitchIoU_DSB
+            self.controlWidgets.append(stitchIoU_DSB)
+        else:
+            self.stitchIoU_DSB = widgets.NoneWidget()
 
         layout.setColumnStretch(1, 2)
         layout.setRowStretch(row+1, 1)
@@ -5833,6 +5857,7 @@ class postProcessSegmParams(QGroupBox):
         self.minSize_SB.setValue(10)
         self.maxElongation_DSB.setValue(3)
         self.minObjSizeZ_SB.setValue(3)
+        self.stitchIoU_DSB.setValue(0.0)
     
     def restoreFromKwargs(self, kwargs):
         for name, value in kwargs.items():
@@ -5844,13 +5869,16 @@ class postProcessSegmParams(QGroupBox):
                 self.maxElongation_DSB.setValue(value)
             elif name == 'min_obj_no_zslices':
                 self.minObjSizeZ_SB.setValue(value)
+            elif name == 'stitch_3D_min_IoU':
+                self.stitchIoU_DSB.setValue(value)
     
     def kwargs(self):
         kwargs = {
             'min_solidity': self.minSolidity_DSB.value(),
             'min_area': self.minSize_SB.value(),
             'max_elongation': self.maxElongation_DSB.value(),
-            'min_obj_no_zslices': self.minObjSizeZ_SB.value()
+            'min_obj_no_zslices': self.minObjSizeZ_SB.value(),
+            'stitch_3D_min_IoU': self.stitchIoU_DSB.value()
         }
         return kwargs
     
@@ -5950,6 +5978,7 @@ class postProcessSegmDialog(QBaseDialog):
         self.mainWin.storeUndoRedoStates(False)
         self.posData = self.mainWin.data[self.mainWin.pos_i]
         self.origLab = self.posData.lab.copy()
+        self.origLabPropsTable = None
 
     def valueChanged(self, value):
         lab, delIDs = self.apply()
@@ -5961,11 +5990,20 @@ class postProcessSegmDialog(QBaseDialog):
 
         self.mainWin.warnEditingWithCca_df('post-processing segmentation mask')
 
+        propsTable = None
         if origLab is None:
             origLab = self.origLab.copy()
+            # Properties of the original lab do not change when moving the 
+            # sliders --> compute them only once
+            if self.origLabPropsTable is None:
+                self.origLabPropsTable = core.get_artefacts_props_table(
+                    self.origLab
+                )
+            propsTable = self.origLabPropsTable
 
         lab, delIDs = core.remove_artefacts(
-            origLab, return_delIDs=True, **self.artefactsGroupBox.kwargs()
+            origLab, return_delIDs=True, props_table=propsTable,
+            **self.artefactsGroupBox.kwargs()
         )
 
         return lab, delIDs
@@ -9077,6 +9115,10 @@ class QDialogTrackerParams(QDialog):
                 row += 1
             var_name = ArgSpec.name.replace('_', ' ').title()
             label = QLabel(f'{var_name}:  ')
+            # Description from the parameters manifest
+            desc = getattr(ArgSpec, 'desc', '')
+            if desc:
+                label.setToolTip(desc)
             groupBoxLayout.addWidget(label, row, 0, alignment=Qt.AlignRight)
             if ArgSpec.type == bool:
                 booleanGroup = QButtonGroup()
@@ -9340,7 +9382,8 @@ class QDialogModelParams(QDialog):
 
         # Add minimum size spinbox whihc is valid for all models
         artefactsGroupBox = postProcessSegmParams(
-            'Post-processing segmentation parameters', SizeZ=SizeZ
+            'Post-processing segmentation parameters', SizeZ=SizeZ,
+            stitch3D=True
         )
         artefactsGroupBox.setCheckable(True)
         artefactsGroupBox.setChecked(True)
@@ -9417,6 +9460,10 @@ class QDialogModelParams(QDialog):
             row = row + start_row
             var_name = ArgSpec.name.replace('_', ' ').title()
             label = QLabel(f'{var_name}:  ')
+            # Description from the parameters manifest
+            desc = getattr(ArgSpec, 'desc', '')
+            if desc:
+                label.setToolTip(desc)
             groupBoxLayout.addWidget(label, row, 0, alignment=Qt.AlignRight)
             if ArgSpec.type == bool:
                 booleanGroup = QButtonGroup()
@@ -12,7 +12,11 @@
 from __future__ import absolute_import, unicode_literals
 
 import xml.etree.ElementTree
-from xml.etree import cElementTree as ElementTree
+try:
+    from xml.etree import cElementTree as ElementTree
+except ImportError:
+    # cElementTree was removed in Python 3.9
+    from xml.etree import ElementTree
 
 import sys
 if sys.version_info.major == 3:
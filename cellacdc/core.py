@@ -1,4 +1,7 @@
+import os
 import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import numpy as np
 import cv2
 import skimage.measure
@@ -9,6 +12,9 @@ import skimage.registration
 import skimage.color
 import skimage.filters
 import scipy.ndimage.morphology
+import scipy.spatial
+import scipy.sparse
+import scipy.sparse.csgraph
 import matplotlib
 import matplotlib.pyplot as plt
 from matplotlib.lines import Line2D
@@ -34,25 +40,110 @@ def np_replace_values(arr, old_values, new_values):
     arr = replacer[arr - n_min]
     return arr
 
-def compute_twoframes_velocity(prev_lab, lab, spacing=None):
-    prev_rp = skimage.measure.regionprops(prev_lab)
-    rp = skimage.measure.regionprops(lab)
-    prev_IDs = [obj.label for obj in prev_rp]
-    velocities_pxl = [0]*len(rp)
-    velocities_um = [0]*len(rp)
-    for i, obj in enumerate(rp):
-        if obj.label not in prev_IDs:
-            continue
+def get_objs_centroids_table(lab, frame_i=0, rp=None):
+    """Centroid of each object in `lab` computed with `np.bincount`. 
+    
+    If `rp` (regionprops of `lab`) is not None, the centroids are taken 
+    from `rp` instead.
 
-        prev_obj = prev_rp[prev_IDs.index(obj.label)]
-        diff = np.subtract(obj.centroid, prev_obj.centroid)
-        v_pixel = np.linalg.norm(diff)
-        velocities_pxl[i] = v_pixel
-        if spacing is not None:
-            v_um = np.linalg.norm(diff*spacing)
-            velocities_um[i] = v_um
-    return velocities_pxl, velocities_um
+    Returns
+    -------
+    pandas.DataFrame
+        Table with columns 'frame_i', 'Cell_ID' and one column per axis 
+        ('centroid-0', 'centroid-1'[, 'centroid-2']), sorted by 'Cell_ID'.
+    """
+    lab = np.asarray(lab)
+    if rp is not None:
+        rp = sorted(rp, key=lambda obj: obj.label)
+        df = pd.DataFrame({
+            'frame_i': np.full(len(rp), frame_i, dtype=int), 
+            'Cell_ID': np.array([obj.label for obj in rp], dtype=int)
+        })
+        centroids = np.array(
+            [obj.centroid for obj in rp], dtype=float
+        ).reshape(len(rp), lab.ndim)
+        for axis in range(lab.ndim):
+            df[f'centroid-{axis}'] = centroids[:, axis]
+        return df
+    
+    labels_flat = lab.ravel()
+    areas = np.bincount(labels_flat)
+    IDs = np.nonzero(areas)[0]
+    IDs = IDs[IDs > 0]
+    df = pd.DataFrame({
+        'frame_i': np.full(len(IDs), frame_i, dtype=int), 
+        'Cell_ID': IDs
+    })
+    if len(IDs) == 0:
+        for axis in range(lab.ndim):
+            df[f'centroid-{axis}'] = np.zeros(0)
+        return df
+    
+    coords = np.indices(lab.shape, sparse=True)
+    for axis, axis_coords in enumerate(coords):
+        axis_coords = np.broadcast_to(axis_coords, lab.shape).ravel()
+        sums = np.bincount(labels_flat, weights=axis_coords)
+        df[f'centroid-{axis}'] = sums[IDs]/areas[IDs]
+    return df
+
+def compute_velocities(centroids_df, spacing=None):
+    """Velocity of every object for a whole video from a centroids table.
+
+    The centroid of each object at frame i is matched to its centroid 
+    at frame i-1 with a single merge on ('Cell_ID', 'frame_i'). Objects 
+    not present in the previous frame have 0 velocity.
+
+    Parameters
+    ----------
+    centroids_df : pandas.DataFrame
+        Table with columns 'frame_i', 'Cell_ID' and 'centroid-<axis>' 
+        (see `get_objs_centroids_table`).
+    spacing : array-like or None
+        Physical size of each axis. If None 'velocity_um' is 0.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Table with index ('frame_i', 'Cell_ID') and columns 
+        'velocity_pixel' and 'velocity_um'.
+    """
+    centroid_cols = [
+        col for col in centroids_df.columns if col.startswith('centroid-')
+    ]
+    prev_df = centroids_df[['frame_i', 'Cell_ID', *centroid_cols]].copy()
+    prev_df['frame_i'] += 1
+    merged = centroids_df.merge(
+        prev_df, on=['frame_i', 'Cell_ID'], how='left', 
+        suffixes=('', '_prev')
+    )
+    prev_cols = [f'{col}_prev' for col in centroid_cols]
+    diff = (
+        merged[centroid_cols].to_numpy() - merged[prev_cols].to_numpy()
+    )
+    diff = np.nan_to_num(diff)
+    velocities_df = pd.DataFrame({
+        'frame_i': merged['frame_i'].to_numpy(),
+        'Cell_ID': merged['Cell_ID'].to_numpy(),
+        'velocity_pixel': np.linalg.norm(diff, axis=1),
+        'velocity_um': 0.0
+    })
+    if spacing is not None:
+        velocities_df['velocity_um'] = np.linalg.norm(
+            diff*np.asarray(spacing), axis=1
+        )
+    return velocities_df.set_index(['frame_i', 'Cell_ID'])
 
+def compute_twoframes_velocity(prev_lab, lab, spacing=None):
+    centroids_df = pd.concat([
+        get_objs_centroids_table(prev_lab, frame_i=0),
+        get_objs_centroids_table(lab, frame_i=1)
+    ], ignore_index=True)
+    velocities_df = compute_velocities(centroids_df, spacing=spacing).loc[1]
+    velocities_pxl = velocities_df['velocity_pixel'].to_list()
+    velocities_um = [0]*len(velocities_df)
+    if spacing is not None:
+        velocities_um = velocities_df['velocity_um'].to_list()
+    return velocities_pxl, velocities_um
 
 def lab_replace_values(lab, rp, oldIDs, newIDs, in_place=True):
     if not in_place:
@@ -70,48 +161,68 @@ def lab_replace_values(lab, rp, oldIDs, newIDs, in_place=True):
         lab[obj.slice][obj.image] = newIDs[idx]
     return lab
 
-def remove_artefacts(labels, return_delIDs=False, **kwargs):
+def remove_artefacts(
+        labels, return_delIDs=False, props_table=None, **kwargs
+    ):
+    """Remove objects with area < min_area, solidity < min_solidity, 
+    elongation > max_elongation or, for 3D `labels`, objects present in 
+    less than min_obj_no_zslices z-slices.
+
+    Properties of 3D `labels` are computed for each z-slice. Pass a 
+    `props_table` computed on `labels` with `get_artefacts_props_table` 
+    to only apply new thresholds (e.g., live preview).
+
+    Objects are removed in place with a single lookup table pass.
+    """
     min_solidity = kwargs.get('min_solidity')
     min_area = kwargs.get('min_area')
     max_elongation = kwargs.get('max_elongation')
     min_obj_no_zslices = kwargs.get('min_obj_no_zslices')
+
+    isPropMissing = props_table is not None and (
+        (min_solidity is not None and 'solidity' not in props_table.columns)
+        or (max_elongation is not None 
+            and 'elongation' not in props_table.columns)
+    )
+    if props_table is None or isPropMissing:
+        props_table = get_artefacts_props_table(
+            labels, 
+            solidity=min_solidity is not None,
+            elongation=max_elongation is not None
+        )
+
+    isArtefact = np.zeros(len(props_table), dtype=bool)
+    if min_area is not None:
+        isArtefact |= props_table['area'].values < min_area
+    if min_solidity is not None:
+        isArtefact |= props_table['solidity'].values < min_solidity
+    if max_elongation is not None:
+        isArtefact |= props_table['elongation'].values > max_elongation
+    
     if labels.ndim == 3:
         delIDs = set()
         if min_obj_no_zslices is not None:
-            for obj in skimage.measure.regionprops(labels):
-                obj_no_zslices = np.sum(
-                    np.count_nonzero(obj.image, axis=(1, 2)).astype(bool)
-                )
-                if obj_no_zslices < min_obj_no_zslices:
-                    labels[obj.slice][obj.image] = 0
-                    delIDs.add(obj.label)
-        
-        for z, lab in enumerate(labels):
-            _result = remove_artefacts_lab2D(
-                lab, min_solidity, min_area, max_elongation,
-                return_delIDs=return_delIDs
+            isFewSlices = (
+                props_table['num_z_slices'].values < min_obj_no_zslices
             )
-            if return_delIDs:
-                lab, _delIDs = _result
-                delIDs.update(_delIDs)
-            else:
-                lab = _result
-            labels[z] = lab
-        if return_delIDs:
-            result = labels, delIDs
-        else:
-            result = labels
+            objsIDs = props_table.index.get_level_values('label')
+            fewSlicesIDs = np.unique(objsIDs[isFewSlices])
+            _remove_IDs(labels, fewSlicesIDs)
+            delIDs.update(fewSlicesIDs.tolist())
+        
+        artefacts_df = props_table[isArtefact]
+        for z, df_z in artefacts_df.groupby(level='z_slice'):
+            IDs = df_z.index.get_level_values('label').values
+            _remove_IDs(labels[z], IDs)
+            delIDs.update(IDs.tolist())
     else:
-        result = remove_artefacts_lab2D(
-            labels, min_solidity, min_area, max_elongation,
-            return_delIDs=return_delIDs
-        )
+        delIDs = props_table.index.values[isArtefact]
+        _remove_IDs(labels, delIDs)
+        delIDs = delIDs.tolist()
 
     if return_delIDs:
-        labels, delIDs = result
         return labels, delIDs
     else:
-        labels = result
         return labels
 
 def remove_artefacts_lab2D(
@@ -122,37 +233,157 @@ def remove_artefacts_lab2D(
     function to remove cells with area<min_area or solidity<min_solidity
     or elongation>max_elongation
     """
-    rp = skimage.measure.regionprops(lab.astype(int))
-    if return_delIDs:
-        delIDs = []
-    for obj in rp:
-        if min_area is not None:
-            if obj.area < min_area:
-                lab[obj.slice][obj.image] = 0
-                if return_delIDs:
-                    delIDs.append(obj.label)
-                continue
-
-        if min_solidity is not None:
-            if obj.solidity < min_solidity:
-                lab[obj.slice][obj.image] = 0
-                if return_delIDs:
-                    delIDs.append(obj.label)
-                continue
-
-        if max_elongation is not None:
-            # NOTE: single pixel horizontal or vertical lines minor_axis_length=0
-            minor_axis_length = max(1, obj.minor_axis_length)
-            elongation = obj.major_axis_length/minor_axis_length
-            if elongation > max_elongation:
-                lab[obj.slice][obj.image] = 0
-                if return_delIDs:
-                    delIDs.append(obj.label)
+    return remove_artefacts(
+        lab, return_delIDs=return_delIDs, min_solidity=min_solidity, 
+        min_area=min_area, max_elongation=max_elongation
+    )
 
-    if return_delIDs:
-        return lab, delIDs
+def remove_artefacts_frames(labels_frames, num_workers=None, **kwargs):
+    """Apply `remove_artefacts` in place to each frame of a timelapse 
+    concurrently (one frame per thread).
+    """
+    if num_workers is None:
+        num_workers = min(8, os.cpu_count() or 1)
+    
+    def _remove_artefacts(frame_i):
+        remove_artefacts(labels_frames[frame_i], **kwargs)
+    
+    if num_workers > 1 and len(labels_frames) > 1:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            list(executor.map(_remove_artefacts, range(len(labels_frames))))
     else:
+        for frame_i in range(len(labels_frames)):
+            _remove_artefacts(frame_i)
+    return labels_frames
+
+def _get_artefacts_props_table_lab2D(lab, solidity=True, elongation=True):
+    lab = lab.astype(int, copy=False)
+    areas = np.bincount(lab.ravel())
+    IDs = np.nonzero(areas)[0]
+    IDs = IDs[IDs > 0]
+    df = pd.DataFrame({'area': areas[IDs]}, index=pd.Index(IDs, name='label'))
+    properties = ['label']
+    if solidity:
+        properties.append('solidity')
+    if elongation:
+        properties.extend(['major_axis_length', 'minor_axis_length'])
+    if len(properties) == 1 or len(IDs) == 0:
+        return df
+    
+    rp_table = skimage.measure.regionprops_table(lab, properties=properties)
+    rp_df = pd.DataFrame(rp_table).set_index('label')
+    if solidity:
+        df['solidity'] = rp_df['solidity']
+    if elongation:
+        # NOTE: single pixel horizontal or vertical lines minor_axis_length=0
+        minor_axis_length = rp_df['minor_axis_length'].clip(lower=1)
+        df['elongation'] = rp_df['major_axis_length']/minor_axis_length
+    return df
+
+def get_artefacts_props_table(labels, solidity=True, elongation=True):
+    """Table of the properties used by `remove_artefacts`.
+
+    For 3D `labels` the properties are computed for each z-slice (index 
+    is ('z_slice', 'label')) and the column 'num_z_slices' is the number 
+    of z-slices where each object is present.
+    """
+    if labels.ndim != 3:
+        return _get_artefacts_props_table_lab2D(
+            labels, solidity=solidity, elongation=elongation
+        )
+    
+    dfs = []
+    keys = []
+    for z, lab in enumerate(labels):
+        dfs.append(_get_artefacts_props_table_lab2D(
+            lab, solidity=solidity, elongation=elongation
+        ))
+        keys.append(z)
+    df = pd.concat(dfs, keys=keys, names=['z_slice'])
+    objsIDs = df.index.get_level_values('label')
+    df['num_z_slices'] = objsIDs.map(objsIDs.value_counts())
+    return df
+
+def _remove_IDs(lab, IDs):
+    """Set the `IDs` objects in `lab` to 0 in place. IDs that are not in 
+    `lab` are ignored."""
+    if len(IDs) == 0:
         return lab
+    maxID = lab.max()
+    if maxID > 2**24 or lab.dtype == bool:
+        lab[np.isin(lab, IDs)] = 0
+        return lab
+    IDs = np.asarray(IDs, dtype=int)
+    lut = np.arange(maxID+1, dtype=lab.dtype)
+    lut[IDs[IDs <= maxID]] = 0
+    lab[...] = lut[lab]
+    return lab
+
+def _get_IDs(lab):
+    """Sorted IDs of the objects in `lab` (without background)"""
+    IDs = np.nonzero(np.bincount(lab.ravel()))[0]
+    return IDs[IDs > 0]
+
+def _map_frames(func, numFrames, num_workers=None):
+    """Yield (frame_i, func(frame_i)) computing the frames concurrently"""
+    if num_workers is None:
+        num_workers = min(8, os.cpu_count() or 1)
+    if num_workers == 1 or numFrames < 2:
+        for frame_i in range(numFrames):
+            yield frame_i, func(frame_i)
+        return
+    
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        futures = {
+            executor.submit(func, frame_i): frame_i 
+            for frame_i in range(numFrames)
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+def _get_sub_objs_parent_IDs(lab, lab_sub, IoAthresh):
+    """Assign each sub-cellular object in `lab_sub` to the cell in `lab` 
+    with the highest intersection over the sub-object area (IoA), 
+    if IoA >= `IoAthresh`.
+
+    The (sub-object, cell) intersections are counted with a single 
+    joint histogram of the overlapping pixels.
+
+    Returns
+    -------
+    tuple of 1D arrays
+        (sub_ids, parent_ids) of the assigned sub-cellular objects.
+    """
+    sub_flat = lab_sub.ravel()
+    cells_flat = lab.ravel()
+    is_sub_obj = sub_flat > 0
+    sub_vals = sub_flat[is_sub_obj].astype(np.int64)
+    cells_vals = cells_flat[is_sub_obj].astype(np.int64)
+    if len(sub_vals) == 0:
+        return np.zeros(0, int), np.zeros(0, int)
+
+    sub_areas = np.bincount(sub_vals)
+    is_inside = cells_vals > 0
+    num_cells_IDs = max(cells_flat.max(), 0) + 1
+    pairs = sub_vals[is_inside]*num_cells_IDs + cells_vals[is_inside]
+    pairs, I_counts = np.unique(pairs, return_counts=True)
+    pairs_sub_ids = pairs // num_cells_IDs
+    pairs_cells_ids = pairs % num_cells_IDs
+    IoA = I_counts/sub_areas[pairs_sub_ids]
+
+    is_valid = IoA >= IoAthresh
+    pairs_sub_ids = pairs_sub_ids[is_valid]
+    pairs_cells_ids = pairs_cells_ids[is_valid]
+    IoA = IoA[is_valid]
+
+    # Keep the cell with max IoA (last after sorting by sub-obj and IoA)
+    order = np.lexsort((IoA, pairs_sub_ids))
+    pairs_sub_ids = pairs_sub_ids[order]
+    pairs_cells_ids = pairs_cells_ids[order]
+    if len(pairs_sub_ids) == 0:
+        return pairs_sub_ids, pairs_cells_ids
+    is_last = np.append(pairs_sub_ids[1:] != pairs_sub_ids[:-1], True)
+    return pairs_sub_ids[is_last], pairs_cells_ids[is_last]
 
 def track_sub_cell_objects_acdc_df(
         tracked_subobj_segm_data, subobj_acdc_df, all_old_sub_ids,
@@ -170,10 +401,10 @@ def track_sub_cell_objects_acdc_df(
     keys_cells = []
     keys_sub = []
     for frame_i, lab_sub in enumerate(tracked_subobj_segm_data):
-        rp_sub = skimage.measure.regionprops(lab_sub)
-        sub_ids = [sub_obj.label for sub_obj in rp_sub]
+        sub_ids = _get_IDs(lab_sub)
         old_sub_ids = all_old_sub_ids[frame_i]
         if subobj_acdc_df is None:
+            rp_sub = skimage.measure.regionprops(lab_sub)
             sub_acdc_df_frame_i = myutils.getBaseAcdcDf(rp_sub)
         else:
             sub_acdc_df_frame_i = (
@@ -188,21 +419,25 @@ def track_sub_cell_objects_acdc_df(
         keys_sub.append(frame_i)
         
         if tracked_cells_segm_data is not None:
-            num_objects_per_cells = all_num_objects_per_cells[frame_i]
+            num_objects_per_cells = pd.Series(
+                all_num_objects_per_cells[frame_i], dtype=int
+            )
             lab = tracked_cells_segm_data[frame_i]
-            rp = skimage.measure.regionprops(lab)
             # Untacked sub-obj (if kept) are not present in acdc_df of the cells
-            # --> check with `IDs_with_sub_obj = ... if id in lab`
-            IDs_with_sub_obj = [id for id in sub_ids if id in lab]
+            # --> keep only sub-obj IDs that are also in lab
+            IDs_with_sub_obj = np.intersect1d(sub_ids, _get_IDs(lab))
             if cells_acdc_df is None:
+                rp = skimage.measure.regionprops(lab)
                 acdc_df_frame_i = myutils.getBaseAcdcDf(rp)
             else:
                 acdc_df_frame_i = cells_acdc_df.loc[frame_i].copy()
 
-            acdc_df_frame_i['num_sub_cell_objs_per_cell'] = 0
-            acdc_df_frame_i.loc[IDs_with_sub_obj, 'num_sub_cell_objs_per_cell'] = ([
-                num_objects_per_cells[id] for id in IDs_with_sub_obj
-            ])
+            num_sub_objs = num_objects_per_cells.reindex(
+                IDs_with_sub_obj, fill_value=0
+            )
+            acdc_df_frame_i['num_sub_cell_objs_per_cell'] = (
+                num_sub_objs.reindex(acdc_df_frame_i.index, fill_value=0)
+            )
             acdc_df_list.append(acdc_df_frame_i)
             keys_cells.append(frame_i)
 
@@ -232,6 +467,9 @@ def track_sub_cell_objects(
     --> get max IoA in case it is touching more than one cell 
     --> assign that cell if IoA >= IoA thresh
 
+    Intersections are computed from a joint (sub-object, cell) histogram 
+    of each frame and frames are processed concurrently.
+
     Args:
         cells_segm_data (ndarray): 2D, 3D or 4D array of `int` type cotaining 
             the cells segmentation masks.
@@ -272,77 +510,80 @@ def track_sub_cell_objects(
     tracked_cells_segm_data = None
     tracked_subobj_segm_data = np.zeros_like(subobj_segm_data)        
 
-    segm_data_zip = zip(cells_segm_data, subobj_segm_data)
-    old_tracked_sub_obj_IDs = set()
-    cells_IDs_with_sub_obj = []
-    all_num_objects_per_cells = []
-    all_cells_IDs_with_sub_obj = []
+    numFrames = min(len(cells_segm_data), len(subobj_segm_data))
     all_old_sub_ids = [{} for _ in range(len(cells_segm_data))]
-    for frame_i, (lab, lab_sub) in enumerate(segm_data_zip):
-        rp = skimage.measure.regionprops(lab)
-        num_objects_per_cells = {obj.label:0 for obj in rp}
-        rp_sub = skimage.measure.regionprops(lab_sub)
-        tracked_lab_sub = tracked_subobj_segm_data[frame_i]
-        cells_IDs_with_sub_obj = []
-        for sub_obj in rp_sub:
-            intersect_mask = lab[sub_obj.slice][sub_obj.image]
-            intersect_IDs, I_counts = np.unique(
-                intersect_mask, return_counts=True
-            )
-            for intersect_ID, I in zip(intersect_IDs, I_counts):
-                if intersect_ID == 0:
-                    continue
-                
-                IoA = I/sub_obj.area
-                if IoA < IoAthresh:
-                    # Do not add untracked sub-obj
-                    continue
-                
-                all_old_sub_ids[frame_i][sub_obj.label] = intersect_ID
-                tracked_lab_sub[sub_obj.slice][sub_obj.image] = intersect_ID
-                num_objects_per_cells[intersect_ID] += 1
-                old_tracked_sub_obj_IDs.add(sub_obj.label)
-                cells_IDs_with_sub_obj.append(intersect_ID)
-        
-        all_num_objects_per_cells.append(num_objects_per_cells)
-        all_cells_IDs_with_sub_obj.append(cells_IDs_with_sub_obj)
-        
+    all_num_objects_per_cells = [None]*numFrames
+    all_cells_IDs_with_sub_obj = [None]*numFrames
+    old_tracked_sub_obj_IDs = set()
+
+    def _track_frame(frame_i):
+        lab = cells_segm_data[frame_i]
+        lab_sub = subobj_segm_data[frame_i]
+        sub_ids, parent_ids = _get_sub_objs_parent_IDs(lab, lab_sub, IoAthresh)
+        lut = np.zeros(max(lab_sub.max(), 0)+1, dtype=tracked_subobj_segm_data.dtype)
+        lut[sub_ids] = parent_ids
+        tracked_subobj_segm_data[frame_i] = lut[lab_sub]
+        return sub_ids, parent_ids, _get_IDs(lab)
+
+    for frame_i, result in _map_frames(_track_frame, numFrames):
+        sub_ids, parent_ids, cells_IDs = result
+        num_objects_per_cells = dict.fromkeys(cells_IDs.tolist(), 0)
+        cells_IDs_with_sub_obj, counts = np.unique(
+            parent_ids, return_counts=True
+        )
+        num_objects_per_cells.update(
+            zip(cells_IDs_with_sub_obj.tolist(), counts.tolist())
+        )
+        all_num_objects_per_cells[frame_i] = num_objects_per_cells
+        all_cells_IDs_with_sub_obj[frame_i] = cells_IDs_with_sub_obj
+        all_old_sub_ids[frame_i].update(
+            zip(sub_ids.tolist(), parent_ids.tolist())
+        )
+        old_tracked_sub_obj_IDs.update(sub_ids.tolist())
         if sigProgress is not None:
             sigProgress.emit(1)
     
     if how == 'delete_both' or how == 'delete_cells':
         # Delete cells that do not have a sub-cellular object
         tracked_cells_segm_data = cells_segm_data.copy()
-        for frame_i, lab in enumerate(tracked_cells_segm_data):
-            rp = skimage.measure.regionprops(lab)
-            tracked_lab = tracked_cells_segm_data[frame_i]
-            cells_IDs_with_sub_obj = all_cells_IDs_with_sub_obj[frame_i]
-            for obj in rp:
-                if obj.label in cells_IDs_with_sub_obj:
-                    # Cell has sub-object do not delete
-                    continue
-                    
-                tracked_lab[obj.slice][obj.image] = 0
+        for frame_i in range(numFrames):
+            lab = tracked_cells_segm_data[frame_i]
+            keep_IDs = all_cells_IDs_with_sub_obj[frame_i]
+            lut = np.zeros(max(lab.max(), 0)+1, dtype=lab.dtype)
+            lut[keep_IDs] = keep_IDs
+            tracked_cells_segm_data[frame_i] = lut[lab]
     
     if how == 'only_track' or how == 'delete_cells':
         # Assign unique IDs to untracked sub-cellular objects and add them 
         # to all_old_sub_ids
         maxSubObjID = tracked_subobj_segm_data.max() + 1
-        for sub_obj_ID in np.unique(subobj_segm_data):
-            if sub_obj_ID == 0:
-                continue
-
-            if sub_obj_ID in old_tracked_sub_obj_IDs:
-                # sub_obj_ID has already ben tracked
+        frames_sub_ids = [_get_IDs(lab_sub) for lab_sub in subobj_segm_data]
+        all_sub_ids = np.unique(np.concatenate(frames_sub_ids))
+        untracked_ids = np.setdiff1d(
+            all_sub_ids, np.array(list(old_tracked_sub_obj_IDs), dtype=int)
+        )
+        new_ids = np.arange(
+            maxSubObjID, maxSubObjID+len(untracked_ids), 
+            dtype=tracked_subobj_segm_data.dtype
+        )
+        lut = np.zeros(
+            max(subobj_segm_data.max(), 0)+1, 
+            dtype=tracked_subobj_segm_data.dtype
+        )
+        lut[untracked_ids] = new_ids
+        for frame_i, lab_sub in enumerate(subobj_segm_data):
+            frame_untracked_ids = np.intersect1d(
+                frames_sub_ids[frame_i], untracked_ids
+            )
+            if len(frame_untracked_ids) == 0:
                 continue
-            
-            tracked_subobj_segm_data[subobj_segm_data == sub_obj_ID] = maxSubObjID
-            
-            for frame_i, lab_sub in enumerate(subobj_segm_data):
-                if sub_obj_ID not in lab_sub:
-                    continue
-                all_old_sub_ids[frame_i][sub_obj_ID] = maxSubObjID
-            maxSubObjID += 1
+            relabelled_lab_sub = lut[lab_sub]
+            mask = relabelled_lab_sub > 0
+            tracked_subobj_segm_data[frame_i][mask] = relabelled_lab_sub[mask]
+            all_old_sub_ids[frame_i].update(zip(
+                frame_untracked_ids.tolist(), 
+                lut[frame_untracked_ids].tolist()
+            ))
 
     if SizeT == 1:
         tracked_subobj_segm_data = tracked_subobj_segm_data[0]
@@ -370,109 +611,251 @@ def calc_resolution_limited_vol(
     zyx_resolution_pxl = zyx_resolution/np.asarray(zyx_vox_dim)
     return zyx_resolution, zyx_resolution_pxl, airy_radius_nm
 
-def align_frames_3D(data, slices=None, user_shifts=None, sigPyqt=None):
-    registered_shifts = np.zeros((len(data),2), int)
-    data_aligned = np.copy(data)
-    for frame_i, frame_V in enumerate(data):
-        if frame_i == 0:
-            # skip first frame
-            continue   
-        if user_shifts is None:
-            slice = slices[frame_i]
-            curr_frame_img = frame_V[slice]
-            prev_frame_img = data_aligned[frame_i-1, slice] 
-            shifts = skimage.registration.phase_cross_correlation(
-                prev_frame_img, curr_frame_img
-                )[0]
+def shift_image(img, shift, out=None):
+    """Shift the last two axes of `img` by the integer (y, x) `shift` and 
+    pad the uncovered sides with 0s.
+
+    Same result as `np.roll` followed by zeroing the wrapped-around sides, 
+    but without creating the rolled copy. `out` can be `img` itself to 
+    shift in place.
+    """
+    if out is None:
+        out = np.empty_like(img)
+    Y, X = img.shape[-2:]
+    dy, dx = int(shift[0]), int(shift[1])
+    dst_y = slice(min(max(dy, 0), Y), max(Y+min(dy, 0), 0))
+    dst_x = slice(min(max(dx, 0), X), max(X+min(dx, 0), 0))
+    src_y = slice(min(max(-dy, 0), Y), max(Y-max(dy, 0), 0))
+    src_x = slice(min(max(-dx, 0), X), max(X-max(dx, 0), 0))
+    # numpy copies the source first if it overlaps with the destination
+    out[..., dst_y, dst_x] = img[..., src_y, src_x]
+    out[..., :dst_y.start, :] = 0
+    out[..., dst_y.stop:, :] = 0
+    out[..., :dst_x.start] = 0
+    out[..., dst_x.stop:] = 0
+    return out
+
+def _get_registration_image(img, downsample=1, reg_roi=None):
+    if reg_roi is not None:
+        y0, y1, x0, x1 = reg_roi
+        img = img[..., y0:y1, x0:x1]
+    if downsample > 1:
+        img = img[..., ::downsample, ::downsample]
+    return img
+
+def _register_frames_pair(prev_img, curr_img, downsample=1, reg_roi=None):
+    prev_img = _get_registration_image(prev_img, downsample, reg_roi)
+    curr_img = _get_registration_image(curr_img, downsample, reg_roi)
+    shift = skimage.registration.phase_cross_correlation(
+        prev_img, curr_img
+    )[0]
+    return shift.astype(int)*downsample
+
+def register_frames(
+        data, slices=None, downsample=1, reg_roi=None, num_workers=None,
+        sigPyqt=None
+    ):
+    """Compute the shifts that align each frame of `data` to the first one.
+
+    Each frame is registered against the previous raw frame. Since pairs 
+    are independent they are registered concurrently (`scipy.fft` releases 
+    the GIL, so threads do not need to copy the frames). The absolute 
+    shifts are then the cumulative sum of the pairwise shifts.
+
+    Parameters
+    ----------
+    data : (T, [Z], Y, X) array-like
+        Frames to register.
+    slices : list of ints or None
+        z-slice of each frame used for registration if `data` is 4D.
+    downsample : int
+        Register frames downsampled by this factor (faster FFTs, shifts 
+        are multiples of `downsample`).
+    reg_roi : tuple of ints or None
+        (y0, y1, x0, x1) region used for registration.
+    num_workers : int or None
+        Number of threads. Default is the number of CPUs (max 8).
+    sigPyqt : PyQt signal or None
+        Emitted with 1 every time a pair of frames has been registered.
+
+    Returns
+    -------
+    (T, 2) array of ints
+        Absolute (y, x) shift of each frame (first frame is [0, 0]).
+    """
+    if num_workers is None:
+        num_workers = min(8, os.cpu_count() or 1)
+
+    def get_frame(frame_i):
+        frame = data[frame_i]
+        if slices is not None:
+            frame = frame[slices[frame_i]]
+        return frame
+
+    def register_pair(frame_i):
+        # Use the z-slice of the current frame also on the previous frame
+        if slices is not None:
+            prev_img = data[frame_i-1][slices[frame_i]]
         else:
-            shifts = user_shifts[frame_i]
-        
-        shifts = shifts.astype(int)
-        aligned_frame_V = np.copy(frame_V)
-        aligned_frame_V = np.roll(aligned_frame_V, tuple(shifts), axis=(1,2))
-        # Pad rolled sides with 0s
-        y, x = shifts
-        if y>0:
-            aligned_frame_V[:, :y] = 0
-        elif y<0:
-            aligned_frame_V[:, y:] = 0
-        if x>0:
-            aligned_frame_V[:, :, :x] = 0
-        elif x<0:
-            aligned_frame_V[:, :, x:] = 0
-        data_aligned[frame_i] = aligned_frame_V
-        registered_shifts[frame_i] = shifts
-        if sigPyqt is not None:
+            prev_img = data[frame_i-1]
+        return _register_frames_pair(
+            prev_img, get_frame(frame_i), downsample, reg_roi
+        )
+
+    pairwise_shifts = np.zeros((len(data), 2), int)
+    frames_idx = range(1, len(data))
+    if num_workers > 1 and len(frames_idx) > 1:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            futures = {
+                executor.submit(register_pair, frame_i): frame_i 
+                for frame_i in frames_idx
+            }
+            for future in as_completed(futures):
+                pairwise_shifts[futures[future]] = future.result()
+                if sigPyqt is not None:
+                    sigPyqt.emit(1)
+    else:
+        for frame_i in frames_idx:
+            pairwise_shifts[frame_i] = register_pair(frame_i)
+            if sigPyqt is not None:
+                sigPyqt.emit(1)
+    return np.cumsum(pairwise_shifts, axis=0)
+
+def apply_shifts(data, shifts, out=None, sigPyqt=None, pbar=False):
+    """Shift each frame of `data` by the corresponding row of `shifts`.
+
+    Frames are written one by one to `out`, which can be `data` itself 
+    (shift in place), a memory-mapped array or h5py dataset (stream to 
+    disk) or None (allocate a new array).
+    """
+    if out is None:
+        out = np.empty_like(data)
+    frames_idx = range(min(len(shifts), len(data)))
+    if pbar:
+        frames_idx = tqdm(frames_idx, ncols=100)
+    for frame_i in frames_idx:
+        shift = shifts[frame_i]
+        if out is data and not np.any(shift):
+            pass
+        elif isinstance(out, np.ndarray):
+            shift_image(data[frame_i], shift, out=out[frame_i])
+        else:
+            out[frame_i] = shift_image(np.asarray(data[frame_i]), shift)
+        if sigPyqt is not None and frame_i > 0:
             sigPyqt.emit(1)
-        # fig, ax = plt.subplots(1, 2)
-        # ax[0].imshow(z_proj_max(frame_V))
-        # ax[1].imshow(z_proj_max(aligned_frame_V))
-        # plt.show()
+    return out
+
+def align_frames_3D(
+        data, slices=None, user_shifts=None, sigPyqt=None, out=None,
+        downsample=1, reg_roi=None, num_workers=None
+    ):
+    """Align the frames of (T, Z, Y, X) `data` over time.
+
+    Shifts are computed on the z-slices `slices` (see `register_frames`) 
+    unless `user_shifts` are provided. Pass `out=data` to align in place.
+    """
+    if user_shifts is None:
+        registered_shifts = register_frames(
+            data, slices=slices, downsample=downsample, reg_roi=reg_roi,
+            num_workers=num_workers, sigPyqt=sigPyqt
+        )
+        sigPyqt_apply = None
+    else:
+        registered_shifts = np.asarray(user_shifts).astype(int)
+        registered_shifts[0] = 0
+        sigPyqt_apply = sigPyqt
+    data_aligned = apply_shifts(
+        data, registered_shifts, out=out, sigPyqt=sigPyqt_apply
+    )
     return data_aligned, registered_shifts
 
-def revert_alignment(saved_shifts, img_data, sigPyqt=None):
-    shifts = -saved_shifts
-    reverted_data = np.zeros_like(img_data)
-    for frame_i, shift in enumerate(saved_shifts):
-        if frame_i >= len(img_data):
-            break
-        img = img_data[frame_i]
-        axis = tuple(range(img.ndim))[-2:]
-        reverted_img = np.roll(img, tuple(shift), axis=axis)
-        reverted_data[frame_i] = reverted_img
-        if sigPyqt is not None:
-            sigPyqt.emit(1)
+def revert_alignment(saved_shifts, img_data, sigPyqt=None, out=None):
+    reverted_data = apply_shifts(
+        img_data, -np.asarray(saved_shifts).astype(int), out=out, 
+        sigPyqt=sigPyqt
+    )
     return reverted_data
 
 def align_frames_2D(
-        data, slices=None, register=True, user_shifts=None, pbar=False,
-        sigPyqt=None
+        data, slices=None, register=True, user_shifts=None, pbar=True,
+        sigPyqt=None, out=None, downsample=1, reg_roi=None, num_workers=None
     ):
-    registered_shifts = np.zeros((len(data),2), int)
-    data_aligned = np.copy(data)
-    for frame_i, frame_V in enumerate(tqdm(data, ncols=100)):
-        if frame_i == 0:
-            # skip first frame
-            continue 
-        
-        curr_frame_img = frame_V
-        prev_frame_img = data_aligned[frame_i-1] #previously aligned frame, slice
-        if user_shifts is None:
-            shifts = skimage.registration.phase_cross_correlation(
-                prev_frame_img, curr_frame_img
-                )[0]
-        else:
-            shifts = user_shifts[frame_i]
-        shifts = shifts.astype(int)
-        aligned_frame_V = np.copy(frame_V)
-        aligned_frame_V = np.roll(aligned_frame_V, tuple(shifts), axis=(0,1))
-        y, x = shifts
-        if y>0:
-            aligned_frame_V[:y] = 0
-        elif y<0:
-            aligned_frame_V[y:] = 0
-        if x>0:
-            aligned_frame_V[:, :x] = 0
-        elif x<0:
-            aligned_frame_V[:, x:] = 0
-        data_aligned[frame_i] = aligned_frame_V
-        registered_shifts[frame_i] = shifts
-        if sigPyqt is not None:
-            sigPyqt.emit(1)
-        # fig, ax = plt.subplots(1, 2)
-        # ax[0].imshow(z_proj_max(frame_V))
-        # ax[1].imshow(z_proj_max(aligned_frame_V))
-        # plt.show()
+    """Align the frames of (T, Y, X) `data` over time.
+
+    See `align_frames_3D` for details.
+    """
+    if user_shifts is None:
+        registered_shifts = register_frames(
+            data, downsample=downsample, reg_roi=reg_roi,
+            num_workers=num_workers, sigPyqt=sigPyqt
+        )
+        sigPyqt_apply = None
+    else:
+        registered_shifts = np.asarray(user_shifts).astype(int)
+        registered_shifts[0] = 0
+        sigPyqt_apply = sigPyqt
+    data_aligned = apply_shifts(
+        data, registered_shifts, out=out, sigPyqt=sigPyqt_apply, pbar=pbar
+    )
     return data_aligned, registered_shifts
 
-def label_3d_segm(labels):
+def union_find_roots(num_nodes, edges):
+    """Root (smallest node) of the set of each node after joining the 
+    pairs of nodes in `edges`"""
+    parents = list(range(num_nodes))
+
+    def find(node):
+        while parents[node] != node:
+            # Path halving
+            parents[node] = parents[parents[node]]
+            node = parents[node]
+        return node
+    
+    for a, b in edges:
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parents[max(root_a, root_b)] = min(root_a, root_b)
+    
+    return np.array([find(node) for node in range(num_nodes)])
+
+def _get_adjacent_slices_links(lab_lower, lab_upper, IoU_thresh):
+    """Pairs of IDs (lower, upper) of two adjacent z-slices with 
+    IoU >= `IoU_thresh` computed from their joint histogram.
+    """
+    lower_flat = lab_lower.ravel().astype(np.int64)
+    upper_flat = lab_upper.ravel().astype(np.int64)
+    lower_areas = np.bincount(lower_flat)
+    upper_areas = np.bincount(upper_flat)
+    is_overlap = (lower_flat > 0) & (upper_flat > 0)
+    if not np.any(is_overlap):
+        return np.zeros((0, 2), dtype=np.int64)
+    
+    num_upper_IDs = len(upper_areas)
+    pairs = lower_flat[is_overlap]*num_upper_IDs + upper_flat[is_overlap]
+    pairs, I_counts = np.unique(pairs, return_counts=True)
+    lower_IDs = pairs // num_upper_IDs
+    upper_IDs = pairs % num_upper_IDs
+    union = lower_areas[lower_IDs] + upper_areas[upper_IDs] - I_counts
+    IoU = I_counts/union
+    is_linked = IoU >= IoU_thresh
+    return np.column_stack((lower_IDs[is_linked], upper_IDs[is_linked]))
+
+def label_3d_segm(labels, IoU_thresh=0.5):
     """Label objects in 3D array that is the result of applying
     2D segmentation model on each z-slice.
 
+    Objects of adjacent z-slices with intersection over union (IoU) 
+    greater or equal than `IoU_thresh` are linked, the links are resolved 
+    with union-find and the resulting 3D objects are relabelled in a 
+    single lookup table pass.
+
     Parameters
     ----------
     labels : Numpy array
         Array of labels with shape (Z, Y, X).
+    IoU_thresh : float, optional
+        Minimum IoU between objects of adjacent z-slices to be considered 
+        the same object. Default is 0.5
 
     Returns
     -------
@@ -480,13 +863,61 @@ def label_3d_segm(labels):
         Labelled array with shape (Z, Y, X).
 
     """
-    rp_split_lab = skimage.measure.regionprops(labels)
-    merge_lab = skimage.measure.label(labels)
-    rp_merge_lab = skimage.measure.regionprops(merge_lab)
-    for obj in rp_split_lab:
-        pass
+    # Give a unique global ID to each (z-slice, ID) pair
+    max_IDs = np.array([max(lab.max(), 0) for lab in labels], dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(max_IDs)[:-1]))
+    global_labels = labels.astype(np.int64)
+    global_labels += offsets[:, np.newaxis, np.newaxis]
+    global_labels[labels == 0] = 0
+
+    # Union-find on the (z-slice, ID) nodes that are present
+    nodes = np.unique(global_labels)
+    edges = []
+    for z in range(len(labels)-1):
+        links = _get_adjacent_slices_links(labels[z], labels[z+1], IoU_thresh)
+        if len(links) == 0:
+            continue
+        links[:, 0] += offsets[z]
+        links[:, 1] += offsets[z+1]
+        edges.extend(np.searchsorted(nodes, links).tolist())
+    
+    roots = union_find_roots(len(nodes), edges)
 
-    return labels
+    # Sequential 3D IDs with background (first node) staying 0
+    _, new_IDs = np.unique(roots, return_inverse=True)
+    if nodes[0] != 0:
+        new_IDs = new_IDs + 1
+    
+    out_dtype = labels.dtype
+    if out_dtype == bool or new_IDs.max() > np.iinfo(out_dtype).max:
+        out_dtype = np.uint32
+    lut = new_IDs.astype(out_dtype)
+    return lut[np.searchsorted(nodes, global_labels)]
+
+def label_3d_segm_frames(labels_frames, IoU_thresh=0.5, num_workers=None):
+    """Apply `label_3d_segm` to each (Z, Y, X) frame of a timelapse 
+    concurrently.
+    """
+    stitched = [None]*len(labels_frames)
+    _map = _map_frames(
+        lambda frame_i: label_3d_segm(labels_frames[frame_i], IoU_thresh), 
+        len(labels_frames), num_workers=num_workers
+    )
+    for frame_i, lab in _map:
+        stitched[frame_i] = lab
+    return np.array(stitched)
+
+def post_process_segm(labels, stitch_3D_min_IoU=None, **kwargs):
+    """Post-process the labels (2D or (Z, Y, X)) of a single frame as set 
+    in the post-processing parameters of the segmentation dialog.
+
+    Objects of a 3D `labels` are first stitched across z-slices with 
+    `label_3d_segm` if `stitch_3D_min_IoU` > 0, then the artefacts are 
+    removed with `remove_artefacts` (`kwargs`).
+    """
+    if stitch_3D_min_IoU and labels.ndim == 3:
+        labels = label_3d_segm(labels, IoU_thresh=stitch_3D_min_IoU)
+    return remove_artefacts(labels, **kwargs)
 
 def get_objContours(obj, obj_image=None, all=False):
     if all:
@@ -510,6 +941,137 @@ def get_objContours(obj, obj_image=None, all=False):
     cont += [min_x, min_y]
     return cont
 
+def _stack_contours(contours):
+    """Stack (N, 2) contours into one points array plus the owner index 
+    of each point. Non-finite points (e.g. empty contours) are dropped.
+    """
+    lengths = np.array([len(cont) for cont in contours], dtype=int)
+    if lengths.sum() == 0:
+        return np.zeros((0, 2)), np.zeros(0, dtype=int)
+    points = np.concatenate(
+        [np.asarray(cont, dtype=float).reshape(-1, 2) for cont in contours]
+    )
+    owners = np.repeat(np.arange(len(contours)), lengths)
+    is_finite = np.isfinite(points).all(axis=1)
+    return points[is_finite], owners[is_finite]
+
+def _get_contours_min_dist_sparse(
+        moth_tree, moth_owners, bud_points, bud_owners, numMoth, numBuds, 
+        max_dist
+    ):
+    """Minimum contour-to-contour distance for every (mother, bud) pair 
+    closer than `max_dist`, plus the nearest mother of each bud.
+    
+    Returns the `(moth_idx, bud_idx, min_dist)` arrays of the non-empty 
+    entries of the (numMoth, numBuds) cost matrix.
+    """
+    bud_tree = scipy.spatial.cKDTree(bud_points)
+    pairs = bud_tree.sparse_distance_matrix(
+        moth_tree, max_dist, output_type='ndarray'
+    )
+    # Always include the nearest mother of each bud so that every bud 
+    # has at least one candidate
+    nn_dist, nn_idx = moth_tree.query(bud_points)
+    bud_idx = np.concatenate((bud_owners[pairs['i']], bud_owners))
+    moth_idx = np.concatenate((moth_owners[pairs['j']], moth_owners[nn_idx]))
+    dist = np.concatenate((pairs['v'], nn_dist))
+
+    # Reduce to minimum distance per (mother, bud) pair
+    keys = moth_idx*numBuds + bud_idx
+    sort_idx = np.lexsort((dist, keys))
+    keys = keys[sort_idx]
+    is_first = np.ones(len(keys), dtype=bool)
+    is_first[1:] = keys[1:] != keys[:-1]
+    first_idx = sort_idx[is_first]
+    return moth_idx[first_idx], bud_idx[first_idx], dist[first_idx]
+
+def assign_buds_to_mothers(moth_contours, bud_contours, max_dist=None):
+    """Assign each bud to a mother by minimizing the sum of the minimum 
+    contour-to-contour distances.
+
+    Contour points are indexed with a KD-tree and only the mothers closer 
+    than `max_dist` to a bud (plus its nearest mother) are candidates. The 
+    resulting sparse cost matrix is solved with 
+    `scipy.sparse.csgraph.min_weight_full_bipartite_matching`. If no full 
+    matching exists within the cutoff, the cutoff is doubled until it does.
+
+    Parameters
+    ----------
+    moth_contours : list of (N, 2) arrays
+        Contour points of the candidate mothers. Must not be fewer than 
+        the buds.
+    bud_contours : list of (N, 2) arrays
+        Contour points of the buds.
+    max_dist : float, optional
+        Initial distance cutoff. If None, twice the largest bud extent 
+        (minimum 10 pixels).
+
+    Returns
+    -------
+    tuple of arrays
+        `(row_idx, col_idx)` like `scipy.optimize.linear_sum_assignment`, 
+        with rows indexing `moth_contours` and columns `bud_contours`.
+    """
+    numMoth, numBuds = len(moth_contours), len(bud_contours)
+    if numBuds == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    if numMoth < numBuds:
+        raise ValueError(
+            f'Cannot assign {numBuds} buds to only {numMoth} mothers.'
+        )
+
+    moth_points, moth_owners = _stack_contours(moth_contours)
+    bud_points, bud_owners = _stack_contours(bud_contours)
+    if len(moth_points) == 0 or len(bud_points) == 0:
+        return np.arange(numBuds), np.arange(numBuds)
+
+    if max_dist is None:
+        extents = [
+            np.ptp(bud_points[bud_owners==b], axis=0).max()
+            for b in np.unique(bud_owners)
+        ]
+        max_dist = max(10, 2*max(extents))
+
+    moth_tree = scipy.spatial.cKDTree(moth_points)
+    # Buds without contour points can go to any leftover mother
+    no_points_buds = np.setdiff1d(np.arange(numBuds), bud_owners)
+    max_possible_dist = np.linalg.norm(
+        np.ptp(np.vstack((moth_points, bud_points)), axis=0)
+    )
+    while True:
+        moth_idx, bud_idx, dist = _get_contours_min_dist_sparse(
+            moth_tree, moth_owners, bud_points, bud_owners, numMoth, 
+            numBuds, max_dist
+        )
+        if len(no_points_buds) > 0:
+            num_no_points = len(no_points_buds)
+            moth_idx = np.concatenate(
+                (moth_idx, np.repeat(np.arange(numMoth), num_no_points))
+            )
+            bud_idx = np.concatenate(
+                (bud_idx, np.tile(no_points_buds, numMoth))
+            )
+            dist = np.concatenate(
+                (dist, np.full(numMoth*num_no_points, max_possible_dist))
+            )
+        # +1 because explicit zeros (touching contours) are not edges
+        cost = scipy.sparse.csr_matrix(
+            (dist+1, (moth_idx, bud_idx)), shape=(numMoth, numBuds)
+        )
+        try:
+            row_idx, col_idx = (
+                scipy.sparse.csgraph.min_weight_full_bipartite_matching(cost)
+            )
+            break
+        except ValueError:
+            if max_dist > max_possible_dist:
+                # Every pair is already a candidate
+                raise
+            max_dist *= 2
+
+    sort_idx = np.argsort(row_idx)
+    return row_idx[sort_idx], col_idx[sort_idx]
+
 def smooth_contours(lab, radius=2):
     sigma = 2*radius + 1
     smooth_lab = np.zeros_like(lab)
@@ -926,6 +1488,272 @@ def cca_df_to_acdc_df(cca_df, rp, acdc_df=None):
     acdc_df = acdc_df.join(cca_df, how='left')
     return acdc_df
 
+def _get_objs_contours(lab, IDs):
+    """Outer contour ([x, y] points) of each object in `IDs`. 3D objects 
+    are max-projected along z first. Objects with more than one external 
+    contour are represented by the longest one.
+    """
+    objs_slices = scipy.ndimage.find_objects(lab)
+    contours = []
+    for ID in IDs:
+        obj_slice = objs_slices[ID-1] if ID <= len(objs_slices) else None
+        if obj_slice is None:
+            contours.append(np.zeros((0, 2), dtype=int))
+            continue
+        obj_image = lab[obj_slice] == ID
+        if obj_image.ndim == 3:
+            obj_image = obj_image.max(axis=0)
+        obj_contours, _ = cv2.findContours(
+            obj_image.astype(np.uint8), cv2.RETR_EXTERNAL, 
+            cv2.CHAIN_APPROX_NONE
+        )
+        cont = max(obj_contours, key=len)
+        cont = np.squeeze(cont, axis=1)
+        cont = np.vstack((cont, cont[0]))
+        cont += [obj_slice[-1].start, obj_slice[-2].start]
+        contours.append(cont)
+    return contours
+
+class CcaAutoAnnotator:
+    """Headless cell cycle annotation of budding yeast time-lapses. 
+
+    Runs the same bud-to-mother assignment and automatic division 
+    annotation of the GUI (`gui.autoCca_df` and `gui.checkScellsGone`) 
+    over all the frames in a single pass. The state is kept in one 
+    structured array indexed by Cell_ID and every frame stores only a 
+    snapshot of the rows of its IDs. A single DataFrame is built at the end.
+
+    Parameters
+    ----------
+    segm_data : sequence of arrays
+        Segmentation masks, indexed by frame_i (e.g. a (T, Y, X) or 
+        (T, Z, Y, X) array, or a dict {frame_i: lab}).
+    cca_df : pd.DataFrame, optional
+        Cell cycle annotations (index 'Cell_ID') of `start_frame_i`. If None, 
+        every cell at `start_frame_i` is initialized as G1 with unknown 
+        history (see `getBaseCca_df`).
+    start_frame_i : int, optional
+        First frame. Default is 0.
+    dead_IDs : dict, optional
+        {frame_i: IDs} of dead cells, which are never assigned a bud.
+    logger : callable, optional
+        Default is print.
+    """
+    def __init__(
+            self, segm_data, cca_df=None, start_frame_i=0, dead_IDs=None, 
+            logger=print
+        ):
+        self.segm_data = segm_data
+        self.start_frame_i = start_frame_i
+        self.dead_IDs = {} if dead_IDs is None else dead_IDs
+        self.logger = logger
+        self.cca_df_colnames = list(base_cca_df.keys())
+        self._dtype = np.dtype([
+            ('cell_cycle_stage', 'U2'),
+            ('generation_num', np.int64),
+            ('relative_ID', np.int64),
+            ('relationship', 'U6'),
+            ('emerg_frame_i', np.int64),
+            ('division_frame_i', np.int64),
+            ('is_history_known', bool),
+            ('corrected_assignment', bool)
+        ])
+        self._state = np.zeros(0, dtype=self._dtype)
+        self._frames = {}
+
+        IDs = _get_IDs(segm_data[start_frame_i])
+        if cca_df is None:
+            cca_df = getBaseCca_df(IDs)
+        self._init_state(IDs, cca_df)
+    
+    def _grow_state(self, max_ID):
+        if max_ID < len(self._state):
+            return
+        state = np.zeros(max_ID+1, dtype=self._dtype)
+        state[:len(self._state)] = self._state
+        self._state = state
+    
+    def _set_base_state(self, IDs):
+        for col, value in base_cca_df.items():
+            self._state[col][IDs] = value
+    
+    def _init_state(self, IDs, cca_df):
+        max_ID = IDs.max(initial=0)
+        if len(cca_df) > 0:
+            max_ID = max(max_ID, cca_df.index.max())
+        self._grow_state(max_ID)
+        self._set_base_state(IDs)
+        annotated_IDs = cca_df.index.intersection(IDs).to_numpy()
+        for col in self.cca_df_colnames:
+            if col not in cca_df.columns:
+                continue
+            values = cca_df.loc[annotated_IDs, col].to_numpy()
+            self._state[col][annotated_IDs] = values
+        self._frames[self.start_frame_i] = (IDs, self._state[IDs])
+    
+    def _annotate_divisions(self, frame_i, IDs):
+        """Annotate division for the cells in S of the previous frame whose 
+        relative disappeared (see `gui.checkScellsGone`). The previous frame 
+        snapshot is updated too.
+        """
+        prev_IDs, prev_records = self._frames[frame_i-1]
+        relIDs = prev_records['relative_ID']
+        is_S = prev_records['cell_cycle_stage'] == 'S'
+        is_gone_mask = (
+            is_S & (relIDs > 0) & np.isin(prev_IDs, IDs) 
+            & ~np.isin(relIDs, IDs)
+        )
+        if not is_gone_mask.any():
+            return []
+        
+        staying_IDs = prev_IDs[is_gone_mask]
+        gone_IDs = relIDs[is_gone_mask]
+        self.logger(
+            f'Frame n. {frame_i+1}: automatically annotated division on '
+            f'cells {staying_IDs.tolist()} because their relatives '
+            f'{gone_IDs.tolist()} disappeared.'
+        )
+        state = self._state
+        gen_num_gone = state['generation_num'][gone_IDs]
+        gen_num_staying = state['generation_num'][staying_IDs]
+        divided_IDs = np.concatenate((gone_IDs, staying_IDs))
+        state['cell_cycle_stage'][divided_IDs] = 'G1'
+        state['generation_num'][divided_IDs] += 1
+        state['division_frame_i'][divided_IDs] = frame_i
+        is_gone_bud = gen_num_gone < gen_num_staying
+        state['relationship'][gone_IDs[is_gone_bud]] = 'mother'
+        state['relationship'][staying_IDs[~is_gone_bud]] = 'mother'
+
+        # Relatives that were not in the previous frame have no snapshot row
+        idx = np.searchsorted(prev_IDs, divided_IDs)
+        is_in_prev = idx < len(prev_IDs)
+        is_in_prev[is_in_prev] = (
+            prev_IDs[idx[is_in_prev]] == divided_IDs[is_in_prev]
+        )
+        prev_records[idx[is_in_prev]] = state[divided_IDs[is_in_prev]]
+        return staying_IDs
+    
+    def _assign_buds(self, frame_i, lab, IDs):
+        prev_IDs, prev_records = self._frames[frame_i-1]
+        new_IDs = np.setdiff1d(IDs, prev_IDs)
+        if len(new_IDs) == 0:
+            return
+        
+        self._grow_state(new_IDs.max())
+        is_G1 = prev_records['cell_cycle_stage'] == 'G1'
+        dead_IDs = list(self.dead_IDs.get(frame_i-1, []))
+        is_G1 = is_G1 & np.isin(prev_IDs, IDs) & ~np.isin(prev_IDs, dead_IDs)
+        IDsCellsG1 = prev_IDs[is_G1]
+        if len(IDsCellsG1) < len(new_IDs):
+            self.logger(
+                f'[WARNING]: Frame n. {frame_i+1}: {len(new_IDs)} new cells '
+                f'but only {len(IDsCellsG1)} cells in G1. The new cells '
+                'are annotated as cells in G1 with unknown history.'
+            )
+            self._set_base_state(new_IDs)
+            return
+        
+        contours = _get_objs_contours(lab, np.concatenate((IDsCellsG1, new_IDs)))
+        row_idx, col_idx = assign_buds_to_mothers(
+            contours[:len(IDsCellsG1)], contours[len(IDsCellsG1):]
+        )
+        mothIDs = IDsCellsG1[row_idx]
+        budIDs = new_IDs[col_idx]
+        state = self._state
+        state['cell_cycle_stage'][mothIDs] = 'S'
+        state['relative_ID'][mothIDs] = budIDs
+        
+        state['cell_cycle_stage'][budIDs] = 'S'
+        state['generation_num'][budIDs] = 0
+        state['relative_ID'][budIDs] = mothIDs
+        state['relationship'][budIDs] = 'bud'
+        state['emerg_frame_i'][budIDs] = frame_i
+        state['division_frame_i'][budIDs] = -1
+        state['is_history_known'][budIDs] = True
+        state['corrected_assignment'][budIDs] = False
+    
+    def annotate_frame(self, frame_i):
+        lab = self.segm_data[frame_i]
+        IDs = _get_IDs(lab)
+        self._grow_state(IDs.max(initial=0))
+        self._annotate_divisions(frame_i, IDs)
+        self._assign_buds(frame_i, lab, IDs)
+        self._frames[frame_i] = (IDs, self._state[IDs])
+    
+    def run(self, stop_frame_n=None, signal=None):
+        """Annotate frames from `start_frame_i+1` to `stop_frame_n` 
+        (excluded, default all frames) and return the annotations table 
+        (see `to_dataframe`).
+        """
+        if stop_frame_n is None:
+            stop_frame_n = len(self.segm_data)
+        frames_range = range(self.start_frame_i+1, stop_frame_n)
+        iterable = frames_range if signal is not None else tqdm(
+            frames_range, ncols=100
+        )
+        for frame_i in iterable:
+            self.annotate_frame(frame_i)
+            if signal is not None:
+                signal.emit(1)
+        return self.to_dataframe()
+    
+    def to_dataframe(self):
+        """Cell cycle annotations of all annotated frames as a DataFrame 
+        with ('frame_i', 'Cell_ID') index.
+        """
+        frames = sorted(self._frames.keys())
+        IDs = [self._frames[frame_i][0] for frame_i in frames]
+        records = np.concatenate([self._frames[i][1] for i in frames])
+        frames_idx = np.repeat(frames, [len(frame_IDs) for frame_IDs in IDs])
+        index = pd.MultiIndex.from_arrays(
+            (frames_idx, np.concatenate(IDs)), names=['frame_i', 'Cell_ID']
+        )
+        cca_df = pd.DataFrame(records, index=index)
+        cca_df['cell_cycle_stage'] = cca_df['cell_cycle_stage'].astype(object)
+        cca_df['relationship'] = cca_df['relationship'].astype(object)
+        return cca_df
+
+def auto_cca_acdc_df(
+        segm_data, acdc_df, start_frame_i=0, stop_frame_n=None, signal=None, 
+        logger=print
+    ):
+    """Run `CcaAutoAnnotator` on a position and write the annotations 
+    into `acdc_df` (index ('frame_i', 'Cell_ID')).
+
+    Existing annotations at `start_frame_i` are used as starting point and 
+    the annotations of the following frames are overwritten.
+    """
+    cca_df_colnames = list(base_cca_df.keys())
+    cca_df = None
+    if 'cell_cycle_stage' in acdc_df.columns:
+        frames = acdc_df.index.get_level_values(0)
+        if start_frame_i in frames:
+            start_df = acdc_df.loc[start_frame_i]
+            if start_df['cell_cycle_stage'].notna().all():
+                cca_df = start_df[cca_df_colnames]
+    
+    dead_IDs = {}
+    if 'is_cell_dead' in acdc_df.columns:
+        dead_df = acdc_df[acdc_df['is_cell_dead'] > 0]
+        for frame_i, df in dead_df.groupby(level=0):
+            dead_IDs[frame_i] = df.index.get_level_values(1)
+    
+    annotator = CcaAutoAnnotator(
+        segm_data, cca_df=cca_df, start_frame_i=start_frame_i, 
+        dead_IDs=dead_IDs, logger=logger
+    )
+    cca_df = annotator.run(stop_frame_n=stop_frame_n, signal=signal)
+    
+    acdc_df = acdc_df.copy()
+    idx = acdc_df.index.intersection(cca_df.index)
+    for col in cca_df_colnames:
+        if col not in acdc_df.columns:
+            acdc_df[col] = cca_df[col].reindex(acdc_df.index)
+        else:
+            acdc_df.loc[idx, col] = cca_df.loc[idx, col].to_numpy()
+    return acdc_df
+
+
 class LineageTree:
     def __init__(self, acdc_df) -> None:
         acdc_df = load.pd_bool_to_int(acdc_df).reset_index()
@@ -211,6 +211,11 @@ class dataPrepWin(QMainWindow):
         self.startAction = QAction(QIcon(":start.svg"), "Start process!", self)
         self.startAction.setEnabled(False)
 
+        self.virtualDataPrepAction = QAction(
+            'Align and crop at read time (do not save new image files)', self
+        )
+        self.virtualDataPrepAction.setCheckable(True)
+
     def gui_createMenuBar(self):
         menuBar = self.menuBar()
         # File menu
@@ -221,6 +226,11 @@ class dataPrepWin(QMainWindow):
         self.openRecentMenu = fileMenu.addMenu("Open Recent")
         fileMenu.addAction(self.exitAction)
 
+        # Settings menu
+        settingsMenu = QMenu("Settings", self)
+        menuBar.addMenu(settingsMenu)
+        settingsMenu.addAction(self.virtualDataPrepAction)
+
     def gui_createToolBars(self):
         toolbarSize = 34
 
@@ -659,24 +669,35 @@ class dataPrepWin(QMainWindow):
 
         SizeZ = posData.SizeZ
 
-        if posData.SizeZ > 1 and self.cropZtool is not None:
-            idx = (posData.filename, 0)
-            try:
-                lower_z = int(posData.segmInfo_df.at[idx, 'crop_lower_z_slice'])
-            except KeyError:
-                lower_z = 0
-
-            try:
-                upper_z = int(posData.segmInfo_df.at[idx, 'crop_upper_z_slice'])
-            except KeyError:
-                upper_z = posData.SizeZ
+        zRange = self.getCropZrange(posData)
+        if zRange is not None:
+            lower_z, upper_z = zRange
             if data.ndim == 4:
-                croppedData = data[:, lower_z:upper_z+1]
+                croppedData = croppedData[:, lower_z:upper_z+1]
             elif data.ndim == 3:
-                croppedData = data[lower_z:upper_z+1]
+                croppedData = croppedData[lower_z:upper_z+1]
             SizeZ = upper_z-lower_z+1
         return croppedData, SizeZ
 
+    def getCropZrange(self, posData):
+        if posData.SizeZ == 1 or self.cropZtool is None:
+            return
+
+        idx = (posData.filename, 0)
+        try:
+            lower_z = int(posData.segmInfo_df.at[idx, 'crop_lower_z_slice'])
+        except KeyError:
+            lower_z = 0
+
+        try:
+            upper_z = int(posData.segmInfo_df.at[idx, 'crop_upper_z_slice'])
+        except KeyError:
+            upper_z = posData.SizeZ-1
+        return lower_z, min(upper_z, posData.SizeZ-1)
+
+    def isVirtualDataPrep(self):
+        return self.virtualDataPrepAction.isChecked()
+
     def saveBkgrROIs(self, posData):
         if not posData.bkgrROIs:
             return
@@ -713,6 +734,12 @@ class dataPrepWin(QMainWindow):
             elif tifFound:
                 filename = tif_filename
                 chData = skimage.io.imread(tif_path)
+                if self.isVirtualDataPrep():
+                    # Background ROIs were placed on the aligned frames
+                    chData = load.AlignedCroppedData(
+                        chData, shifts=posData.loaded_shifts, 
+                        is_timelapse=posData.SizeT > 1
+                    ).materialize()
 
             bkgrROI_data = {}
             for r, roi in enumerate(posData.bkgrROIs):
@@ -833,7 +860,8 @@ class dataPrepWin(QMainWindow):
         x1 = x1 if x1<X else X
         y1 = y1 if y1<Y else Y
 
-        if x0<=0 and y0<=0 and x1>=X and y1>=Y:
+        isVirtual = self.isVirtualDataPrep()
+        if x0<=0 and y0<=0 and x1>=X and y1>=Y and not isVirtual:
             # ROI coordinates are the exact image shape. No need to save them
             return
 
@@ -851,6 +879,18 @@ class dataPrepWin(QMainWindow):
             f'y_bottom,{y1}\n'
             f'cropped,{int(doCrop)}'
         )
+        if isVirtual:
+            # Alignment and cropping are applied when loading the data
+            # (see load.AlignedCroppedData)
+            csv_data = f'{csv_data}\nvirtual,1'
+            zRange = self.getCropZrange(posData)
+            if doCrop and zRange is not None:
+                lower_z, upper_z = zRange
+                csv_data = (
+                    f'{csv_data}\n'
+                    f'z_lower,{lower_z}\n'
+                    f'z_upper,{upper_z}'
+                )
 
         try:
             with open(posData.dataPrepROI_coords_path, 'w') as csv:
@@ -972,7 +1012,8 @@ class dataPrepWin(QMainWindow):
                 return
 
 
-            if SizeZ != posData.SizeZ:
+            isVirtual = self.isVirtualDataPrep()
+            if SizeZ != posData.SizeZ and not isVirtual:
                 # Update metadata with cropped SizeZ
                 posData.metadata_df.at['SizeZ', 'values'] = SizeZ
                 posData.metadata_df.to_csv(posData.metadata_csv_path)
@@ -988,12 +1029,13 @@ class dataPrepWin(QMainWindow):
             self.logger.info('Saving background data...')
             self.saveBkgrData(posData)
 
-            # Get metadata from tif
-            with TiffFile(posData.tif_path) as tif:
-                metadata = tif.imagej_metadata
-
             # Save channels (npz AND tif)
             _zip = zip(posData.tif_paths, posData.all_npz_paths)
+            if isVirtual:
+                self.logger.info(
+                    'Cropping will be applied when loading the image files.'
+                )
+                _zip = []
             for tif, npz in _zip:
                 if self.align:
                     data = np.load(npz)['arr_0']
@@ -1148,6 +1190,9 @@ class dataPrepWin(QMainWindow):
         for f, file_path in enumerate(tqdm(user_ch_file_paths, ncols=100)):
             try:
                 posData = load.loadData(file_path, user_ch_name, QParent=self)
+                # Always prep raw data (alignment and cropping from a previous 
+                # run in virtual mode are re-applied from the saved files)
+                posData.applyVirtualDataPrep = False
                 posData.getBasenameAndChNames()
                 posData.buildPaths()
                 posData.loadImgData()
@@ -1169,6 +1214,8 @@ class dataPrepWin(QMainWindow):
                 if posData.dataPrep_ROIcoords is not None:
                     df = posData.dataPrep_ROIcoords
                     isROIactive = df.at['cropped', 'value'] == 0
+                    if 'virtual' in df.index:
+                        isROIactive = isROIactive or df.at['virtual', 'value']==1
                     if not isROIactive:
                         posData.dataPrep_ROIcoords = None
 
@@ -1455,7 +1502,13 @@ class dataPrepWin(QMainWindow):
             self.update_img()
             self.logger.info('Done.')
             self.addROIs()
-            self.saveROIcoords(False, self.data[self.pos_i])
+            if self.isVirtualDataPrep():
+                # The ROI coords file marks the positions prepped in 
+                # virtual mode, hence we save it for every position
+                for posData in self.data:
+                    self.saveROIcoords(False, posData)
+            else:
+                self.saveROIcoords(False, self.data[self.pos_i])
             self.saveBkgrROIs(self.data[self.pos_i])
             self.cropAction.setEnabled(True)
             if posData.SizeZ>1:
@@ -1630,6 +1683,10 @@ class dataPrepWin(QMainWindow):
         In the end, aligned data will be saved to both the .tif file and a
         "_aligned.npz" file. The shifts will be saved to "align_shift.npy" file.
 
+        NOTE: in virtual mode (see `isVirtualDataPrep`) only the shifts are 
+        saved and the alignment is applied when loading the .tif files 
+        (see `load.AlignedCroppedData`).
+
         Alignemnt is performed only if needed and requested by the user:
 
         1. If the "_aligned.npz" file does NOT exist AND the "align_shift.npy"
@@ -1698,6 +1755,7 @@ class dataPrepWin(QMainWindow):
             posData.loaded_shifts = np.zeros((self.num_frames,2), int)
 
         self.align = align
+        isVirtual = self.isVirtualDataPrep()
 
         if align:
             self.logger.info('Aligning data...')
@@ -1727,7 +1785,11 @@ class dataPrepWin(QMainWindow):
                     align_func = core.align_frames_3D
                     df = posData.segmInfo_df.loc[posData.filename]
                     zz = df['z_slice_used_dataPrep'].to_list()
-                    if not posData.filename.endswith('aligned') and align:
+                    isNewAligned = (
+                        not posData.filename.endswith('aligned') and align
+                        and not isVirtual
+                    )
+                    if isNewAligned:
                         # Add aligned channel to segmInfo
                         df_aligned = posData.segmInfo_df.rename(
                             index={posData.filename: f'{posData.filename}_aligned'}
@@ -1741,11 +1803,17 @@ class dataPrepWin(QMainWindow):
                     zz = None
                 if align:
                     aligned_frames, shifts = align_func(
-                        tif_data, slices=zz, user_shifts=posData.loaded_shifts
+                        tif_data, slices=zz, user_shifts=posData.loaded_shifts,
+                        out=tif_data
                     )
                     posData.loaded_shifts = shifts
                 else:
                     aligned_frames = tif_data.copy()
+                if align and isVirtual:
+                    self.logger.info(f'Saving: {posData.align_shifts_path}')
+                    np.save(posData.align_shifts_path, posData.loaded_shifts)
+                    posData.img_data = aligned_frames
+                    continue
                 if align:
                     _npz = f'{os.path.splitext(tif)[0]}_aligned.npz'
                     self.logger.info(f'Saving: {_npz}')
@@ -1762,6 +1830,9 @@ class dataPrepWin(QMainWindow):
                 posData.img_data = skimage.io.imread(tif)
 
         _zip = zip(posData.tif_paths, posData.npz_paths)
+        if isVirtual:
+            # Other channels are aligned when loaded with the saved shifts
+            _zip = []
         for i, (tif, npz) in enumerate(_zip):
             doAlign = npz is None or aligned
 
@@ -1783,7 +1854,8 @@ class dataPrepWin(QMainWindow):
                     zz = None
                 if align:
                     aligned_frames, shifts = align_func(
-                        tif_data, slices=zz, user_shifts=posData.loaded_shifts
+                        tif_data, slices=zz, user_shifts=posData.loaded_shifts,
+                        out=tif_data
                     )
                 else:
                     aligned_frames = tif_data.copy()
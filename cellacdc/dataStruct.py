@@ -7,15 +7,22 @@ import time
 import datetime
 import tempfile
 import h5py
+import tifffile
+from tifffile import TiffFile
 import difflib
+import hashlib
 import pathlib
+import importlib.util
+import xml.etree.ElementTree as ElementTree
 import numpy as np
 import pandas as pd
 from collections import Counter
 from tqdm import tqdm
 from natsort import natsorted
 from pprint import pprint
-from functools import wraps, partial
+from functools import wraps, partial, lru_cache
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
 from itertools import permutations
 
 from PyQt5.QtWidgets import (
@@ -33,7 +40,8 @@ from PyQt5 import QtGui
 # a separate process that doesn't have a parent package
 from . import exception_handler
 from . import qrc_resources
-from . import apps, myutils, widgets, html_utils, printl
+from . import apps, myutils, widgets, html_utils, load, printl
+from . import temp_path
 
 if os.name == 'nt':
     try:
@@ -55,6 +63,352 @@ def worker_exception_handler(func):
         return result
     return run
 
+def _import_omexml():
+    # `cellacdc.bioformats.__init__` imports javabridge, while the OME-XML 
+    # parser is pure Python and it is needed also without the Java VM
+    omexml_path = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'bioformats', 'omexml.py'
+    )
+    spec = importlib.util.spec_from_file_location(
+        'cellacdc_omexml', omexml_path
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+omexml = _import_omexml()
+
+tiff_extensions = ('.tif', '.tiff')
+
+def omexml_references_other_files(metadataXML, filePath):
+    """True if the OME-XML of the OME-TIFF `filePath` describes a multi-file 
+    dataset (planes stored in other files or metadata in a companion file)
+    """
+    filename = os.path.basename(filePath)
+    for element in ElementTree.fromstring(metadataXML).iter():
+        tag = element.tag.rsplit('}', 1)[-1]
+        if tag == 'BinaryOnly':
+            return True
+        if tag != 'UUID':
+            continue
+        uuidFilename = element.get('FileName')
+        if uuidFilename is None:
+            continue
+        if os.path.basename(uuidFilename) != filename:
+            return True
+    return False
+
+@lru_cache(maxsize=256)
+def _is_tiff_file(filePath, size, mtime_ns):
+    try:
+        with TiffFile(filePath) as tif:
+            if not tif.is_ome or not tif.ome_metadata:
+                return True
+            metadataXML = tif.ome_metadata
+        return not omexml_references_other_files(metadataXML, filePath)
+    except Exception as e:
+        # Not readable by tifffile --> let Bio-Formats try
+        return False
+
+def is_tiff_file(filePath):
+    """True if the file can be read without Bio-Formats (single-file 
+    OME-TIFF, ImageJ hyperstacks and plain multi-page TIFF). Multi-file 
+    OME-TIFF datasets are read with Bio-Formats.
+    """
+    if not filePath.lower().endswith(tiff_extensions):
+        return False
+    try:
+        stat = os.stat(filePath)
+    except OSError:
+        return True
+    return _is_tiff_file(
+        os.path.abspath(filePath), stat.st_size, stat.st_mtime_ns
+    )
+
+def _omexml_pixel_type(dtype):
+    dtype = np.dtype(dtype)
+    if dtype == np.float32:
+        return 'float'
+    elif dtype == np.float64:
+        return 'double'
+    elif dtype == bool:
+        return 'bit'
+    return dtype.name
+
+def get_tiff_omexml_metadata(filePath):
+    """Java-free equivalent of `bioformats.get_omexml_metadata` for TIFFs.
+
+    OME-TIFF files store the OME-XML in the image description. For other 
+    TIFF files the OME-XML is built from the axes of the tifffile series 
+    and from the ImageJ metadata (if present). Unknown axes (e.g., plain 
+    multi-page files) are considered time-points.
+    """
+    with TiffFile(filePath) as tif:
+        if tif.is_ome and tif.ome_metadata:
+            return tif.ome_metadata
+        
+        metadata = omexml.OMEXML()
+        metadata.image_count = len(tif.series)
+        imagej_metadata = tif.imagej_metadata or {}
+        for s, series in enumerate(tif.series):
+            sizes = {'T': 1, 'Z': 1, 'C': 1}
+            order = ''
+            for axis, size in zip(series.axes, series.shape):
+                if axis in 'YXS':
+                    continue
+                if axis not in sizes:
+                    axis = 'T'
+                sizes[axis] *= size
+                if axis not in order:
+                    order = f'{order}{axis}'
+            # OME DimensionOrder goes from fastest to slowest
+            order = order[::-1]
+            order = order + ''.join([ax for ax in 'ZCT' if ax not in order])
+            
+            image = metadata.image(s)
+            image.Name = os.path.splitext(os.path.basename(filePath))[0]
+            Pixels = image.Pixels
+            Pixels.DimensionOrder = f'XY{order}'
+            Pixels.PixelType = _omexml_pixel_type(series.dtype)
+            Pixels.SizeY, Pixels.SizeX = series.shape[-2:]
+            Pixels.SizeT = sizes['T']
+            Pixels.SizeZ = sizes['Z']
+            Pixels.SizeC = sizes['C']
+            Pixels.channel_count = sizes['C']
+            try:
+                num, den = series.pages[0].tags['XResolution'].value
+                Pixels.PhysicalSizeX = den/num
+                num, den = series.pages[0].tags['YResolution'].value
+                Pixels.PhysicalSizeY = den/num
+            except Exception as e:
+                pass
+            if 'spacing' in imagej_metadata:
+                Pixels.PhysicalSizeZ = imagej_metadata['spacing']
+            if 'unit' in imagej_metadata:
+                unit = imagej_metadata['unit'].replace('micron', 'µm')
+                Pixels.PhysicalSizeXUnit = unit
+                Pixels.PhysicalSizeYUnit = unit
+                Pixels.PhysicalSizeZUnit = unit
+            if 'finterval' in imagej_metadata:
+                Pixels.node.set('TimeIncrement', str(imagej_metadata['finterval']))
+        return metadata.to_xml()
+
+class TiffPlaneReader:
+    """Java-free reader of TIFF files with the `read` interface of 
+    `bioformats.ImageReader`.
+
+    Planes are indexed in the order of the pages of each series. Series 
+    with uncompressed contiguous data are memory-mapped, otherwise the 
+    single pages are decoded when requested.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._tif = None
+        self._planes = {}
+        self._omexml = None
+    
+    def __enter__(self):
+        self._tif = TiffFile(self.path)
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def close(self):
+        self._planes = {}
+        if self._tif is not None:
+            self._tif.close()
+            self._tif = None
+    
+    def _getPlanes(self, series):
+        planes = self._planes.get(series)
+        if planes is not None:
+            return planes
+        tif_series = self._tif.series[series]
+        ndim_plane = 3 if tif_series.axes.endswith('S') else 2
+        plane_shape = tif_series.shape[-ndim_plane:]
+        try:
+            planes = tifffile.memmap(self.path, series=series, mode='r')
+            planes = planes.reshape(-1, *plane_shape)
+        except ValueError:
+            # Compressed or non-contiguous data --> decode single pages
+            planes = None
+        self._planes[series] = planes
+        return planes
+    
+    def _getOMEXML(self):
+        if self._omexml is None:
+            metadataXML = get_tiff_omexml_metadata(self.path)
+            self._omexml = omexml.OMEXML(metadataXML)
+        return self._omexml
+
+    def _getIndexFromCZT(self, c, z, t, series):
+        Pixels = self._getOMEXML().image(series).Pixels
+        sizes = {'C': Pixels.SizeC, 'Z': Pixels.SizeZ, 'T': Pixels.SizeT}
+        dimsIdx = {'C': c, 'Z': z, 'T': t}
+        index = 0
+        stride = 1
+        for axis in Pixels.DimensionOrder[2:]:
+            index += dimsIdx[axis]*stride
+            stride *= sizes[axis]
+        return index
+    
+    def read(self, c=0, z=0, t=0, series=0, index=None, rescale=False, **kwargs):
+        if series is None:
+            series = 0
+        if index is None:
+            index = self._getIndexFromCZT(c, z, t, series)
+        planes = self._getPlanes(series)
+        if planes is not None:
+            return np.asarray(planes[index])
+        return self._tif.asarray(key=index, series=series)
+
+def open_image_reader(rawFilePath):
+    """`TiffPlaneReader` for TIFF files, otherwise `bioformats.ImageReader` 
+    (requires a running Java VM)
+    """
+    if is_tiff_file(rawFilePath):
+        return TiffPlaneReader(rawFilePath)
+    return bioformats.ImageReader(rawFilePath)
+
+bioformats_metadata_cache_path = os.path.join(temp_path, 'bioformats_metadata')
+_omexml_metadata_cache = {}
+
+def _get_metadata_cache_key(rawFilePath):
+    stat = os.stat(rawFilePath)
+    key = f'{os.path.abspath(rawFilePath)}|{stat.st_size}|{stat.st_mtime_ns}'
+    return hashlib.sha1(key.encode()).hexdigest()
+
+def read_omexml_metadata(rawFilePath, startJavaVM=None):
+    """OME-XML metadata of `rawFilePath` (string) with a persistent cache.
+
+    The metadata is cached in memory and in `cellacdc/temp/bioformats_metadata` 
+    with a key built from the path, size and modification time of the file, 
+    so that re-opening the dialog, converting another series of the same 
+    file, or a new session do not parse the file again. The cached OME-XML 
+    contains sizes (T, Z, C, series), physical sizes, channel and series names.
+
+    `startJavaVM` is called before reading non-TIFF files with Bio-Formats.
+    """
+    key = _get_metadata_cache_key(rawFilePath)
+    metadataXML = _omexml_metadata_cache.get(key)
+    if metadataXML is not None:
+        return metadataXML
+    
+    cache_filepath = os.path.join(bioformats_metadata_cache_path, f'{key}.xml')
+    if os.path.exists(cache_filepath):
+        with open(cache_filepath, 'r', encoding='utf-8') as xml_file:
+            metadataXML = xml_file.read()
+        _omexml_metadata_cache[key] = metadataXML
+        return metadataXML
+    
+    if is_tiff_file(rawFilePath):
+        metadataXML = get_tiff_omexml_metadata(rawFilePath)
+    else:
+        if startJavaVM is not None:
+            startJavaVM()
+        metadataXML = bioformats.get_omexml_metadata(rawFilePath)
+    
+    _omexml_metadata_cache[key] = metadataXML
+    try:
+        os.makedirs(bioformats_metadata_cache_path, exist_ok=True)
+        temp_filepath = f'{cache_filepath}.tmp'
+        with open(temp_filepath, 'w', encoding='utf-8') as xml_file:
+            xml_file.write(metadataXML)
+        os.replace(temp_filepath, cache_filepath)
+    except Exception as e:
+        # Caching is only an optimization
+        traceback.print_exc()
+    return metadataXML
+
+def get_plane_index(idxs, dimsIdx, DimensionOrder):
+    """See `bioFormatsWorker.getIndex`"""
+    dims = tuple([dimsIdx.get(v, 0) for v in DimensionOrder])
+    return idxs[dims]
+
+def save_bioformats_channel(
+        reader, series, filePath, ch_idx, idxs, SizeT, SizeZ, 
+        DimensionOrder, useIndex=True, to_h5=False, h5_compression=None
+    ):
+    """Read all the (t, z) planes of one channel and stream them to 
+    `filePath` (.h5 or .tif).
+
+    Planes are written directly into a preallocated h5 dataset or into a 
+    memory-mapped tif file (uint8 and uint16 data), so that the channel 
+    is never held twice in memory. Other data types are collected into a 
+    preallocated array and saved with `myutils.imagej_tiffwriter`.
+    """
+    # Read SizeX and SizeY from the shape of one image
+    imgData = reader.read(c=ch_idx, z=0, t=0, series=series, rescale=False)
+    shape = (SizeT, SizeZ, *imgData.shape)
+    dtype = imgData.dtype
+    isTifMemmap = not to_h5 and (dtype == np.uint8 or dtype == np.uint16)
+    h5f = None
+    if to_h5:
+        # Write to hidden sibling file and replace at the end (no copy)
+        tempFilepath = load.get_h5_temp_filepath(filePath)
+        h5f = h5py.File(tempFilepath, 'w')
+        # z-stacks are read in blocks of z-slices (e.g., 3D segmentation)
+        h5_access = 'zblock' if SizeZ > 1 else 'frame'
+        imgData_ch = load.create_h5_dataset(
+            h5f, shape, dtype, access=h5_access, compression=h5_compression
+        )
+    elif isTifMemmap:
+        tempFilepath = f'{filePath}.tmp'
+        squeezed_shape = [s for s in shape[:2] if s > 1]
+        squeezed_shape.extend(shape[2:])
+        tif_memmap = tifffile.memmap(
+            tempFilepath, shape=tuple(squeezed_shape), dtype=dtype, 
+            bigtiff=True
+        )
+        imgData_ch = tif_memmap.reshape(shape)
+    else:
+        imgData_ch = np.empty(shape, dtype=dtype)
+
+    dimsIdx = {'c': ch_idx} 
+    for t in range(SizeT):
+        dimsIdx['t'] = t
+        for z in range(SizeZ):
+            dimsIdx['z'] = z
+            if useIndex:
+                idx = get_plane_index(idxs, dimsIdx, DimensionOrder)
+            else:
+                idx = None
+            imgData_ch[t, z] = reader.read(
+                c=ch_idx, z=z, t=t, series=series, rescale=False,
+                index=idx
+            )
+    
+    if to_h5:
+        h5f.close()
+        os.replace(tempFilepath, filePath)
+    elif isTifMemmap:
+        tif_memmap.flush()
+        del imgData_ch, tif_memmap
+        os.replace(tempFilepath, filePath)
+    else:
+        myutils.imagej_tiffwriter(
+            filePath, np.squeeze(imgData_ch), {}, SizeT, SizeZ
+        )
+
+def _save_bioformats_channel_process(rawFilePath, kwargs):
+    """Convert one channel in a separate process. The Java VM is started 
+    only for non-TIFF files and it is kept alive for the next jobs.
+    """
+    global bioformats, javabridge
+    if not is_tiff_file(rawFilePath) and not _is_java_vm_running[0]:
+        import atexit
+        import javabridge
+        from cellacdc import bioformats
+        javabridge.start_vm(class_path=bioformats.JARS, run_headless=True)
+        atexit.register(javabridge.kill_vm)
+        _is_java_vm_running[0] = True
+    with open_image_reader(rawFilePath) as reader:
+        save_bioformats_channel(reader, **kwargs)
+    return kwargs['filePath']
+
+_is_java_vm_running = [False]
+
 class bioFormatsWorker(QObject):
     finished = pyqtSignal()
     progress = pyqtSignal(str)
@@ -87,6 +441,10 @@ class bioFormatsWorker(QObject):
         self.overwritePos = False
         self.addFiles = False
         self.cancel = False
+        # Number of processes (each with its own Java VM) used to convert 
+        # the channels in parallel
+        self.numWorkers = max(1, min(4, (os.cpu_count() or 1)//2))
+        self.conversionJobs = []
 
     def readMetadata(self, raw_src_path, filename):
         rawFilePath = os.path.join(raw_src_path, filename)
@@ -94,8 +452,10 @@ class bioFormatsWorker(QObject):
         self.progress.emit('Reading OME metadata...')
 
         try:
-            metadataXML = bioformats.get_omexml_metadata(rawFilePath)
-            metadata = bioformats.OMEXML(metadataXML)
+            metadataXML = read_omexml_metadata(
+                rawFilePath, startJavaVM=self.startJavaVM
+            )
+            metadata = omexml.OMEXML(metadataXML)
             self.metadata = metadata
             self.metadataXML = metadataXML
         except Exception as e:
@@ -319,7 +679,7 @@ class bioFormatsWorker(QObject):
                     sampleSizeT = 4
                 else:
                     sampleSizeT = SizeT  
-                with bioformats.ImageReader(rawFilePath) as reader:
+                with self.openReader(rawFilePath) as reader:
                     permut_pbar = tqdm(total=6, ncols=100)
                     for dimsOrd in permutations('zct', 3):
                         allChannelsData = []
@@ -492,72 +852,97 @@ class bioFormatsWorker(QObject):
         
 
         """
-        dims = tuple([dimsIdx.get(v, 0) for v in DimensionOrder])
-        return idxs[dims]
+        return get_plane_index(idxs, dimsIdx, DimensionOrder)
             
     def saveImgDataChannel(
             self, reader, series, images_path, filenameNOext, s0p, chName,
             ch_idx, idxs
         ):
-        if self.to_h5:
-            filename = self.getFilename(
-                filenameNOext, s0p, chName, series, '.h5'
-            )
-            tempDir = tempfile.mkdtemp()
-            tempFilepath = os.path.join(tempDir, filename)
-            print('==========================================================')
-            print(f'.h5 tempfile: "{tempFilepath}"')
-            print('==========================================================')
-            h5f = h5py.File(tempFilepath, 'w')
-            # Read SizeX and SizeY from the shape of one image
-            imgData = reader.read(
-                c=ch_idx, z=0, t=0, series=series, rescale=False
-            )
-            shape = (self.SizeT, self.SizeZ, *imgData.shape)
-            chunks = (1,1,*imgData.shape)
-            imgData_ch = h5f.create_dataset(
-                'data', shape, dtype=imgData.dtype,
-                chunks=chunks, shuffle=False
-            )
-        else:
-            filename = self.getFilename(
-                filenameNOext, s0p, chName, series, '.tif'
-            )
-            imgData_ch = []
-
+        ext = '.h5' if self.to_h5 else '.tif'
+        filename = self.getFilename(filenameNOext, s0p, chName, series, ext)
         filePath = os.path.join(images_path, filename)
-        dimsIdx = {'c': ch_idx} 
-        for t in range(self.SizeT):
-            imgData_z = []
-            dimsIdx['t'] = t
-            for z in range(self.SizeZ):
-                dimsIdx['z'] = z
-                if self.rawDataStruct != 2:
-                    idx = self.getIndex(idxs, dimsIdx, self.DimensionOrder)
-                else:
-                    idx = None
-                imgData = reader.read(
-                    c=ch_idx, z=z, t=t, series=series, rescale=False,
-                    index=idx
-                )
-                if self.to_h5:
-                    imgData_ch[t, z] = imgData
-                else:
-                    imgData_z.append(imgData)
-
-            if not self.to_h5:
-                imgData_z = np.squeeze(np.array(imgData_z, dtype=imgData.dtype))
-                imgData_ch.append(imgData_z)
-
-        if not self.to_h5:
-            imgData_ch = np.squeeze(np.array(imgData_ch, dtype=imgData.dtype))
-            myutils.imagej_tiffwriter(
-                filePath, imgData_ch, {}, self.SizeT, self.SizeZ
-            )
+        kwargs = {
+            'series': series, 'filePath': filePath, 'ch_idx': ch_idx, 
+            'idxs': idxs, 'SizeT': self.SizeT, 'SizeZ': self.SizeZ,
+            'DimensionOrder': self.DimensionOrder, 
+            'useIndex': self.rawDataStruct != 2, 'to_h5': self.to_h5,
+            'h5_compression': load.get_h5_compression()
+        }
+        if self.numWorkers > 1:
+            # Converted later in parallel by `runConversionJobs`
+            self.conversionJobs.append((reader.path, kwargs))
         else:
-            h5f.close()
-            shutil.move(tempFilepath, filePath)
-            shutil.rmtree(tempDir)
+            save_bioformats_channel(reader, **kwargs)
+    
+    def runConversionJobs(self):
+        """Run the jobs collected by `saveImgDataChannel` in parallel. 
+        Returns True if one job failed (the pending jobs are cancelled).
+        """
+        jobs = self.conversionJobs
+        self.conversionJobs = []
+        if not jobs:
+            return False
+        numJobs = len(jobs)
+        self.progress.emit(
+            f'Converting {numJobs} channels using {self.numWorkers} '
+            'parallel processes...'
+        )
+        executor = ProcessPoolExecutor(
+            max_workers=min(self.numWorkers, numJobs),
+            mp_context=multiprocessing.get_context('spawn')
+        )
+        with executor:
+            futures = {
+                executor.submit(_save_bioformats_channel_process, *job): job
+                for job in jobs
+            }
+            for i, future in enumerate(as_completed(futures)):
+                try:
+                    filePath = future.result()
+                except Exception as e:
+                    for pending_future in futures:
+                        pending_future.cancel()
+                    rawFilePath, _ = futures[future]
+                    self.isCriticalError = True
+                    self.criticalError.emit(
+                        'reading image data or metadata',
+                        traceback.format_exc(), 
+                        os.path.basename(rawFilePath)
+                    )
+                    return True
+                self.progress.emit(
+                    f'  [{i+1}/{numJobs}] Saved "{os.path.basename(filePath)}"'
+                )
+        return False
+    
+    def startJavaVM(self):
+        if self.isJavaVMrunning:
+            return
+        self.progress.emit('Starting a Java Virtual Machine...')
+        javabridge.start_vm(class_path=bioformats.JARS, run_headless=True)
+        # bioformats.init_logger()
+        self.isJavaVMrunning = True
+        self.progress.emit('Java VM running.')
+    
+    def killJavaVM(self):
+        if not self.isJavaVMrunning:
+            return
+        javabridge.kill_vm()
+        self.isJavaVMrunning = False
+    
+    def openReader(self, rawFilePath):
+        if not is_tiff_file(rawFilePath):
+            self.startJavaVM()
+        return open_image_reader(rawFilePath)
+
+    def moveRawFile(self, rawFilePath, raw_path):
+        if not os.path.exists(raw_path):
+            os.mkdir(raw_path)
+        dst = os.path.join(raw_path, os.path.basename(rawFilePath))
+        try:
+            shutil.move(rawFilePath, dst)
+        except PermissionError as e:
+            self.progress.emit(e)
 
     def saveData(self, images_path, rawFilePath, filename, p, series, p_idx=0):
         s0p = str(p+1).zfill(self.numPosDigits)
@@ -643,7 +1028,7 @@ class bioFormatsWorker(QObject):
             self.SizeC, self.SizeT, self.SizeZ, self.DimensionOrder
         )
         if self.rawDataStruct != 2:       
-            with bioformats.ImageReader(rawFilePath) as reader:
+            with self.openReader(rawFilePath) as reader:
                 iter = enumerate(zip(self.chNames, self.saveChannels))
                 for c, (chName, saveCh) in iter:
                     self.progressPbar.emit(1)
@@ -676,7 +1061,7 @@ class bioFormatsWorker(QObject):
                     if f.find(rawFilename)!=-1
                 ][0]
 
-                with bioformats.ImageReader(rawFilePath) as reader:
+                with self.openReader(rawFilePath) as reader:
                     self.progress.emit(
                         f'  Saving channel {c+1}/{len(self.chNames)} ({chName})'
                     )
@@ -725,11 +1110,11 @@ class bioFormatsWorker(QObject):
     def run(self):
         raw_src_path = self.raw_src_path
         exp_dst_path = self.exp_dst_path
-        javabridge.start_vm(class_path=bioformats.JARS, run_headless=True)
-        # bioformats.init_logger()
-        self.progress.emit('Java VM running.')
+        # The Java VM is started only if needed (non-TIFF files)
+        self.isJavaVMrunning = False
         self.aborted = False
         self.isCriticalError = False
+        rawFilesToMove = []
         for p, filename in enumerate(self.rawFilenames):
             if self.rawDataStruct == 0:
                 if not self.overWriteMetadata:
@@ -770,18 +1155,11 @@ class bioFormatsWorker(QObject):
             else:
                 break
 
-            # Move files to raw_microscopy_files folder
+            # Move files to raw_microscopy_files folder (after conversion)
             foldername = os.path.basename(self.raw_src_path)
             if foldername != 'raw_microscopy_files' and not self.aborted:
                 rawFilePath = os.path.join(self.raw_src_path, filename)
-                raw_path = os.path.join(raw_src_path, 'raw_microscopy_files')
-                if not os.path.exists(raw_path):
-                    os.mkdir(raw_path)
-                dst = os.path.join(raw_path, filename)
-                try:
-                    shutil.move(rawFilePath, dst)
-                except PermissionError as e:
-                    self.progress.emit(e)
+                rawFilesToMove.append(rawFilePath)
 
         if self.rawDataStruct == 2:
             filename = self.rawFilenames[0]
@@ -789,7 +1167,7 @@ class bioFormatsWorker(QObject):
                 abort = self.readMetadata(raw_src_path, filename)
                 if abort:
                     self.aborted = True
-                    javabridge.kill_vm()
+                    self.killJavaVM()
                     self.finished.emit()
                     return
 
@@ -812,16 +1190,22 @@ class bioFormatsWorker(QObject):
                 foldername = os.path.basename(self.raw_src_path)
                 if foldername != 'raw_microscopy_files' and not self.aborted:
                     rawFilePath = os.path.join(self.raw_src_path, filename)
-                    raw_path = os.path.join(raw_src_path, 'raw_microscopy_files')
-                    if not os.path.exists(raw_path):
-                        os.mkdir(raw_path)
-                    dst = os.path.join(raw_path, filename)
-                    try:
-                        shutil.move(rawFilePath, dst)
-                    except PermissionError as e:
-                        self.progress.emit(e)
+                    rawFilesToMove.append(rawFilePath)
 
-        javabridge.kill_vm()
+        if self.aborted:
+            # Do not convert the channels collected before aborting
+            self.conversionJobs = []
+        else:
+            abort = self.runConversionJobs()
+            if abort:
+                self.aborted = True
+                rawFilesToMove = []
+
+        raw_path = os.path.join(raw_src_path, 'raw_microscopy_files')
+        for rawFilePath in rawFilesToMove:
+            self.moveRawFile(rawFilePath, raw_path)
+
+        self.killJavaVM()
         self.finished.emit()
         
 
@@ -940,6 +1324,10 @@ class createDataStructWin(QMainWindow):
             self.close()
             raise OSError('This module is supported ONLY on Windows 10/10 and macOS')
 
+    def importJavabridge(self):
+        """Import javabridge and bioformats (and offer to install them). 
+        Called only when some of the files cannot be read without Java.
+        """
         global bioformats, javabridge
         self.logger.info('Checking if Java is installed...')
         try:
@@ -1215,6 +1603,14 @@ class createDataStructWin(QMainWindow):
                 self.close()
                 return
 
+        # Java is required only for files that are not (single-file) TIFFs
+        requiresJava = any([
+            not is_tiff_file(os.path.join(raw_src_path, filename))
+            for filename in rawFilenames
+        ])
+        if requiresJava:
+            self.importJavabridge()
+
         self.log(
             'Asking in which folder to save the images files...'
         )
@@ -1229,7 +1625,7 @@ class createDataStructWin(QMainWindow):
         self.addToRecentPaths(exp_dst_path)
 
         self.log(
-            'Starting a Java Virtual Machine...'
+            'Starting data structure conversion...'
         )
 
         self.addPbar()
@@ -76,7 +76,7 @@ from . import base_cca_df, graphLayoutBkgrColor, darkBkgrColor
 from . import load, prompts, apps, workers, html_utils
 from . import core, myutils, dataPrep, widgets
 from . import measurements, printl
-from . import colors, filters
+from . import colors, filters, model_server
 from . import user_manual_url
 from . import cellacdc_path, temp_path, settings_csv_path
 from .trackers.CellACDC import CellACDC_tracker
@@ -515,7 +515,25 @@ class saveDataWorker(QObject):
             if all([col in df.columns for col in cols]):
                 self._dfEvalEquation(df, newColName, equation)
     
-    def addVelocityMeasurement(self, acdc_df, prev_lab, lab, posData):
+    def _getCentroidsTable(self, posData, frame_i, centroids_dfs):
+        centroids_df = centroids_dfs.get(frame_i)
+        if centroids_df is None:
+            data_dict = posData.allData_li[frame_i]
+            centroids_df = core.get_objs_centroids_table(
+                data_dict['labels'], frame_i=frame_i, 
+                rp=data_dict['regionprops']
+            )
+            centroids_dfs[frame_i] = centroids_df
+        return centroids_df
+    
+    def addVelocityMeasurement(self, acdc_df, frame_i, posData, centroids_dfs):
+        """Add the velocity of the objects between frame `frame_i-1` and 
+        `frame_i` to `acdc_df` (see `core.compute_velocities`).
+
+        `centroids_dfs` is a dictionary {frame_i: centroids table} shared by 
+        the calls for the same position, so that the centroids of every 
+        frame are computed only once while iterating the frames.
+        """
         if 'velocity_pixel' not in self.mainWin.sizeMetricsToSave:
             return acdc_df
         
@@ -532,11 +550,24 @@ class saveDataWorker(QObject):
                 posData.PhysicalSizeY, 
                 posData.PhysicalSizeX
             ])
-        velocities_pxl, velocities_um = core.compute_twoframes_velocity(
-            prev_lab, lab, spacing=spacing
+        
+        centroids_df = pd.concat([
+            self._getCentroidsTable(posData, frame_i-1, centroids_dfs),
+            self._getCentroidsTable(posData, frame_i, centroids_dfs)
+        ], ignore_index=True)
+        # The previous frame is not needed by the next frames
+        centroids_dfs.pop(frame_i-1)
+        velocities_df = core.compute_velocities(centroids_df, spacing=spacing)
+        try:
+            frame_velocities_df = velocities_df.loc[frame_i]
+        except KeyError:
+            return acdc_df
+        
+        frame_velocities_df = frame_velocities_df.reindex(
+            acdc_df.index, fill_value=0
         )
-        acdc_df['velocity_pixel'] = velocities_pxl
-        acdc_df['velocity_um'] = velocities_um
+        acdc_df['velocity_pixel'] = frame_velocities_df['velocity_pixel']
+        acdc_df['velocity_um'] = frame_velocities_df['velocity_um']
         return acdc_df
 
     def addVolumeMetrics(self, df, rp, posData):
@@ -639,6 +670,7 @@ class saveDataWorker(QObject):
                 posData.setLoadedChannelNames()
                 self.mainWin.initMetricsToSave(posData)
 
+                centroids_dfs = {}
                 self.progress.emit(f'Saving {posData.relPath}')
                 for frame_i, data_dict in enumerate(posData.allData_li[:end_i+1]):
                     if self.saveWin.aborted:
@@ -674,10 +706,8 @@ class saveDataWorker(QObject):
                         rp = data_dict['regionprops']
                         if save_metrics:
                             if frame_i > 0:
-                                prev_data_dict = posData.allData_li[frame_i-1]
-                                prev_lab = prev_data_dict['labels']
                                 acdc_df = self.addVelocityMeasurement(
-                                    acdc_df, prev_lab, lab, posData
+                                    acdc_df, frame_i, posData, centroids_dfs
                                 )
                             acdc_df = self.addMetrics_acdc_df(
                                 acdc_df, rp, frame_i, lab, posData
@@ -697,18 +727,6 @@ class saveDataWorker(QObject):
                         self.addMetricsCritical.emit(
                             traceback.format_exc(), str(error)
                         )
-                    
-                    try:
-                        if save_metrics and frame_i > 0:
-                            prev_data_dict = posData.allData_li[frame_i-1]
-                            prev_lab = prev_data_dict['labels']
-                            acdc_df = self.addVelocityMeasurement(
-                                acdc_df, prev_lab, lab, posData
-                            )
-                    except Exception as error:
-                        self.addMetricsCritical.emit(
-                            traceback.format_exc(), str(error)
-                        )
 
                     t = time.perf_counter()
                     exec_time = t - self.time_last_pbar_update
@@ -1215,6 +1233,7 @@ class guiWin(QMainWindow):
         editMenu.addAction(self.editTextIDsColorAction)
         editMenu.addAction(self.editOverlayColorAction)
         editMenu.addAction(self.manuallyEditCcaAction)
+        editMenu.addAction(self.autoCcaFutureFramesAction)
         editMenu.addAction(self.enableSmartTrackAction)
         editMenu.addAction(self.enableAutoZoomToCellsAction)
 
@@ -2155,6 +2174,61 @@ class guiWin(QMainWindow):
         self.warnLostCellsAction.setChecked(True)
         self.settingsMenu.addAction(self.warnLostCellsAction)
 
+        self.npzCacheAction = QAction()
+        self.npzCacheAction.setText(
+            'Cache decompressed .npz image files on disk (faster re-loading)'
+        )
+        self.npzCacheAction.setCheckable(True)
+        if 'npz_cache_enabled' not in self.df_settings.index:
+            self.df_settings.at['npz_cache_enabled', 'value'] = 'No'
+        self.npzCacheAction.setChecked(
+            self.df_settings.at['npz_cache_enabled', 'value'] == 'Yes'
+        )
+        self.npzCacheAction.toggled.connect(self.npzCacheToggled)
+        self.settingsMenu.addAction(self.npzCacheAction)
+
+        self.modelServerAction = QAction()
+        self.modelServerAction.setText(
+            'Keep segmentation models loaded in a separate process '
+            '(faster repeated segmentation)'
+        )
+        self.modelServerAction.setCheckable(True)
+        if 'model_server_enabled' not in self.df_settings.index:
+            self.df_settings.at['model_server_enabled', 'value'] = 'No'
+        self.modelServerAction.setChecked(
+            self.df_settings.at['model_server_enabled', 'value'] == 'Yes'
+        )
+        self.modelServerAction.toggled.connect(self.modelServerToggled)
+        self.settingsMenu.addAction(self.modelServerAction)
+
+        self.h5CompressionActionGroup = QActionGroup(self)
+        self.h5CompressionActionGroup.setExclusionPolicy(
+            QActionGroup.ExclusionPolicy.Exclusive
+        )
+        h5CompressionMenu = self.settingsMenu.addMenu(
+            'Lossless compression of new .h5 image files'
+        )
+        if 'h5_compression' not in self.df_settings.index:
+            self.df_settings.at['h5_compression', 'value'] = 'None'
+        h5_compression = str(load.get_h5_compression())
+        h5CompressionTexts = {
+            'None': 'None (fastest, largest files)',
+            'lzf': 'LZF (fast)',
+            'gzip': 'GZIP (smallest files, slower)',
+            'blosc': 'Blosc LZ4 (fast, requires the package hdf5plugin)'
+        }
+        for compression, text in h5CompressionTexts.items():
+            action = QAction(self.h5CompressionActionGroup)
+            action.setText(text)
+            action.setCheckable(True)
+            action.setChecked(compression == h5_compression)
+            action.compression = compression
+            self.h5CompressionActionGroup.addAction(action)
+            h5CompressionMenu.addAction(action)
+        self.h5CompressionActionGroup.triggered.connect(
+            self.h5CompressionTriggered
+        )
+
         warnEditingWithAnnotTexts = {
             'Delete ID': 'Show warning when deleting ID that has annotations',
             'Separate IDs': 'Show warning when separating IDs that have annotations',
@@ -2278,14 +2352,12 @@ class guiWin(QMainWindow):
         models.append('Automatic thresholding')
         self.segmActions = []
         self.modelNames = []
-        self.acdcSegment_li = []
         self.models = []
         for model_name in models:
             action = QAction(f"{model_name}...")
             self.segmActions.append(action)
             self.modelNames.append(model_name)
             self.models.append(None)
-            self.acdcSegment_li.append(None)
             action.setDisabled(True)
 
         self.addCustomModelFrameAction = QAction('Add custom model...', self)
@@ -2402,6 +2474,11 @@ class guiWin(QMainWindow):
         self.manuallyEditCcaAction.setShortcut('Ctrl+Shift+P')
         self.manuallyEditCcaAction.setDisabled(True)
 
+        self.autoCcaFutureFramesAction = QAction(
+            'Automatically annotate cell cycle of next frames...', self
+        )
+        self.autoCcaFutureFramesAction.setDisabled(True)
+
         self.viewCcaTableAction = QAction(
             'View cell cycle annotations...', self
         )
@@ -2658,6 +2735,9 @@ class guiWin(QMainWindow):
 
         # self.repeatAutoCcaAction.triggered.connect(self.repeatAutoCca)
         self.manuallyEditCcaAction.triggered.connect(self.manualEditCca)
+        self.autoCcaFutureFramesAction.triggered.connect(
+            self.autoCcaFutureFrames
+        )
         self.invertBwAction.toggled.connect(self.invertBw)
 
         self.enableSmartTrackAction.toggled.connect(self.enableSmartTrack)
@@ -8702,6 +8782,76 @@ class guiWin(QMainWindow):
         self.checkMultiBudMoth()
         self.updateALLimg()
     
+    def autoCcaFutureFrames(self):
+        """Annotate all the next frames already visited in "Segmentation 
+        and Tracking" mode in one pass with `core.CcaAutoAnnotator`, 
+        starting from the annotations of the current frame. 
+        The user then only has to review and correct.
+        """
+        posData = self.data[self.pos_i]
+        self.store_data()
+        start_frame_i = posData.frame_i
+        stop_frame_n = start_frame_i + 1
+        while stop_frame_n < posData.SizeT:
+            if posData.allData_li[stop_frame_n]['labels'] is None:
+                break
+            stop_frame_n += 1
+        
+        if stop_frame_n == start_frame_i + 1:
+            txt = html_utils.paragraph(
+                'There are no next frames visited in '
+                '"Segmentation and Tracking" mode.<br><br>'
+                'Automatic annotation can only be performed on frames where '
+                'segmentation and tracking errors were checked/corrected.'
+            )
+            msg = widgets.myMessageBox()
+            msg.warning(self, 'No frames to annotate', txt)
+            return
+        
+        txt = html_utils.paragraph(
+            f'Cell cycle annotations from frame {start_frame_i+2} to frame '
+            f'{stop_frame_n} will be <b>automatically computed</b> starting '
+            'from the annotations of the current frame.<br><br>'
+            'Any annotation already present in these frames will be '
+            '<b>overwritten</b> (saved data is not touched of course).<br><br>'
+            'Do you want to continue?'
+        )
+        msg = widgets.myMessageBox()
+        msg.warning(
+           self, 'Automatically annotate next frames?', txt, 
+           buttonsTexts=('Cancel', 'Yes')
+        )
+        if msg.cancel:
+            return
+        
+        segm_data = {}
+        dead_IDs = {}
+        for i in range(start_frame_i, stop_frame_n):
+            segm_data[i] = posData.allData_li[i]['labels']
+            acdc_df = posData.allData_li[i]['acdc_df']
+            if acdc_df is not None and 'is_cell_dead' in acdc_df.columns:
+                dead_IDs[i] = acdc_df.index[acdc_df['is_cell_dead'] > 0]
+        
+        self.logger.info(
+            f'Automatically annotating frames {start_frame_i+2}-{stop_frame_n}...'
+        )
+        annotator = core.CcaAutoAnnotator(
+            segm_data, cca_df=posData.cca_df, start_frame_i=start_frame_i, 
+            dead_IDs=dead_IDs, logger=self.logger.info
+        )
+        cca_df = annotator.run(stop_frame_n=stop_frame_n)
+        for i, frame_cca_df in cca_df.groupby(level=0):
+            frame_cca_df = frame_cca_df.droplevel(0)
+            self.store_cca_df(frame_i=i, cca_df=frame_cca_df, autosave=False)
+        
+        posData.cca_df = cca_df.loc[start_frame_i].copy()
+        self.last_cca_frame_i = stop_frame_n - 1
+        self.navigateScrollBar.setMaximum(stop_frame_n)
+        self.navSpinBox.setMaximum(stop_frame_n)
+        self.enqAutosave()
+        self.updateALLimg()
+        self.logger.info('Automatic cell cycle annotation done.')
+
     def annotateRightHowCombobox_cb(self, idx):
         self.updateALLimg()
         how = self.annotateRightHowCombobox.currentText()
@@ -8789,6 +8939,7 @@ class guiWin(QMainWindow):
 
     def setEnabledCcaToolbar(self, enabled=False):
         self.manuallyEditCcaAction.setDisabled(False)
+        self.autoCcaFutureFramesAction.setDisabled(not enabled)
         self.viewCcaTableAction.setDisabled(False)
         self.ccaToolBar.setVisible(enabled)
         for action in self.ccaToolBar.actions():
@@ -10982,12 +11133,6 @@ class guiWin(QMainWindow):
             model_name = 'thresholding'
 
         posData = self.data[self.pos_i]
-        # Check if model needs to be imported
-        acdcSegment = self.acdcSegment_li[idx]
-        if acdcSegment is None:
-            self.logger.info(f'Importing {model_name}...')
-            acdcSegment = myutils.import_segment_module(model_name)
-            self.acdcSegment_li[idx] = acdcSegment
 
         # Ask parameters if the user clicked on the action
         # Otherwise this function is called by "computeSegm" function and
@@ -10996,13 +11141,11 @@ class guiWin(QMainWindow):
             if self.app.overrideCursor() == Qt.WaitCursor:
                 self.app.restoreOverrideCursor()
             self.segmModelName = model_name
-            # Read all models parameters
-            init_params, segment_params = myutils.getModelArgSpec(acdcSegment)
-            # Prompt user to enter the model parameters
-            try:
-                url = acdcSegment.url_help()
-            except AttributeError:
-                url = None
+            # Read all models parameters from the manifest (the model 
+            # module is imported only when the model is initialized)
+            init_params, segment_params, url = myutils.get_model_params(
+                model_name
+            )
             
             initLastParams = True
             if model_name == 'thresholding':
@@ -11043,11 +11186,18 @@ class guiWin(QMainWindow):
             self.applyPostProcessing = win.applyPostProcessing
             self.secondChannelName = win.secondChannelName
 
-            model = acdcSegment.Model(**win.init_kwargs)
+            self.logger.info(f'Importing {model_name}...')
+            model = model_server.init_model(
+                model_name, win.init_kwargs
+            )
             try:
                 model.setupLogger(self.logger)
             except Exception as e:
                 pass
+            if hasattr(model, 'enable_inference_cache'):
+                # The same image is often segmented again with different
+                # thresholds, e.g., with the label ROI tool
+                model.enable_inference_cache()
             self.models[idx] = model
 
             postProcessParams = {
@@ -11161,20 +11311,9 @@ class guiWin(QMainWindow):
             model_name = 'thresholding'
 
         posData = self.data[self.pos_i]
-        # Check if model needs to be imported
-        acdcSegment = self.acdcSegment_li[idx]
-        if acdcSegment is None:
-            self.logger.info(f'Importing {model_name}...')
-            acdcSegment = myutils.import_segment_module(model_name)
-            self.acdcSegment_li[idx] = acdcSegment
 
         # Read all models parameters
-        init_params, segment_params = myutils.getModelArgSpec(acdcSegment)
-        # Prompt user to enter the model parameters
-        try:
-            url = acdcSegment.url_help()
-        except AttributeError:
-            url = None
+        init_params, segment_params, url = myutils.get_model_params(model_name)
         
         if model_name == 'thresholding':
             autoThreshWin = apps.QDialogAutomaticThresholding(parent=self)
@@ -11205,7 +11344,10 @@ class guiWin(QMainWindow):
         if win.secondChannelName is not None:
             secondChannelData = self.getSecondChannelData()
 
-        model = acdcSegment.Model(**win.init_kwargs)
+        self.logger.info(f'Importing {model_name}...')
+        model = model_server.init_model(
+            model_name, win.init_kwargs
+        )
         try:
             model.setupLogger(self.logger)
         except Exception as e:
@@ -11365,19 +11507,9 @@ class guiWin(QMainWindow):
         self.storeUndoRedoStates(False)
 
         posData = self.data[self.pos_i]
-        # Check if model needs to be imported
-        acdcSegment = self.acdcSegment_li[idx]
-        if acdcSegment is None:
-            acdcSegment = myutils.import_segment_module(model_name)
-            self.acdcSegment_li[idx] = acdcSegment
 
         # Read all models parameters
-        init_params, segment_params = myutils.getModelArgSpec(acdcSegment)
-        # Prompt user to enter the model parameters
-        try:
-            url = acdcSegment.url_help()
-        except AttributeError:
-            url = None
+        init_params, segment_params, url = myutils.get_model_params(model_name)
 
         _SizeZ = None
         if self.isSegm3D:
@@ -11393,7 +11525,9 @@ class guiWin(QMainWindow):
             return
 
         self.segment2D_kwargs = win.segment2D_kwargs
-        model = acdcSegment.Model(**win.init_kwargs)
+        model = model_server.init_model(
+            model_name, win.init_kwargs
+        )
         try:
             model.setupLogger(self.logger)
         except Exception as e:
@@ -13438,11 +13572,11 @@ class guiWin(QMainWindow):
 
     def autoCca_df(self, enforceAll=False):
         """
-        Assign each bud to a mother with scipy linear sum assignment
-        (Hungarian or Munkres algorithm). First we build a cost matrix where
-        each (i, j) element is the minimum distance between bud i and mother j.
-        Then we minimize the cost of assigning each bud to a mother, and finally
-        we write the assignment info into cca_df
+        Assign each bud to a mother by minimum weight bipartite matching.
+        The cost of each (mother, bud) pair is the minimum distance between
+        their contours, computed with a KD-tree only for the mothers close
+        to the bud (see `core.assign_buds_to_mothers`). Finally we write
+        the assignment info into cca_df
         """
         proceed = True
         notEnoughG1Cells = False
@@ -13576,29 +13710,19 @@ class guiWin(QMainWindow):
                 proceed = False
             return notEnoughG1Cells, proceed
 
-        # Compute new IDs contours
-        newIDs_contours = []
-        for obj in posData.rp:
-            ID = obj.label
-            if ID in posData.new_IDs:
-                cont = self.getObjContours(obj)
-                newIDs_contours.append(cont)
-
-        # Compute cost matrix
-        cost = np.full((numCellsG1, numNewCells), np.inf)
-        for obj in posData.rp:
-            ID = obj.label
-            if ID in IDsCellsG1:
-                cont = self.getObjContours(obj)
-                i = IDsCellsG1.index(ID)
-                for j, newID_cont in enumerate(newIDs_contours):
-                    min_dist, nearest_xy = self.nearest_point_2Dyx(
-                        cont, newID_cont
-                    )
-                    cost[i, j] = min_dist
+        # Compute new IDs and G1 cells contours
+        contours = {
+            obj.label: self.getObjContours(obj) for obj in posData.rp
+            if obj.label in posData.new_IDs or obj.label in IDsCellsG1
+        }
+        newIDs_contours = [contours[ID] for ID in posData.new_IDs]
+        G1_contours = [contours[ID] for ID in IDsCellsG1]
 
-        # Run hungarian (munkres) assignment algorithm
-        row_idx, col_idx = scipy.optimize.linear_sum_assignment(cost)
+        # Minimize the sum of the minimum mother-bud distances with the 
+        # candidate mothers restricted to the ones near each bud
+        row_idx, col_idx = core.assign_buds_to_mothers(
+            G1_contours, newIDs_contours
+        )
 
         # Assign buds to mothers
         for i, j in zip(row_idx, col_idx):
@@ -15027,7 +15151,11 @@ class guiWin(QMainWindow):
                 f'{path}'
             )
             return None
-        fluo_data = np.squeeze(skimage.io.imread(fluo_path))
+        # Memory-mapped when possible, virtual dataPrep is applied lazily
+        fluo_data = np.squeeze(load.imread_tif(fluo_path))
+        fluo_data = load.apply_dataPrep_virtual(
+            fluo_data, posData.images_path, is_timelapse=posData.SizeT > 1
+        )
         return fluo_data
 
     def load_fluo_data(self, fluo_path):
@@ -15038,11 +15166,11 @@ class guiWin(QMainWindow):
         filename = os.path.basename(fluo_path)
         filename_noEXT, ext = os.path.splitext(filename)
         if ext == '.npy' or ext == '.npz':
-            fluo_data = np.load(fluo_path)
-            try:
-                fluo_data = np.squeeze(fluo_data['arr_0'])
-            except Exception as e:
-                fluo_data = np.squeeze(fluo_data)
+            if ext == '.npz':
+                fluo_data = load.load_npz_image_data(fluo_path)
+            else:
+                fluo_data = np.load(fluo_path)
+            fluo_data = np.squeeze(fluo_data)
 
             # Load background data
             bkgrData_path = os.path.join(
@@ -15054,7 +15182,7 @@ class guiWin(QMainWindow):
             aligned_filename = f'{filename_noEXT}_aligned.npz'
             aligned_path = os.path.join(posData.images_path, aligned_filename)
             if os.path.exists(aligned_path):
-                fluo_data = np.load(aligned_path)['arr_0']
+                fluo_data = load.load_npz_image_data(aligned_path)
 
                 # Load background data
                 bkgrData_path = os.path.join(
@@ -15792,6 +15920,26 @@ class guiWin(QMainWindow):
 
         self.lut = np.insert(self.lut, 0, [r, g, b], axis=0)
 
+    def npzCacheToggled(self, checked):
+        if checked:
+            self.df_settings.at['npz_cache_enabled', 'value'] = 'Yes'
+        else:
+            self.df_settings.at['npz_cache_enabled', 'value'] = 'No'
+        self.df_settings.to_csv(self.settings_csv_path)
+
+    def h5CompressionTriggered(self, action):
+        self.df_settings.at['h5_compression', 'value'] = action.compression
+        # Applies to the .h5 files created from now on
+        self.df_settings.to_csv(self.settings_csv_path)
+
+    def modelServerToggled(self, checked):
+        if checked:
+            self.df_settings.at['model_server_enabled', 'value'] = 'Yes'
+        else:
+            self.df_settings.at['model_server_enabled', 'value'] = 'No'
+        # Applies to the models initialized from now on
+        self.df_settings.to_csv(self.settings_csv_path)
+
     def useCenterBrushCursorHoverIDtoggled(self, checked):
         if checked:
             self.df_settings.at['useCenterBrushCursorHoverID', 'value'] = 'Yes'
@@ -7,7 +7,11 @@ import cv2
 import json
 import h5py
 import shutil
-from math import isnan
+import zipfile
+import hashlib
+import time
+import threading
+from math import isnan, ceil
 from tqdm import tqdm
 import numpy as np
 import h5py
@@ -17,6 +21,7 @@ from tkinter import ttk
 from skimage import io
 import skimage.filters
 from datetime import datetime
+import tifffile
 from tifffile import TiffFile
 from natsort import natsorted
 import skimage
@@ -33,6 +38,7 @@ warnings.simplefilter(action='ignore', category=FutureWarning)
 
 from . import prompts, apps, myutils, widgets, measurements, config
 from . import base_cca_df, base_acdc_df, html_utils, temp_path, printl
+from . import is_win, settings_csv_path
 
 cca_df_colnames = list(base_cca_df.keys())
 acdc_df_bool_cols = [
@@ -45,6 +51,11 @@ acdc_df_bool_cols = [
 additional_metadata_path = os.path.join(temp_path, 'additional_metadata.json')
 last_entries_metadata_path = os.path.join(temp_path, 'last_entries_metadata.csv')
 
+# Compressed tif files larger than this are decoded into a temporary memmap
+tif_max_in_memory_nbytes = 2*1024**3
+
+npz_cache_default_path = os.path.join(temp_path, 'npz_cache')
+
 def read_json(json_path, logger_func=print, desc='custom annotations'):
     json_data = {}
     try:
@@ -110,20 +121,75 @@ def h5dump_to_arr(h5path):
     arr = np.array([data_dict[key] for key in sorted_keys])
     return arr
 
-def save_to_h5(dst_filepath, data):
-    filename = os.path.basename(dst_filepath)
-    tempDir = tempfile.mkdtemp()
-    tempFilepath = os.path.join(tempDir, filename)
-    chunks = [1]*data.ndim
-    chunks[-2:] = data.shape[-2:]
-    h5f = h5py.File(tempFilepath, 'w')
+def get_h5_chunks(shape, access='frame', z_block_size=8):
+    """Chunk shape of a (T, Z, Y, X) image dataset (or fewer dimensions).
+
+    With `access='frame'` every chunk is one 2D image, which is what the 
+    GUI reads when navigating frames or z-slices. With `access='zblock'` 
+    a chunk contains `z_block_size` consecutive z-slices, which is faster 
+    when reading entire z-stacks (e.g., 3D segmentation). Pass 'zblock' 
+    only when the third to last axis of `shape` is the z-axis.
+    """
+    chunks = [1]*len(shape)
+    chunks[-2:] = shape[-2:]
+    if access == 'zblock' and len(shape) >= 3:
+        chunks[-3] = min(shape[-3], z_block_size)
+    return tuple(chunks)
+
+def get_h5_compression_kwargs(compression=None):
+    """Keyword arguments for `h5py.create_dataset` with lossless compression.
+
+    Valid `compression` values are None, 'gzip', 'lzf' and 'blosc' (requires 
+    the optional package `hdf5plugin`, otherwise 'lzf' is used).
+    """
+    if compression is None or compression == 'None':
+        return {}
+    if compression == 'blosc':
+        try:
+            import hdf5plugin
+            return {**hdf5plugin.Blosc(cname='lz4', clevel=5), 'shuffle': False}
+        except Exception as e:
+            compression = 'lzf'
+    if compression == 'gzip':
+        return {'compression': 'gzip', 'compression_opts': 4, 'shuffle': True}
+    if compression == 'lzf':
+        return {'compression': 'lzf', 'shuffle': True}
+    raise ValueError(f'"{compression}" is not a valid h5 compression.')
+
+def create_h5_dataset(
+        h5f, shape, dtype, access='frame', compression=None, name='data'
+    ):
+    chunks = get_h5_chunks(shape, access=access)
+    compression_kwargs = get_h5_compression_kwargs(compression)
+    if 'shuffle' not in compression_kwargs:
+        compression_kwargs['shuffle'] = False
     dataset = h5f.create_dataset(
-        'data', data.shape, dtype=data.dtype,
-        chunks=chunks, shuffle=False
+        name, shape, dtype=dtype, chunks=chunks, **compression_kwargs
     )
-    dataset[:] = data
-    shutil.move(tempFilepath, dst_filepath)
-    shutil.rmtree(tempDir)
+    return dataset
+
+def get_h5_temp_filepath(dst_filepath):
+    """Hidden sibling of `dst_filepath` used to write the file and then 
+    atomically replace the destination (same volume, no copy)
+    """
+    folder_path, filename = os.path.split(dst_filepath)
+    return os.path.join(folder_path, f'.{filename}.tmp')
+
+def save_to_h5(dst_filepath, data, access='frame', compression='from_settings'):
+    if compression == 'from_settings':
+        compression = get_h5_compression()
+    temp_filepath = get_h5_temp_filepath(dst_filepath)
+    try:
+        with h5py.File(temp_filepath, 'w') as h5f:
+            dataset = create_h5_dataset(
+                h5f, data.shape, data.dtype, access=access, 
+                compression=compression
+            )
+            dataset[:] = data
+        os.replace(temp_filepath, dst_filepath)
+    finally:
+        if os.path.exists(temp_filepath):
+            os.remove(temp_filepath)
 
 def load_segm_file(images_path, end_name_segm_file='segm', return_path=False):
     if not end_name_segm_file.endswith('.npz'):
@@ -198,56 +264,377 @@ def get_acdc_output_files(images_path):
     return acdc_output_files
 
 def get_segm_files(images_path):
-    ls = myutils.listdir(images_path)
-
-    segm_files = [
-        file for file in ls if file.endswith('segm.npz')
-        or file.find('segm_raw_postproc') != -1
-        or file.endswith('segm_raw.npz')
-        or (file.endswith('.npz') and file.find('segm') != -1)
-        or file.endswith('_segm.npy')
-    ]
-    return segm_files
+    return get_manifest(images_path).segm_files(images_path)
 
 def get_filename_from_channel(images_path, channel_name):
-    h5_aligned_path = ''
-    h5_path = ''
-    npz_aligned_path = ''
-    tif_path = ''
-    for file in myutils.listdir(images_path):
-        channelDataPath = os.path.join(images_path, file)
-        if file.endswith(f'{channel_name}_aligned.h5'):
-            h5_aligned_path = channelDataPath
-        elif file.endswith(f'{channel_name}.h5'):
-            h5_path = channelDataPath
-        elif file.endswith(f'{channel_name}_aligned.npz'):
-            npz_aligned_path = channelDataPath
-        elif file.endswith(f'{channel_name}.tif'):
-            tif_path = channelDataPath
+    return get_manifest(images_path).channel_filepath(
+        images_path, channel_name
+    )
+
+class NpzCache:
+    """Disk cache of decompressed .npz image data.
+
+    Every cached file is a raw .npy copy of the 'arr_0' array of the source 
+    .npz file and it is opened as copy-on-write memory map. The cache key 
+    is built from the absolute path, size and modification time of the 
+    source file, so that modified files are decompressed again. When the 
+    total size exceeds `quota_nbytes` the least recently used files are 
+    deleted.
+    """
+    def __init__(self, cache_path, quota_nbytes):
+        self.cache_path = cache_path
+        self.quota_nbytes = quota_nbytes
     
-    if h5_aligned_path:
-        return h5_aligned_path
-    elif h5_path:
-        return h5_path
-    elif npz_aligned_path:
-        return npz_aligned_path
-    elif tif_path:
-        return tif_path
-    else:
-        return ''
+    def _cached_filepath(self, npz_path):
+        stat = os.stat(npz_path)
+        key = f'{os.path.abspath(npz_path)}|{stat.st_size}|{stat.st_mtime_ns}'
+        key_hash = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.cache_path, f'{key_hash}.npy')
+    
+    def load(self, npz_path):
+        cached_filepath = self._cached_filepath(npz_path)
+        if os.path.exists(cached_filepath):
+            # Touch the file to mark it as recently used
+            os.utime(cached_filepath)
+            return np.load(cached_filepath, mmap_mode='c')
+        
+        data = np.load(npz_path)['arr_0']
+        if data.nbytes > self.quota_nbytes:
+            return data
+        
+        os.makedirs(self.cache_path, exist_ok=True)
+        self.cleanup(required_nbytes=data.nbytes)
+        temp_filepath = f'{cached_filepath}.tmp'
+        try:
+            with open(temp_filepath, 'wb') as file:
+                np.save(file, data)
+            os.replace(temp_filepath, cached_filepath)
+        except Exception as e:
+            # Caching is only an optimization (e.g., disk full)
+            traceback.print_exc()
+            if os.path.exists(temp_filepath):
+                os.remove(temp_filepath)
+            return data
+        del data
+        return np.load(cached_filepath, mmap_mode='c')
+
+    def cleanup(self, required_nbytes=0):
+        """Delete least recently used files until `required_nbytes` fit 
+        into the quota
+        """
+        cached_files = []
+        for entry in os.scandir(self.cache_path):
+            if not entry.name.endswith('.npy'):
+                continue
+            stat = entry.stat()
+            cached_files.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        
+        total_nbytes = sum([size for _, size, _ in cached_files])
+        max_nbytes = self.quota_nbytes - required_nbytes
+        for _, size, filepath in sorted(cached_files):
+            if total_nbytes <= max_nbytes:
+                break
+            try:
+                os.remove(filepath)
+            except Exception as e:
+                # File in use on Windows
+                continue
+            total_nbytes -= size
+
+def read_settings():
+    """Series of the 'value' column of the settings.csv file"""
+    if not os.path.exists(settings_csv_path):
+        return pd.Series(dtype=object)
+    try:
+        df_settings = pd.read_csv(settings_csv_path, index_col='setting')
+        return df_settings['value']
+    except Exception as e:
+        return pd.Series(dtype=object)
+
+def get_h5_compression():
+    """Compression of new .h5 files from the 'h5_compression' entry of 
+    the settings.csv file (default None)
+    """
+    compression = read_settings().get('h5_compression', None)
+    if compression not in ('gzip', 'lzf', 'blosc'):
+        return
+    return compression
+
+def get_npz_cache():
+    """Return the `NpzCache` if enabled in the settings or None otherwise.
+
+    The cache is enabled from the 'Settings' menu of the GUI and its 
+    location and quota can be changed with the 'npz_cache_path' and 
+    'npz_cache_quota_GB' entries of the settings.csv file.
+    """
+    settings = read_settings()
+    if settings.get('npz_cache_enabled', 'No') != 'Yes':
+        return
+    cache_path = settings.get('npz_cache_path', npz_cache_default_path)
+    quota_GB = float(settings.get('npz_cache_quota_GB', 20))
+    return NpzCache(cache_path, int(quota_GB*1024**3))
+
+def load_npz_image_data(npz_path):
+    """Load the 'arr_0' array of an .npz image file through the `NpzCache` 
+    if enabled
+    """
+    npz_cache = get_npz_cache()
+    if npz_cache is None:
+        return np.load(npz_path)['arr_0']
+    return npz_cache.load(npz_path)
+
+def imread_tif(filepath, memmap=True):
+    """Read a .tif file without decoding it entirely in RAM when possible.
+
+    Uncompressed files with contiguous image data (e.g., saved with 
+    `myutils.imagej_tiffwriter`) are returned as copy-on-write `np.memmap` 
+    so that only the pages of the frames that are accessed are read from 
+    disk. Compressed files larger than `tif_max_in_memory_nbytes` are 
+    decoded page by page into a temporary memory-mapped file, while smaller 
+    ones are read into RAM.
+
+    Memory-mapping is disabled on Windows because a mapped file cannot be 
+    overwritten when the data is saved again.
+    """
+    if not memmap or is_win:
+        return skimage.io.imread(filepath)
+    try:
+        return tifffile.memmap(filepath, mode='c')
+    except ValueError:
+        # Compressed or non-contiguous data
+        pass
+    with TiffFile(filepath) as tif:
+        series = tif.series[0]
+        nbytes = np.prod(series.shape)*series.dtype.itemsize
+        if nbytes > tif_max_in_memory_nbytes:
+            return tif.asarray(out='memmap')
+    return skimage.io.imread(filepath)
 
 def load_image_file(filepath):
     if filepath.endswith('.h5'):
         h5f = h5py.File(filepath, 'r')
         img_data = h5f['data']
     elif filepath.endswith('.npz'):
-        img_data = np.load(filepath)['arr_0']
+        img_data = load_npz_image_data(filepath)
     elif filepath.endswith('.npy'):
         img_data = np.load(filepath)
+    elif filepath.endswith('.tif'):
+        img_data = imread_tif(filepath)
     else:
         img_data = skimage.io.imread(filepath)
     return np.squeeze(img_data)
 
+class AlignedCroppedData:
+    """Read-time view of raw image data aligned and cropped by dataPrep.
+
+    Frames are shifted by the absolute `shifts` saved in "align_shift.npy"
+    (same result as `core.align_frames_2D` with `user_shifts`, i.e.,
+    `np.roll` with zero-padding of the wrapped borders) and cropped to the
+    `roi` (y0, y1, x0, x1) and to the `z_range` (lower, upper) inclusive.
+    Only the pixels within the cropped window are read from `data`,
+    which can therefore be a memory-mapped array or an h5py dataset.
+
+    Parameters
+    ----------
+    data : array-like
+        Raw image data with shape (T, [Z], Y, X) if `is_timelapse` is True,
+        otherwise ([Z], Y, X).
+    shifts : (T, 2) array of ints or None
+        Absolute (y, x) shift of each frame.
+    roi : tuple of ints or None
+        (y0, y1, x0, x1) crop window.
+    z_range : tuple of ints or None
+        (lower, upper) z-slices to keep (upper included).
+    is_timelapse : bool or None
+        If None it is True when `data` is 4D or when `shifts` has one row
+        per item of `data`.
+    """
+    def __init__(
+            self, data, shifts=None, roi=None, z_range=None,
+            is_timelapse=None
+        ):
+        self.data = data
+        if shifts is not None:
+            shifts = np.asarray(shifts, dtype=int)
+            if shifts.ndim != 2 or len(shifts) != len(data):
+                shifts = None
+        if is_timelapse is None:
+            is_timelapse = shifts is not None or data.ndim == 4
+        self.is_timelapse = is_timelapse
+        if shifts is not None and not np.any(shifts):
+            shifts = None
+        self.shifts = shifts
+
+        raw_shape = tuple(data.shape)
+        frame_shape = raw_shape[1:] if is_timelapse else raw_shape
+        Y, X = frame_shape[-2:]
+        if roi is None:
+            roi = (0, Y, 0, X)
+        y0, y1, x0, x1 = [int(c) for c in roi]
+        self.roi = (max(y0, 0), min(y1, Y), max(x0, 0), min(x1, X))
+        self.z_slice = None
+        if z_range is not None and len(frame_shape) == 3:
+            self.z_slice = slice(int(z_range[0]), int(z_range[1])+1)
+
+        y0, y1, x0, x1 = self.roi
+        shape = [y1-y0, x1-x0]
+        if len(frame_shape) == 3:
+            SizeZ = len(range(frame_shape[0])[self.z_slice or slice(None)])
+            shape.insert(0, SizeZ)
+        if is_timelapse:
+            shape.insert(0, raw_shape[0])
+        self.shape = tuple(shape)
+        self.dtype = data.dtype
+        self.ndim = len(self.shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __array__(self, dtype=None, copy=None):
+        arr = self.materialize()
+        if dtype is not None:
+            arr = arr.astype(dtype, copy=False)
+        return arr
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if not self.is_timelapse:
+            return self._getFrame(None)[key]
+
+        frame_idx = np.arange(self.shape[0])[key[0]]
+        if frame_idx.ndim == 0:
+            return self._getFrame(int(frame_idx))[key[1:]]
+
+        out = np.zeros((len(frame_idx), *self.shape[1:]), dtype=self.dtype)
+        for i, frame_i in enumerate(frame_idx):
+            out[i] = self._getFrame(frame_i)
+        return out[(slice(None), *key[1:])]
+
+    def _getFrame(self, frame_i):
+        y0, y1, x0, x1 = self.roi
+        dy, dx = (0, 0) if self.shifts is None else self.shifts[frame_i]
+        Y, X = self.data.shape[-2:]
+        # Output row r is read from raw row r+y0-dy (if within the image)
+        src_y0, src_x0 = y0-dy, x0-dx
+        a0, a1 = max(src_y0, 0), min(y1-dy, Y)
+        b0, b1 = max(src_x0, 0), min(x1-dx, X)
+
+        out = np.zeros(self.shape[1:] if self.is_timelapse else self.shape,
+                       dtype=self.dtype)
+        if a0 >= a1 or b0 >= b1:
+            return out
+
+        idx = [] if frame_i is None else [frame_i]
+        if self.z_slice is not None:
+            idx.append(self.z_slice)
+        elif out.ndim == 3:
+            idx.append(slice(None))
+        idx.extend([slice(a0, a1), slice(b0, b1)])
+        out[..., a0-src_y0:a1-src_y0, b0-src_x0:b1-src_x0] = (
+            self.data[tuple(idx)]
+        )
+        return out
+
+    def materialize(self):
+        """Return the aligned and cropped data as a numpy array"""
+        if not self.is_timelapse:
+            return self._getFrame(None)
+        return self[:]
+
+    def copy(self):
+        """New view of the same data. The view is read-only, hence the 
+        copy does not need to duplicate the pixels."""
+        return AlignedCroppedData(
+            self.data, shifts=self.shifts, roi=self.roi, 
+            z_range=self._z_range(), is_timelapse=self.is_timelapse
+        )
+
+    def astype(self, dtype, copy=True):
+        return self.materialize().astype(dtype, copy=False)
+
+    def _z_range(self):
+        if self.z_slice is None:
+            return
+        return (self.z_slice.start, self.z_slice.stop-1)
+
+    def _reduce(self, func, axis=None):
+        if axis is not None or not self.is_timelapse:
+            return func(self.materialize(), axis=axis)
+        # Whole-array reduction one frame at a time
+        return func([func(frame) for frame in self])
+
+    def max(self, axis=None):
+        return self._reduce(np.max, axis=axis)
+
+    def min(self, axis=None):
+        return self._reduce(np.min, axis=axis)
+
+    def mean(self, axis=None):
+        if axis is not None or not self.is_timelapse:
+            return self.materialize().mean(axis=axis)
+        return np.mean([frame.mean() for frame in self])
+
+def get_dataPrep_virtual_params(images_path):
+    """Return the parameters of the alignment/cropping that dataPrep
+    saved without writing new image files ("virtual" mode).
+
+    Returns None if the position was not prepared in virtual mode,
+    otherwise a dictionary with the keys 'shifts', 'roi' and 'z_range'
+    to be passed to `AlignedCroppedData`. The ROI is applied only if 
+    the data was cropped, otherwise it is the segmentation ROI.
+    """
+    ls = get_manifest(images_path).listdir(images_path)
+    roi_coords_file = None
+    shifts_file = None
+    for file in ls:
+        if file.endswith('dataPrepROIs_coords.csv'):
+            roi_coords_file = file
+        elif file.endswith('align_shift.npy'):
+            shifts_file = file
+
+    if roi_coords_file is None:
+        return
+
+    df = pd.read_csv(os.path.join(images_path, roi_coords_file))
+    if 'description' not in df.columns:
+        return
+    df = df.set_index('description')
+    if 'virtual' not in df.index or int(df.at['virtual', 'value']) != 1:
+        return
+
+    roi = None
+    z_range = None
+    isCropped = int(df.at['cropped', 'value']) == 1
+    if isCropped:
+        roi = tuple(
+            int(df.at[coord, 'value'])
+            for coord in ('y_top', 'y_bottom', 'x_left', 'x_right')
+        )
+    if isCropped and 'z_lower' in df.index:
+        z_range = (int(df.at['z_lower', 'value']), int(df.at['z_upper', 'value']))
+    shifts = None
+    if shifts_file is not None:
+        shifts = np.load(os.path.join(images_path, shifts_file))
+    return {'shifts': shifts, 'roi': roi, 'z_range': z_range}
+
+def apply_dataPrep_virtual(data, images_path, is_timelapse=None):
+    """Align and crop `data` at read time if the position was prepared
+    by dataPrep in virtual mode (see `get_dataPrep_virtual_params`).
+
+    Returns `data` itself or a lazy `AlignedCroppedData` view that shifts 
+    and crops only the frames that are accessed. Use `np.asarray` where 
+    the whole array is needed.
+    """
+    params = get_dataPrep_virtual_params(images_path)
+    if params is None:
+        return data
+    return AlignedCroppedData(data, is_timelapse=is_timelapse, **params)
+
 def get_existing_segm_endnames(basename, segm_files):
     existing_endnames = []
     for f in segm_files:
@@ -347,6 +734,320 @@ def get_posData_metadata(images_path, basename):
 
     return df_metadata, metadata_csv_path
 
+manifests_path = os.path.join(temp_path, 'manifests')
+manifest_version = 1
+# Folders modified less than this many ns before the scan are rescanned at 
+# next access since file systems with coarse timestamps (e.g., FAT, NFS) 
+# could miss later changes within the same timestamp tick
+_racy_mtime_window_ns = 2_000_000_000
+_manifest_ext = ('.tif', '.npz', '.npy', '.h5')
+_manifests = {}
+_manifests_lock = threading.Lock()
+
+def _read_npy_header(fp):
+    version = np.lib.format.read_magic(fp)
+    if version == (1, 0):
+        shape, _, dtype = np.lib.format.read_array_header_1_0(fp)
+    else:
+        shape, _, dtype = np.lib.format.read_array_header_2_0(fp)
+    return shape, dtype
+
+def _is_racy_mtime(mtime_ns):
+    return time.time_ns() - mtime_ns < _racy_mtime_window_ns
+
+def read_file_shape_dtype(filepath):
+    """Read shape and dtype of an image file without loading the data.
+
+    Returns (None, None) if the file type is not supported or the header 
+    cannot be read.
+    """
+    try:
+        if filepath.endswith('.npy'):
+            with open(filepath, 'rb') as fp:
+                shape, dtype = _read_npy_header(fp)
+        elif filepath.endswith('.npz'):
+            with zipfile.ZipFile(filepath) as zf:
+                member = zf.namelist()[0]
+                with zf.open(member) as fp:
+                    shape, dtype = _read_npy_header(fp)
+        elif filepath.endswith('.h5'):
+            with h5py.File(filepath, 'r') as h5f:
+                shape, dtype = h5f['data'].shape, h5f['data'].dtype
+        elif filepath.endswith('.tif'):
+            with TiffFile(filepath) as tif:
+                series = tif.series[0]
+                shape, dtype = series.shape, series.dtype
+        else:
+            return None, None
+    except Exception as e:
+        return None, None
+    return list(shape), np.dtype(dtype).str
+
+class ExperimentManifest:
+    """Experiment-wide catalogue of the Position folders and their files.
+
+    The catalogue is built with one directory scan per Images folder and 
+    stored as a json file in `cellacdc/temp/manifests` (one file per 
+    experiment folder, named with the hash of its path). Every Images 
+    folder entry is validated against the folder modification time and 
+    rescanned only when it changed. File shapes and dtypes are read from 
+    the file headers only when requested (see `file_info`) and reused as 
+    long as size and modification time of the file do not change (checked 
+    at every request, since overwriting a file does not change the folder 
+    modification time).
+
+    Use `get_manifest` to get the instance shared by all the loaders. 
+    Methods can be called from multiple threads.
+    """
+    def __init__(self, exp_path):
+        self.exp_path = os.path.normpath(exp_path)
+        path_hash = hashlib.sha1(self.exp_path.encode()).hexdigest()
+        self.manifest_path = os.path.join(manifests_path, f'{path_hash}.json')
+        self._exp_mtime_ns = None
+        self._pos_foldernames = []
+        self._folders = {}
+        self._isModified = False
+        self._lock = threading.RLock()
+        self._loadFromDisk()
+    
+    def _loadFromDisk(self):
+        if not os.path.exists(self.manifest_path):
+            return
+        try:
+            with open(self.manifest_path) as file:
+                manifest = json.load(file)
+            if manifest.get('version') != manifest_version:
+                return
+            self._exp_mtime_ns = manifest['exp_mtime_ns']
+            self._pos_foldernames = manifest['pos_foldernames']
+            self._folders = manifest['folders']
+        except Exception as e:
+            self._exp_mtime_ns = None
+            self._pos_foldernames = []
+            self._folders = {}
+    
+    def save(self):
+        with self._lock:
+            if not self._isModified:
+                return
+            manifest = {
+                'version': manifest_version,
+                'exp_mtime_ns': self._exp_mtime_ns,
+                'pos_foldernames': self._pos_foldernames,
+                'folders': self._folders
+            }
+            temp_filepath = None
+            try:
+                os.makedirs(manifests_path, exist_ok=True)
+                # Unique temporary file since other processes could be 
+                # saving the manifest of the same experiment
+                fd, temp_filepath = tempfile.mkstemp(
+                    suffix='.tmp', dir=manifests_path
+                )
+                with os.fdopen(fd, 'w') as file:
+                    json.dump(manifest, file)
+                os.replace(temp_filepath, self.manifest_path)
+                self._isModified = False
+            except Exception as e:
+                # Saving is only an optimization --> keep the in-memory 
+                # manifest
+                if temp_filepath is not None and os.path.exists(temp_filepath):
+                    os.remove(temp_filepath)
+    
+    def _key(self, folder_path):
+        folder_path = os.path.normpath(folder_path)
+        try:
+            return os.path.relpath(folder_path, self.exp_path)
+        except ValueError:
+            # Different drive on Windows
+            return folder_path
+    
+    def _scanFolder(self, folder_path, mtime_ns):
+        key = self._key(folder_path)
+        prev_files = self._folders.get(key, {}).get('files', {})
+        files = {}
+        with os.scandir(folder_path) as it:
+            for entry in it:
+                name = entry.name
+                if name.startswith('.') or name == 'desktop.ini':
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                info = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+                prev_info = prev_files.get(name)
+                isUnchanged = (
+                    prev_info is not None 
+                    and prev_info['size'] == stat.st_size
+                    and prev_info['mtime_ns'] == stat.st_mtime_ns
+                )
+                if isUnchanged:
+                    info = prev_info
+                files[name] = info
+        if _is_racy_mtime(mtime_ns):
+            mtime_ns = None
+        folder = {'mtime_ns': mtime_ns, 'files': files}
+        if self._folders.get(key) != folder:
+            self._folders[key] = folder
+            self._isModified = True
+    
+    def _validateFolder(self, folder_path):
+        # Called with `self._lock` acquired
+        try:
+            mtime_ns = os.stat(folder_path).st_mtime_ns
+        except OSError:
+            if self._folders.pop(self._key(folder_path), None) is not None:
+                self._isModified = True
+            return False
+        folder = self._folders.get(self._key(folder_path))
+        if folder is None or folder['mtime_ns'] != mtime_ns:
+            self._scanFolder(folder_path, mtime_ns)
+        return True
+    
+    def _validatePositions(self):
+        # Called with `self._lock` acquired
+        mtime_ns = os.stat(self.exp_path).st_mtime_ns
+        if self._exp_mtime_ns == mtime_ns:
+            return
+        pos_foldernames = [
+            pos for pos in myutils.listdir(self.exp_path) 
+            if pos.find('Position_')!=-1
+            and os.path.isdir(os.path.join(self.exp_path, pos))
+            and os.path.exists(os.path.join(self.exp_path, pos, 'Images'))
+        ]
+        exp_mtime_ns = None if _is_racy_mtime(mtime_ns) else mtime_ns
+        isChanged = (
+            pos_foldernames != self._pos_foldernames 
+            or exp_mtime_ns != self._exp_mtime_ns
+        )
+        if isChanged:
+            self._pos_foldernames = pos_foldernames
+            self._exp_mtime_ns = exp_mtime_ns
+            self._isModified = True
+    
+    def build(self):
+        """Validate the entire experiment folder and save the manifest to disk"""
+        with self._lock:
+            self._validatePositions()
+            for pos in self._pos_foldernames:
+                images_path = os.path.join(self.exp_path, pos, 'Images')
+                self._validateFolder(images_path)
+        self.save()
+    
+    def pos_foldernames(self):
+        with self._lock:
+            self._validatePositions()
+            pos_foldernames = list(self._pos_foldernames)
+        self.save()
+        return pos_foldernames
+    
+    def files_info(self, images_path):
+        """Dictionary of {filename: info} where info has the keys 
+        'size', 'mtime_ns' and, for image files whose header was read with 
+        `file_info`, 'shape' and 'dtype'
+        """
+        with self._lock:
+            if not self._validateFolder(images_path):
+                files = {}
+            else:
+                files = dict(self._folders[self._key(images_path)]['files'])
+        # No-op if nothing changed
+        self.save()
+        return files
+    
+    def listdir(self, images_path):
+        return natsorted(self.files_info(images_path).keys())
+    
+    def file_info(self, filepath):
+        """Info of the file (see `files_info`). The 'shape' and 'dtype' of 
+        image files are read from the header at the first request and 
+        again whenever the size or modification time of the file change.
+        """
+        images_path, filename = os.path.split(filepath)
+        info = self.files_info(images_path).get(filename)
+        if info is None:
+            return
+        # Overwriting a file in place does not change the folder mtime 
+        # --> compare the file stat with the cached one
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return
+        isSameFile = (
+            info['size'] == stat.st_size 
+            and info['mtime_ns'] == stat.st_mtime_ns
+        )
+        if not isSameFile:
+            info = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        isHeaderRequired = (
+            'shape' not in info and filename.endswith(_manifest_ext)
+        )
+        if isHeaderRequired:
+            shape, dtype = read_file_shape_dtype(filepath)
+            info = {**info, 'shape': shape, 'dtype': dtype}
+        if isSameFile and not isHeaderRequired:
+            return info
+        if _is_racy_mtime(stat.st_mtime_ns):
+            # The file could still change within the same timestamp tick
+            return info
+        with self._lock:
+            folder = self._folders.get(self._key(images_path))
+            if folder is not None and filename in folder['files']:
+                folder['files'][filename] = info
+                self._isModified = True
+        self.save()
+        return info
+
+    def segm_files(self, images_path):
+        return [
+            file for file in self.listdir(images_path) 
+            if file.endswith('segm.npz')
+            or file.find('segm_raw_postproc') != -1
+            or file.endswith('segm_raw.npz')
+            or (file.endswith('.npz') and file.find('segm') != -1)
+            or file.endswith('_segm.npy')
+        ]
+    
+    def channel_filepath(self, images_path, channel_name):
+        """Path of the channel file in order of priority 
+        (_aligned.h5, .h5, _aligned.npz, .tif) or '' if not found
+        """
+        priority = (
+            f'{channel_name}_aligned.h5', f'{channel_name}.h5', 
+            f'{channel_name}_aligned.npz', f'{channel_name}.tif'
+        )
+        found = {}
+        for file in self.listdir(images_path):
+            for end in priority:
+                if file.endswith(end):
+                    found[end] = os.path.join(images_path, file)
+                    break
+        for end in priority:
+            if end in found:
+                return found[end]
+        return ''
+
+def get_manifest(path):
+    """Get the cached `ExperimentManifest` of the experiment folder that 
+    contains `path` (an experiment, Position or Images folder path).
+    """
+    path = os.path.normpath(path)
+    if os.path.basename(path) == 'Images':
+        exp_path = os.path.dirname(os.path.dirname(path))
+    elif os.path.exists(os.path.join(path, 'Images')):
+        exp_path = os.path.dirname(path)
+    else:
+        exp_path = path
+    with _manifests_lock:
+        manifest = _manifests.get(exp_path)
+        if manifest is None:
+            manifest = ExperimentManifest(exp_path)
+            _manifests[exp_path] = manifest
+    return manifest
+
 class loadData:
     def __init__(self, imgPath, user_ch_name, relPathDepth=3, QParent=None):
         self.fluo_data_dict = {}
@@ -366,6 +1067,8 @@ class loadData:
         self.loadSizeZ = None
         self.multiSegmAllPos = False
         self.frame_i = 0
+        # Apply alignment/cropping saved by dataPrep in virtual mode
+        self.applyVirtualDataPrep = True
         path_li = os.path.normpath(imgPath).split(os.sep)
         self.relPath = f'{f"{os.sep}".join(path_li[-relPathDepth:])}'
         filename_ext = os.path.basename(imgPath)
@@ -517,7 +1220,7 @@ class loadData:
                 self.img_data = np.squeeze(self.dset[:])
 
         elif self.ext == '.npz':
-            self.img_data = np.squeeze(np.load(imgPath)['arr_0'])
+            self.img_data = np.squeeze(load_npz_image_data(imgPath))
             self.dset = self.img_data
             self.img_data_shape = self.img_data.shape
         elif self.ext == '.npy':
@@ -525,8 +1228,12 @@ class loadData:
             self.dset = self.img_data
             self.img_data_shape = self.img_data.shape
         else:
+            if self.ext == '.tif':
+                imread = imread_tif
+            else:
+                imread = skimage.io.imread
             try:
-                self.img_data = np.squeeze(skimage.io.imread(imgPath))
+                self.img_data = np.squeeze(imread(imgPath))
                 self.dset = self.img_data
                 self.img_data_shape = self.img_data.shape
             except ValueError:
@@ -536,6 +1243,40 @@ class loadData:
             except Exception as e:
                 traceback.print_exc()
                 self.criticalExtNotValid(signals=signals)
+                return
+
+        isVirtualDataPrepApplicable = (
+            self.applyVirtualDataPrep and self.ext != '.h5'
+            and not self.filename.endswith('aligned')
+        )
+        if isVirtualDataPrepApplicable:
+            self.img_data = apply_dataPrep_virtual(
+                self.img_data, self.images_path, 
+                is_timelapse=self.isTimelapse()
+            )
+            self.dset = self.img_data
+            self.img_data_shape = self.img_data.shape
+    
+    def isTimelapse(self):
+        """True if SizeT > 1. The image data is usually loaded before the 
+        metadata, in that case SizeT is read from the metadata.csv file. 
+        Returns None if SizeT is not known.
+        """
+        SizeT = getattr(self, 'SizeT', None)
+        if SizeT is None:
+            df_metadata, _ = get_posData_metadata(
+                self.images_path, getattr(self, 'basename', '')
+            )
+            try:
+                SizeT = int(float(df_metadata.at['SizeT', 'values']))
+            except Exception as e:
+                return
+        return SizeT > 1
+    
+    def getVirtualDataPrepParams(self):
+        if not self.applyVirtualDataPrep:
+            return
+        return get_dataPrep_virtual_params(self.images_path)
     
     def loadChannelData(self, channelName):
         if channelName == self.user_ch_name:
@@ -544,6 +1285,15 @@ class loadData:
         dataPath = get_filename_from_channel(self.images_path, channelName)
         if dataPath:
             data = load_image_file(dataPath)
+            _, ext = os.path.splitext(dataPath)
+            isVirtualDataPrepApplicable = (
+                self.applyVirtualDataPrep and ext != '.h5'
+                and not dataPath.endswith(f'aligned{ext}')
+            )
+            if isVirtualDataPrepApplicable:
+                data = apply_dataPrep_virtual(
+                    data, self.images_path, is_timelapse=self.isTimelapse()
+                )
             return data
         else:
             return
@@ -621,7 +1371,7 @@ class loadData:
         self.combineMetricsFound = False if load_customCombineMetrics else None
         self.labelBoolSegm = labelBoolSegm
         self.bkgrDataExists = False
-        ls = myutils.listdir(self.images_path)
+        ls = get_manifest(self.images_path).listdir(self.images_path)
 
         linked_acdc_filename = None
         if end_filename_segm and load_acdc_df:
@@ -898,6 +1648,11 @@ class loadData:
         else:
             self.SizeZ = 1
 
+        virtualParams = self.getVirtualDataPrepParams()
+        if virtualParams is not None and virtualParams['z_range'] is not None:
+            lower_z, upper_z = virtualParams['z_range']
+            self.SizeZ = upper_z-lower_z+1
+
         if 'SizeY' in self.metadata_df.index:
             self.SizeY = float(self.metadata_df.at['SizeY', 'values'])
             self.SizeY = int(self.SizeY)
@@ -1344,11 +2099,30 @@ class loadData:
         if self.ext != '.h5':
             return 0
         else:
-            Y, X = self.dset.shape[-2:]
-            size = self.loadSizeT*self.loadSizeZ*Y*X
+            shape = self.dset.shape
+            Y, X = shape[-2:]
+            if len(shape) == 4:
+                slab_shape = (self.loadSizeT, self.loadSizeZ, Y, X)
+            elif len(shape) == 3 and self.SizeT > 1:
+                slab_shape = (self.loadSizeT, Y, X)
+            elif len(shape) == 3:
+                slab_shape = (self.loadSizeZ, Y, X)
+            else:
+                slab_shape = (Y, X)
             itemsize = self.dset.dtype.itemsize
-            required_memory = size*itemsize
-            return required_memory
+            required_memory = np.prod(slab_shape)*itemsize
+            if self.dset.compression is not None and self.dset.chunks:
+                # Compressed chunks are decompressed entirely before 
+                # copying the requested slice --> count every chunk 
+                # touched by the loaded slab
+                chunks = self.dset.chunks
+                num_chunks = np.prod([
+                    ceil(dim/chunk_dim) 
+                    for dim, chunk_dim in zip(slab_shape, chunks)
+                ])
+                chunk_size = np.prod(chunks)*itemsize
+                required_memory = max(required_memory, num_chunks*chunk_size)
+            return int(required_memory)
     
     def _warnMultiPosTimeLapse(self, SizeT_metadata):
         txt = html_utils.paragraph(f"""
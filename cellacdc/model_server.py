@@ -0,0 +1,273 @@
+"""
+Segmentation models kept initialized in a separate process.
+
+Importing a model's deep learning framework and loading its weights can take
+tens of seconds, and the framework's memory is never completely released. The
+model server is a child process that keeps every initialized model in memory,
+keyed by (model name, init kwargs), so that repeated segmentation calls from
+the GUI or from batch runs do not initialize the same model again.
+
+Requests and responses go through a pipe, while numpy arrays (images and
+labels) are passed through shared memory to avoid pickling them.
+
+The server is enabled from the 'Settings' menu of the GUI ('model_server_enabled'
+entry of the settings.csv file). Use `init_model` to get either a model
+running in the server or a local `acdcSegment.Model` if the server is disabled.
+"""
+import atexit
+import threading
+import traceback
+import multiprocessing
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from . import load
+
+SharedArray = namedtuple('SharedArray', ['name', 'shape', 'dtype'])
+
+class ModelServerError(Exception):
+    pass
+
+def _to_shared_memory(arr, shms):
+    """Copy `arr` to a new shared memory block, append the block to `shms`
+    and return its `SharedArray` descriptor."""
+    arr = np.ascontiguousarray(arr)
+    shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+    shared_arr = np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)
+    shared_arr[...] = arr
+    shms.append(shm)
+    return SharedArray(shm.name, arr.shape, arr.dtype.str)
+
+def _from_shared_memory(descr):
+    """Copy of the array described by the `SharedArray` `descr`"""
+    # The server is spawned by the client and they share the same resource
+    # tracker, the block is unlinked only by the process that created it
+    shm = shared_memory.SharedMemory(name=descr.name)
+    try:
+        arr = np.ndarray(descr.shape, dtype=descr.dtype, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+    return arr
+
+def _release_shared_memory(shms):
+    for shm in shms:
+        shm.close()
+        shm.unlink()
+    shms.clear()
+
+def _pack(obj, shms):
+    """Replace numpy arrays in `obj` (also inside lists, tuples and dicts)
+    with shared memory descriptors."""
+    if isinstance(obj, np.ndarray) and obj.dtype != object:
+        return _to_shared_memory(obj, shms)
+    if isinstance(obj, SharedArray):
+        return obj
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_pack(item, shms) for item in obj)
+    if isinstance(obj, dict):
+        return {key: _pack(value, shms) for key, value in obj.items()}
+    return obj
+
+def _unpack(obj):
+    """Inverse of `_pack`"""
+    if isinstance(obj, SharedArray):
+        return _from_shared_memory(obj)
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_unpack(item) for item in obj)
+    if isinstance(obj, dict):
+        return {key: _unpack(value) for key, value in obj.items()}
+    return obj
+
+def get_model_key(model_name, init_kwargs):
+    return (model_name, tuple(sorted(
+        (key, repr(value)) for key, value in init_kwargs.items()
+    )))
+
+def _serve(conn):
+    """Main loop of the server process. Every request is a dictionary with
+    a 'command' key and every response a tuple (is_ok, result)."""
+    from . import myutils
+
+    models = {}
+    shms = []
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        # The client copied the previous output
+        _release_shared_memory(shms)
+        command = request['command']
+        if command == 'close':
+            conn.send((True, None))
+            break
+        try:
+            if command == 'init':
+                key = get_model_key(
+                    request['model_name'], request['init_kwargs']
+                )
+                if key not in models:
+                    acdcSegment = myutils.import_segment_module(
+                        request['model_name']
+                    )
+                    models[key] = acdcSegment.Model(**request['init_kwargs'])
+                methods = [
+                    name for name in dir(models[key])
+                    if not name.startswith('_')
+                    and callable(getattr(models[key], name))
+                ]
+                result = (key, methods)
+            elif command == 'call':
+                model = models[request['key']]
+                method = getattr(model, request['method'])
+                args = _unpack(request['args'])
+                kwargs = _unpack(request['kwargs'])
+                result = _pack(method(*args, **kwargs), shms)
+            elif command == 'release':
+                models.pop(request['key'], None)
+                result = None
+            else:
+                raise ModelServerError(f'Unknown command "{command}"')
+            response = (True, result)
+        except Exception as e:
+            response = (False, traceback.format_exc())
+        conn.send(response)
+    _release_shared_memory(shms)
+    conn.close()
+
+class ModelServer:
+    def __init__(self):
+        self._process = None
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def is_alive(self):
+        return self._process is not None and self._process.is_alive()
+
+    def start(self):
+        if self.is_alive():
+            return
+        # Spawn a fresh interpreter without the GUI state of this process
+        ctx = multiprocessing.get_context('spawn')
+        self._conn, child_conn = ctx.Pipe()
+        self._process = ctx.Process(
+            target=_serve, args=(child_conn,), daemon=True,
+            name='CellACDCModelServer'
+        )
+        self._process.start()
+        child_conn.close()
+
+    def request(self, command, **kwargs):
+        with self._lock:
+            if not self.is_alive():
+                self.start()
+            shms = []
+            try:
+                request = _pack({'command': command, **kwargs}, shms)
+                self._conn.send(request)
+                is_ok, result = self._conn.recv()
+                result = _unpack(result)
+            except (EOFError, BrokenPipeError, ConnectionResetError) as e:
+                self._process = None
+                raise ModelServerError(
+                    'The model server process terminated unexpectedly'
+                ) from e
+            finally:
+                _release_shared_memory(shms)
+        if not is_ok:
+            raise ModelServerError(
+                f'Error in the model server process:\n\n{result}'
+            )
+        return result
+
+    def get_model(self, model_name, init_kwargs):
+        key, methods = self.request(
+            'init', model_name=model_name, init_kwargs=init_kwargs
+        )
+        return RemoteModel(self, key, methods)
+
+    def close(self):
+        if not self.is_alive():
+            return
+        try:
+            self.request('close')
+        except ModelServerError:
+            pass
+        self._process.join(timeout=5)
+        if self._process.is_alive():
+            self._process.terminate()
+        self._process = None
+
+class RemoteModel:
+    """Proxy of a model initialized in the `ModelServer` exposing the
+    same public methods of the model."""
+    def __init__(self, server, key, methods):
+        self._server = server
+        self._key = key
+        self._methods = methods
+        self.logger = None
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name not in self._methods:
+            raise AttributeError(
+                f'{self._key[0]} model has no attribute "{name}"'
+            )
+        def method(*args, **kwargs):
+            return self._call(name, *args, **kwargs)
+        return method
+
+    def __dir__(self):
+        return [*super().__dir__(), *self._methods]
+
+    def setupLogger(self, logger):
+        # Loggers cannot be sent to another process
+        self.logger = logger
+
+    def _call(self, name, *args, **kwargs):
+        # Qt signals cannot be sent to another process, progress is
+        # emitted when the call returns
+        signals = kwargs.pop('signals', None)
+        result = self._server.request(
+            'call', key=self._key, method=name, args=args, kwargs=kwargs
+        )
+        if signals is not None and len(args) > 0:
+            signals, innerPbar_available = signals
+            if innerPbar_available:
+                signals.innerProgressBar.emit(len(args[0]))
+            else:
+                signals.progressBar.emit(len(args[0]))
+        return result
+
+    def release(self):
+        """Remove the model from the server memory"""
+        self._server.request('release', key=self._key)
+
+_model_server = None
+
+def get_model_server():
+    global _model_server
+    if _model_server is None:
+        _model_server = ModelServer()
+    return _model_server
+
+@atexit.register
+def close_model_server():
+    if _model_server is not None:
+        _model_server.close()
+
+def is_model_server_enabled():
+    return load.read_settings().get('model_server_enabled', 'No') == 'Yes'
+
+def init_model(model_name, init_kwargs, acdcSegment=None):
+    """Initialize the model `model_name` in the model server if enabled
+    in the settings, otherwise locally from the `acdcSegment` module
+    (imported if None)."""
+    if is_model_server_enabled():
+        return get_model_server().get_model(model_name, init_kwargs)
+    
+    if acdcSegment is None:
+        from . import myutils
+        acdcSegment = myutils.import_segment_module(model_name)
+    return acdcSegment.Model(**init_kwargs)
@@ -28,6 +28,45 @@ class Model:
                 None, name=model_name, basedir=model_path
             )
         self.load_stardist_3D = load_stardist_3D
+        self.inference_cache = None
+    
+    def enable_inference_cache(self, max_nbytes=1024**3):
+        """Cache the probabilities and distances of the segmented images. 
+        Meant for interactive segmentation where the same image is 
+        segmented again with different thresholds.
+        """
+        self.inference_cache = models.InferenceCache(max_nbytes=max_nbytes)
+    
+    def _predict_instances(self, image, prob_thresh=None, nms_thresh=None):
+        """Equivalent of `predict_instances` caching the network output 
+        (probabilities and distances) if the cache is enabled, so that 
+        changing only `prob_thresh` or `nms_thresh` does not run the 
+        network again."""
+        is_cache_usable = (
+            self.inference_cache is not None
+            and hasattr(self.model, '_instances_from_prediction')
+        )
+        if not is_cache_usable:
+            lab, _ = self.model.predict_instances(
+                normalize(image), prob_thresh=prob_thresh, 
+                nms_thresh=nms_thresh
+            )
+            return lab
+        
+        key = self.inference_cache.get_key(image)
+        cached = self.inference_cache.get(key)
+        if cached is None:
+            prob, dist = self.model.predict(normalize(image))
+            self.inference_cache.put(key, (prob, dist))
+        else:
+            prob, dist = cached
+        # Shape of the labels without the channel axis
+        lab_shape = image.shape[:self.model.config.n_dim]
+        lab, _ = self.model._instances_from_prediction(
+            lab_shape, prob, dist, prob_thresh=prob_thresh, 
+            nms_thresh=nms_thresh
+        )
+        return lab
 
     def segment(
             self, image, prob_thresh=0.0, nms_thresh=0.0,
@@ -66,16 +105,16 @@ class Model:
         if not segment_3D_volume and image.ndim == 3:
             labels = np.zeros(image.shape, dtype=np.uint32)
             for i, _img in enumerate(image):
-                lab, _ = self.model.predict_instances(
-                    normalize(_img),
+                lab = self._predict_instances(
+                    _img,
                     prob_thresh=prob_thresh,
                     nms_thresh=nms_thresh
                 )
                 labels[i] = lab
             labels = skimage.measure.label(labels>0)
         else:
-            labels, _ = self.model.predict_instances(
-                normalize(image),
+            labels = self._predict_instances(
+                image,
                 prob_thresh=prob_thresh,
                 nms_thresh=nms_thresh
             )
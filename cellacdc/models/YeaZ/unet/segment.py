@@ -73,79 +73,108 @@ def correct_artefacts(wsh):
     return wsh
 
 
-def cell_merge(wsh, pred, q=0.75):
+def get_adjacent_pairs(wsh, max_dist=2):
     """
-    Procedure that merges cells if the border between them is predicted to be
-    cell pixels.
+    Region adjacency graph of the watershed objects as an array of label
+    pairs (a < b). Two objects are adjacent if their masks dilated with a
+    3x3 kernel overlap, i.e. if they are closer than max_dist=2 pixels.
+    Computed by comparing the image with its shifted copies.
     """
-    wshshape=wsh.shape
+    wsh = wsh.astype(np.int64)
+    nrows, ncols = wsh.shape
+    num_labels = wsh.max()+1
+    keys = []
+    for dy in range(0, max_dist+1):
+        for dx in range(-max_dist, max_dist+1):
+            # Half of the neighbourhood is enough since pairs are symmetric
+            if dy == 0 and dx <= 0:
+                continue
+            a = wsh[0:nrows-dy, max(0, -dx):ncols-max(0, dx)]
+            b = wsh[dy:nrows, max(0, dx):ncols-max(0, -dx)]
+            is_pair = (a > 0) & (b > 0) & (a != b)
+            a, b = a[is_pair], b[is_pair]
+            keys.append(np.minimum(a, b)*num_labels + np.maximum(a, b))
+    keys = np.unique(np.concatenate(keys))
+    return np.column_stack((keys // num_labels, keys % num_labels))
+
+
+def union_find_roots(num_nodes, edges):
+    """Root (smallest node) of the set of each node after joining the 
+    pairs of nodes in `edges`"""
+    parents = list(range(num_nodes))
+
+    def find(node):
+        while parents[node] != node:
+            # Path halving
+            parents[node] = parents[parents[node]]
+            node = parents[node]
+        return node
+    
+    for a, b in edges:
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parents[max(root_a, root_b)] = min(root_a, root_b)
+    
+    return np.array([find(node) for node in range(num_nodes)])
 
-    # masks for the original cells
-    objs = np.zeros((wsh.max()+1,wshshape[0],wshshape[1]), dtype=bool)
 
-    # masks for dilated cells
-    dil_objs = np.zeros((wsh.max()+1,wshshape[0],wshshape[1]), dtype=bool)
-
-    # bounding box coordinates
-    obj_coords = np.zeros((wsh.max()+1,4))
+def cell_merge(wsh, pred, q=0.75):
+    """
+    Procedure that merges cells if the border between them is predicted to be
+    cell pixels.
 
-    # cleaned watershed, output of function
-    wshclean = np.zeros((wshshape[0],wshshape[1]))
+    Only adjacent objects (see get_adjacent_pairs) are evaluated, each pair 
+    on the crop of its bounding boxes, and the merges are applied at once 
+    with union-find.
+    """
+    wshshape = wsh.shape
+    num_labels = wsh.max()+1
 
     # kernel to dilate objects
     kernel = np.ones((3,3), dtype=bool)
 
-    for obj1 in range(wsh.max()):
-        # create masks and dilated masks for obj
-        objs[obj1,:,:] = wsh==(obj1+1)
-        dil_objs[obj1,:,:] = dilation(objs[obj1,:,:], kernel)
-
-        # bounding box
-        obj_coords[obj1,:] = get_bounding_box(dil_objs[obj1,:,:])
-
-    objcounter = 0	# counter for new watershed objects
-
-    for obj1 in range(wsh.max()):
-        dil1 = dil_objs[obj1,:,:]
-
-        # check if mask has been deleted
-        if np.sum(dil1) == 0:
+    objs_slices = ndi.find_objects(wsh)
+    merge_pairs = []
+    for obj1, obj2 in get_adjacent_pairs(wsh):
+        slice1, slice2 = objs_slices[obj1-1], objs_slices[obj2-1]
+
+        # Union of the bounding boxes with 1 pixel margin for the dilation
+        crop_slice = tuple(
+            slice(
+                max(0, min(s1.start, s2.start)-1), 
+                min(size, max(s1.stop, s2.stop)+1)
+            )
+            for s1, s2, size in zip(slice1, slice2, wshshape)
+        )
+        wsh_crop = wsh[crop_slice]
+        dil1 = ndi.binary_dilation(wsh_crop==obj1, kernel)
+        dil2 = ndi.binary_dilation(wsh_crop==obj2, kernel)
+
+        border = dil1 & dil2
+        border_pred = pred[crop_slice][border]
+
+        # Border is too small to be considered
+        if len(border_pred) < 32:
             continue
 
-        objcounter = objcounter + 1
-        orig1 = objs[obj1,:,:]
-
-        for obj2 in range(obj1+1,wsh.max()):
-            dil2 = dil_objs[obj2,:,:]
-
-            # only check border if bounding box overlaps, and second mask
-            # is not yet deleted
-            if (do_box_overlap(obj_coords[obj1,:], obj_coords[obj2,:])
-                and np.sum(dil2) > 0):
-
-                border = dil1 * dil2
-                border_pred = pred[border]
-
-                # Border is too small to be considered
-                if len(border_pred) < 32:
-                    continue
-
-                # Sum of top 25% of predicted border values
-                q75 = np.quantile(border_pred, q)
-                top_border_pred = border_pred[border_pred >= q75]
-                top_border_height = top_border_pred.sum()
-                top_border_area = len(top_border_pred)
-
-                # merge cells
-                if top_border_height / top_border_area > .99:
-                    orig1 = np.logical_or(orig1, objs[obj2,:,:])
-                    dil_objs[obj1,:,:] = np.logical_or(dil1, dil2)
-                    dil_objs[obj2,:,:] = np.zeros((wshshape[0], wshshape[1]))
-                    obj_coords[obj1,:] = get_bounding_box(dil_objs[obj1,:,:])
-
-        wshclean = wshclean + orig1*objcounter
-
-    return wshclean
+        # Sum of top 25% of predicted border values
+        q75 = np.quantile(border_pred, q)
+        top_border_pred = border_pred[border_pred >= q75]
+        top_border_height = top_border_pred.sum()
+        top_border_area = len(top_border_pred)
+
+        # merge cells
+        if top_border_height / top_border_area > .99:
+            merge_pairs.append((obj1, obj2))
+
+    # Relabel merged objects sequentially in the order of their first label
+    roots = union_find_roots(num_labels, merge_pairs)
+    is_present = np.bincount(wsh.ravel(), minlength=num_labels) > 0
+    is_present[0] = False
+    unique_roots = np.unique(roots[is_present])
+    lut = np.zeros(num_labels, dtype=wsh.dtype)
+    lut[is_present] = np.searchsorted(unique_roots, roots[is_present]) + 1
+    return lut[wsh]
 
 
 def do_box_overlap(coord1, coord2):
@@ -1,3 +1,8 @@
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
 try:
     from cellpose.models import MODEL_NAMES
     CELLPOSE_MODELS = MODEL_NAMES
@@ -16,4 +21,59 @@ STARDIST_MODELS = [
 try:
     from omnipose.core import OMNI_MODELS
 except Exception as e:
-    OMNI_MODELS = []
\ No newline at end of file
+    OMNI_MODELS = []
+
+class InferenceCache:
+    """Least recently used in-memory cache of the raw network outputs 
+    (e.g., probabilities, flows, distances) of a segmentation model.
+
+    Entries are keyed by the hash of the input image and of the parameters 
+    that change the network output, so that changing only the parameters 
+    applied downstream of the network (thresholds, post-processing) does 
+    not require running the network again.
+
+    Parameters
+    ----------
+    max_nbytes : int
+        Memory budget. The least recently used entries are removed when 
+        the total size of the cached arrays exceeds it.
+    """
+    def __init__(self, max_nbytes=1024**3):
+        self.max_nbytes = max_nbytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def get_key(image, **params):
+        image = np.ascontiguousarray(image)
+        hasher = hashlib.blake2b(digest_size=20)
+        hasher.update(f'{image.shape}{image.dtype.str}'.encode())
+        hasher.update(image.data)
+        hasher.update(repr(sorted(params.items())).encode())
+        return hasher.hexdigest()
+
+    def get(self, key):
+        outputs = self._entries.get(key)
+        if outputs is not None:
+            self._entries.move_to_end(key)
+        return outputs
+
+    def put(self, key, outputs):
+        """Store the tuple of arrays `outputs`"""
+        nbytes = sum(arr.nbytes for arr in outputs)
+        if nbytes > self.max_nbytes:
+            return
+        if key in self._entries:
+            self.nbytes -= sum(arr.nbytes for arr in self._entries.pop(key))
+        while self.nbytes + nbytes > self.max_nbytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.nbytes -= sum(arr.nbytes for arr in evicted)
+        self._entries[key] = outputs
+        self.nbytes += nbytes
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self._entries)
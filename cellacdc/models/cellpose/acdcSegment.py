@@ -1,5 +1,6 @@
 import os
 import pathlib
+import time
 
 import numpy as np
 
@@ -7,8 +8,8 @@ import skimage.exposure
 import skimage.filters
 import skimage.measure
 
-from cellpose import models
-from cellacdc.models import CELLPOSE_MODELS
+from cellpose import models, dynamics
+from cellacdc.models import CELLPOSE_MODELS, InferenceCache
 from cellacdc import printl
 
 class Model:
@@ -27,13 +28,226 @@ class Model:
             self.model = models.CellposeModel(
                 gpu=gpu, net_avg=net_avg, model_type=model_type
             )
+        self.timings = {}
+        self.model_name = model_type
+        self.diameters_cache = {}
+        self._diameter_cache_key = None
+        self.inference_cache = None
         
     def setupLogger(self, logger):
         models.models_logger = logger
     
+    def enable_inference_cache(self, max_nbytes=1024**3):
+        """Cache the flows and cell probabilities of the segmented images 
+        (see `_eval_images`). Meant for interactive segmentation where the 
+        same image is segmented again with different thresholds.
+        """
+        self.inference_cache = InferenceCache(max_nbytes=max_nbytes)
+    
+    def set_diameter_cache_key(self, position, channel):
+        """Reuse the diameter estimated by the size model for all the 
+        following calls with the same (position, channel, model). Without 
+        a key the diameter is estimated once per `segment` call.
+        """
+        self._diameter_cache_key = (position, channel, self.model_name)
+    
+    def estimate_diameter(self, images, isRGB, normalize=True, num_images=3):
+        """Median of the diameters estimated by the size model on up to 
+        `num_images` evenly spaced 2D images (first and last excluded) of 
+        the stack `images` (N, Y, X) or (N, Y, X, C).
+        """
+        idx = np.linspace(0, len(images)-1, num_images+2)[1:-1]
+        idx = np.unique(idx.round().astype(int))
+        batch = self._initialize_batch(images[idx], isRGB)
+        channels = [0,0] if not isRGB else [1,2]
+        diams, _ = self.model.sz.eval(
+            [batch[i:i+1] for i in range(len(batch))], channels=channels,
+            normalize=normalize
+        )
+        return float(np.median(diams))
+    
+    def _get_diameter(
+            self, images, isRGB, diameter=0.0, normalize=True, num_frames=1,
+            diameter_update_interval=0
+        ):
+        """Diameter to use for the next `num_frames` frames whose 2D images 
+        are `images`. If `diameter` is 0 the cached diameter is used and 
+        re-estimated every `diameter_update_interval` frames (never if 0).
+        """
+        if diameter > 0 or not hasattr(self.model, 'sz'):
+            # Only the `Cellpose` class has a size model
+            return diameter
+        
+        key = self._diameter_cache_key
+        cached = self.diameters_cache.get(key)
+        is_update_due = (
+            cached is not None and diameter_update_interval > 0
+            and cached[1] >= diameter_update_interval
+        )
+        if cached is None or is_update_due:
+            t0 = time.perf_counter()
+            diameter = self.estimate_diameter(
+                images, isRGB, normalize=normalize
+            )
+            self._add_timing('diameter estimation', t0)
+            models.models_logger.info(
+                f'Estimated cell diameter = {diameter:.2f} pixels'
+            )
+            cached = [diameter, 0]
+            self.diameters_cache[key] = cached
+        cached[1] += num_frames
+        return cached[0]
+    
+    def _clear_uncached_diameter(self):
+        if self._diameter_cache_key is None:
+            self.diameters_cache.pop(None, None)
+    
     def _eval(self, image, **kwargs):
         return self.model.eval(image.astype(np.float32), **kwargs)[0]
     
+    def _add_timing(self, stage, t0):
+        t1 = time.perf_counter()
+        self.timings[stage] = self.timings.get(stage, 0.0) + t1 - t0
+        return t1
+    
+    def _log_timings(self, num_images):
+        timings_txt = ', '.join(
+            f'{stage} = {elapsed:.3f} s' for stage, elapsed in self.timings.items()
+        )
+        models.models_logger.info(
+            f'Cellpose timings for {num_images} image(s): {timings_txt}'
+        )
+    
+    def _initialize_batch(self, images, isRGB):
+        """Vectorized equivalent of `_initialize_image` for a stack of 2D 
+        images (N, Y, X) or RGB images (N, Y, X, C). Every image is 
+        normalized to its own min and max like in `_initialize_image`.
+
+        Returns a float32 array with shape (N, Y, X, 1) or (N, Y, X, 3).
+        """
+        if isRGB:
+            batch = images[..., :3].astype(np.float32)
+        else:
+            batch = images[..., np.newaxis].astype(np.float32)
+        reduce_axes = tuple(range(1, batch.ndim))
+        imgs_min = batch.min(axis=reduce_axes, keepdims=True)
+        imgs_max = batch.max(axis=reduce_axes, keepdims=True)
+        imgs_range = imgs_max - imgs_min
+        imgs_range[imgs_range <= 1e-3] = 1.0
+        batch -= imgs_min
+        batch *= 255/imgs_range
+        return batch
+    
+    def _eval_batch(self, images, isRGB, batch_size=8, **eval_kwargs):
+        """Segment a stack of 2D images with one call to `model.eval`"""
+        t0 = time.perf_counter()
+        batch = self._initialize_batch(images, isRGB)
+        t0 = self._add_timing('preprocessing', t0)
+        # Pass a list of (1, Y, X, C) images, i.e., the same input 
+        # as `_initialize_image` of a single 2D image
+        masks = self._eval_images(batch, batch_size=batch_size, **eval_kwargs)
+        self._add_timing('inference', t0)
+        labels = np.zeros(images.shape[:3], dtype=np.uint32)
+        for i, lab in enumerate(masks):
+            labels[i] = lab
+        return labels
+    
+    def _is_inference_cache_usable(self, eval_kwargs):
+        # Masks computed from the returned flows are the same computed 
+        # by `eval` only when the flows are resampled to the image size
+        return (
+            self.inference_cache is not None
+            and eval_kwargs['resample'] and not eval_kwargs['do_3D']
+            and not eval_kwargs['stitch_threshold']
+        )
+    
+    def _masks_from_flows(
+            self, dP, cellprob, diameter=0.0, flow_threshold=0.4, 
+            cellprob_threshold=0.0, min_size=15
+        ):
+        """Masks of a 2D image from its flows with the same dynamics 
+        parameters used by `CellposeModel._run_cp`"""
+        cp_model = getattr(self.model, 'cp', self.model)
+        if diameter is None or diameter <= 0:
+            diameter = cp_model.diam_labels
+        rescale = cp_model.diam_mean/diameter
+        # Like `_run_cp`, `min_size` is not passed for 2D images
+        masks = dynamics.compute_masks(
+            dP, cellprob, niter=(1/rescale*200), 
+            cellprob_threshold=cellprob_threshold, 
+            flow_threshold=flow_threshold, interp=True, resize=None,
+            use_gpu=cp_model.gpu, device=cp_model.device
+        )[0]
+        return masks
+    
+    def _eval_images(self, batch, batch_size=8, **eval_kwargs):
+        """Masks of the (N, Y, X, C) initialized images in `batch`. 
+
+        If the cache is enabled (see `enable_inference_cache`), the flows 
+        and cell probabilities of each image are cached, so that changing
+        only `flow_threshold` or `cellprob_threshold` recomputes the masks
+        from the cached network output without running the network again.
+        """
+        images = [batch[i:i+1] for i in range(len(batch))]
+        if not self._is_inference_cache_usable(eval_kwargs):
+            return self.model.eval(
+                images, batch_size=batch_size, **eval_kwargs
+            )[0]
+        
+        network_kwargs = {
+            key: eval_kwargs[key] 
+            for key in ('channels', 'diameter', 'normalize', 'resample')
+        }
+        masks_kwargs = {
+            key: eval_kwargs[key] 
+            for key in ('flow_threshold', 'cellprob_threshold', 'min_size')
+        }
+        keys = [
+            self.inference_cache.get_key(
+                image, **network_kwargs, **masks_kwargs
+            ) 
+            for image in images
+        ]
+        masks = [None]*len(images)
+        missing_idx = []
+        for i, image in enumerate(images):
+            # Exact same call: reuse the masks computed by `eval`
+            cached = self.inference_cache.get(keys[i])
+            if cached is not None:
+                masks[i] = cached[0].copy()
+                continue
+            
+            flows_key = self.inference_cache.get_key(image, **network_kwargs)
+            cached = self.inference_cache.get(flows_key)
+            if cached is not None:
+                masks[i] = self._masks_from_flows(
+                    *cached, diameter=eval_kwargs['diameter'], **masks_kwargs
+                )
+                self.inference_cache.put(keys[i], (masks[i].copy(),))
+            else:
+                missing_idx.append(i)
+        
+        if not missing_idx:
+            return masks
+        
+        missing_masks, flows = self.model.eval(
+            [images[i] for i in missing_idx], batch_size=batch_size, 
+            **eval_kwargs
+        )[:2]
+        for i, lab, image_flows in zip(missing_idx, missing_masks, flows):
+            masks[i] = lab
+            dP = np.squeeze(image_flows[1])
+            cellprob = np.squeeze(image_flows[2])
+            Y, X = np.shape(lab)[-2:]
+            if dP.shape != (2, Y, X) or cellprob.shape != (Y, X):
+                continue
+            flows_key = self.inference_cache.get_key(
+                images[i], **network_kwargs
+            )
+            self.inference_cache.put(flows_key, (dP, cellprob))
+            self.inference_cache.put(keys[i], (np.array(lab),))
+        return masks
+    
     def _initialize_image(self, image):
         # See cellpose.gui.io._initialize_images
         if image.ndim > 3:
@@ -88,37 +302,16 @@ class Model:
         # second channel in the 'green' channel. We then pass
         # `channels = [1,2]` to the segment method
         rgb_stack = np.zeros((*first_ch_data.shape, 3), dtype=first_ch_data.dtype)
-        
-        R_slice = [slice(None)]*(rgb_stack.ndim)
-        R_slice[-1] = 0
-        R_slice = tuple(R_slice)
-        rgb_stack[R_slice] = first_ch_data
-
-        G_slice = [slice(None)]*(rgb_stack.ndim)
-        G_slice[-1] = 1
-        G_slice = tuple(G_slice)
-
-        rgb_stack[G_slice] = second_ch_data
-
+        rgb_stack[..., 0] = first_ch_data
+        rgb_stack[..., 1] = second_ch_data
         return rgb_stack
-        
-    def segment(
-            self, image,
-            diameter=0.0,
-            flow_threshold=0.4,
-            cellprob_threshold=0.0,
-            stitch_threshold=0.0,
-            min_size=15,
-            anisotropy=0.0,
-            normalize=True,
-            resample=True,
-            segment_3D_volume=False            
+    
+    def _get_eval_kwargs(
+            self, image, diameter=0.0, flow_threshold=0.4, 
+            cellprob_threshold=0.0, stitch_threshold=0.0, min_size=15, 
+            anisotropy=0.0, normalize=True, resample=True, 
+            segment_3D_volume=False
         ):
-        # Preprocess image
-        # image = image/image.max()
-        # image = skimage.filters.gaussian(image, sigma=1)
-        # image = skimage.exposure.equalize_adapthist(image)
-
         isRGB = image.shape[-1] == 3 or image.shape[-1] == 4
         isZstack = (image.ndim==3 and not isRGB) or (image.ndim==4)
 
@@ -151,19 +344,182 @@ class Model:
             'anisotropy': anisotropy,
             'resample': resample
         }
+        return eval_kwargs, isRGB, isZstack, segment_3D_volume
+        
+    def segment(
+            self, image,
+            diameter=0.0,
+            flow_threshold=0.4,
+            cellprob_threshold=0.0,
+            stitch_threshold=0.0,
+            min_size=15,
+            anisotropy=0.0,
+            normalize=True,
+            resample=True,
+            segment_3D_volume=False,
+            batch_size=8,
+            diameter_update_interval=0
+        ):
+        """Segment a 2D image or a z-stack with cellpose.
+
+        Parameters
+        ----------
+        diameter : float
+            Average diameter of the cells in pixels. If 0 it is estimated 
+            with the size model (only 'cyto' model).
+        segment_3D_volume : bool
+            If True, z-stacks are segmented as 3D volumes, otherwise 
+            slice-by-slice.
+        batch_size : int
+            Number of image tiles processed together by the network.
+        diameter_update_interval : int
+            If `diameter` is 0, re-estimate the diameter every this number 
+            of frames (0 to estimate it only once per position).
+        """
+        # Preprocess image
+        # image = image/image.max()
+        # image = skimage.filters.gaussian(image, sigma=1)
+        # image = skimage.exposure.equalize_adapthist(image)
+        
+        eval_kwargs, isRGB, isZstack, segment_3D_volume = self._get_eval_kwargs(
+            image, diameter=diameter, flow_threshold=flow_threshold,
+            cellprob_threshold=cellprob_threshold, 
+            stitch_threshold=stitch_threshold, min_size=min_size,
+            anisotropy=anisotropy, normalize=normalize, resample=resample,
+            segment_3D_volume=segment_3D_volume
+        )
 
         # Run cellpose eval
+        self.timings = {}
+        self._clear_uncached_diameter()
         if not segment_3D_volume and isZstack:
-            labels = np.zeros(image.shape, dtype=np.uint32)
-            for i, _img in enumerate(image):
-                _img = self._initialize_image(_img)
-                lab = self._eval(_img, **eval_kwargs)
-                labels[i] = lab
+            # Segment all the z-slices with one eval call and the same 
+            # diameter instead of estimating it for every slice
+            eval_kwargs['diameter'] = self._get_diameter(
+                image, isRGB, diameter=diameter, normalize=normalize,
+                diameter_update_interval=diameter_update_interval
+            )
+            labels = self._eval_batch(
+                image, isRGB, batch_size=batch_size, **eval_kwargs
+            )
+            t0 = time.perf_counter()
             labels = skimage.measure.label(labels>0)
+            self._add_timing('labelling', t0)
+            self._log_timings(len(image))
         else:
-            image = self._initialize_image(image)  
-            labels = self._eval(image, **eval_kwargs)
+            if not isZstack:
+                eval_kwargs['diameter'] = self._get_diameter(
+                    image[np.newaxis], isRGB, diameter=diameter, 
+                    normalize=normalize,
+                    diameter_update_interval=diameter_update_interval
+                )
+            t0 = time.perf_counter()
+            image = self._initialize_image(image)
+            t0 = self._add_timing('preprocessing', t0)
+            if isZstack:
+                # 3D volume
+                labels = self._eval(
+                    image, batch_size=batch_size, **eval_kwargs
+                )
+            else:
+                labels = self._eval_images(
+                    image, batch_size=batch_size, **eval_kwargs
+                )[0]
+            self._add_timing('inference', t0)
         return labels
+    
+    def segment3DT(
+            self, video_data, 
+            diameter=0.0,
+            flow_threshold=0.4,
+            cellprob_threshold=0.0,
+            stitch_threshold=0.0,
+            min_size=15,
+            anisotropy=0.0,
+            normalize=True,
+            resample=True,
+            segment_3D_volume=False,
+            batch_size=8,
+            diameter_update_interval=0,
+            signals=None
+        ):
+        """Segment a timelapse (T, Y, X) or (T, Z, Y, X) evaluating the 2D 
+        images of `batch_size` timepoints with one call to `model.eval`. 
+        3D volumes (`segment_3D_volume=True`) are segmented one 
+        timepoint at a time.
+
+        If `diameter` is 0 it is estimated once on a few representative 
+        timepoints (and every `diameter_update_interval` frames if > 0).
+        """
+        segment_kwargs = {
+            'diameter': diameter,
+            'flow_threshold': flow_threshold,
+            'cellprob_threshold': cellprob_threshold,
+            'stitch_threshold': stitch_threshold,
+            'min_size': min_size,
+            'anisotropy': anisotropy,
+            'normalize': normalize,
+            'resample': resample,
+            'segment_3D_volume': segment_3D_volume,
+            'batch_size': batch_size,
+            'diameter_update_interval': diameter_update_interval
+        }
+        eval_kwargs, isRGB, isZstack, segment_3D_volume = self._get_eval_kwargs(
+            video_data[0], **{
+                key: value for key, value in segment_kwargs.items()
+                if key not in ('batch_size', 'diameter_update_interval')
+            }
+        )
+        num_frames = len(video_data)
+        labels = np.zeros(video_data.shape[:video_data.ndim-isRGB], np.uint32)
+        if segment_3D_volume:
+            for t, image in enumerate(video_data):
+                labels[t] = self.segment(image, **segment_kwargs)
+                self._emit_progress(signals, 1)
+            return labels
+        
+        self.timings = {}
+        self._clear_uncached_diameter()
+        img_shape = video_data.shape[-2-isRGB:]
+        for t0 in range(0, num_frames, batch_size):
+            t1 = min(t0+batch_size, num_frames)
+            if t0 == 0:
+                # Representative timepoints of the whole video
+                diameter_images = video_data
+            else:
+                diameter_images = video_data[t0:t1]
+            if isZstack:
+                # Central z-slice
+                diameter_images = diameter_images[:, video_data.shape[1]//2]
+            eval_kwargs['diameter'] = self._get_diameter(
+                diameter_images, isRGB, diameter=diameter, 
+                normalize=normalize, num_frames=t1-t0,
+                diameter_update_interval=diameter_update_interval
+            )
+            # Flatten timepoints and z-slices to a stack of 2D images
+            images = video_data[t0:t1].reshape(-1, *img_shape)
+            batch_labels = self._eval_batch(
+                images, isRGB, batch_size=batch_size, **eval_kwargs
+            )
+            labels[t0:t1] = batch_labels.reshape(labels[t0:t1].shape)
+            if isZstack:
+                start = time.perf_counter()
+                for t in range(t0, t1):
+                    labels[t] = skimage.measure.label(labels[t]>0)
+                self._add_timing('labelling', start)
+            self._emit_progress(signals, t1-t0)
+        self._log_timings(np.prod(labels.shape[:-2]))
+        return labels
+    
+    def _emit_progress(self, signals, step):
+        if signals is None:
+            return
+        
+        innerPbar_available = signals[1]
+        if innerPbar_available:
+            signals[0].innerProgressBar.emit(step)
+        else:
+            signals[0].progressBar.emit(step)
 
 def url_help():
     return 'https://cellpose.readthedocs.io/en/latest/api.html'
@@ -9,6 +9,10 @@ class Model:
         self.acdcCellpose.model = models.CellposeModel(
             gpu=gpu, net_avg=net_avg, pretrained_model=model_path
         )
+        self.acdcCellpose.model_name = model_path
+    
+    def set_diameter_cache_key(self, position, channel):
+        self.acdcCellpose.set_diameter_cache_key(position, channel)
 
     def segment(
             self, image,
@@ -20,7 +24,9 @@ class Model:
             anisotropy=0.0,
             normalize=True,
             resample=True,
-            segment_3D_volume=False            
+            segment_3D_volume=False,
+            batch_size=8,
+            diameter_update_interval=0
         ):
         labels = self.acdcCellpose.segment(
             image,
@@ -32,6 +38,13 @@ class Model:
             anisotropy=anisotropy,
             normalize=normalize,
             resample=resample,
-            segment_3D_volume=segment_3D_volume  
+            segment_3D_volume=segment_3D_volume,
+            batch_size=batch_size,
+            diameter_update_interval=diameter_update_interval
         )
-        return labels
\ No newline at end of file
+        return labels
+    
+    def segment3DT(self, video_data, signals=None, **segment_kwargs):
+        return self.acdcCellpose.segment3DT(
+            video_data, signals=signals, **segment_kwargs
+        )
\ No newline at end of file
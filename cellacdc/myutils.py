@@ -25,6 +25,7 @@ import pandas as pd
 import skimage
 from distutils.dir_util import copy_tree
 import inspect
+import json
 import typing
 import matplotlib.colors
 import colorsys
@@ -43,6 +44,7 @@ from . import cellacdc_path, printl, temp_path
 from . import config
 
 models_list_file_path = os.path.join(temp_path, 'custom_models_paths.ini')
+_listdir_cache = {}
 
 def get_module_name(script_file_path):
     parts = pathlib.Path(script_file_path).parts
@@ -282,13 +284,7 @@ def setupLogger(module='gui'):
     return logger, logs_path, log_path, log_filename
 
 def get_pos_foldernames(exp_path):
-    ls = listdir(exp_path)
-    pos_foldernames = [
-        pos for pos in ls if pos.find('Position_')!=-1
-        and os.path.isdir(os.path.join(exp_path, pos))
-        and os.path.exists(os.path.join(exp_path, pos, 'Images'))
-    ]
-    return pos_foldernames
+    return load.get_manifest(exp_path).pos_foldernames()
 
 def getMostRecentPath():
     recentPaths_path = os.path.join(
@@ -684,11 +680,25 @@ def clipSelemMask(mask, shape, Yc, Xc, copy=True):
 
 
 def listdir(path):
-    return natsorted([
+    """Sorted list of non-hidden files in `path`.
+
+    The listing is cached and reused as long as the modification time of 
+    the folder does not change (one `stat` instead of a full listing).
+    """
+    mtime_ns = os.stat(path).st_mtime_ns
+    cached = _listdir_cache.get(path)
+    if cached is not None and cached[0] == mtime_ns:
+        return list(cached[1])
+    ls = natsorted([
         f for f in os.listdir(path)
         if not f.startswith('.')
         and not f == 'desktop.ini'
     ])
+    if time.time_ns() - mtime_ns > load._racy_mtime_window_ns:
+        # Do not cache folders modified within the racy window since file 
+        # systems with coarse timestamps could miss later changes
+        _listdir_cache[path] = (mtime_ns, ls)
+    return list(ls)
 
 def insertModelArgSpect(params, param_name, param_value, param_type=None):
     ArgSpec = namedtuple('ArgSpec', ['name', 'default', 'type'])
@@ -763,6 +773,100 @@ def getTrackerArgSpec(trackerModule, realTime=False):
             track_params.append(param)
     return init_params, track_params
 
+PARAMS_MANIFEST_TYPES = {
+    'bool': bool, 'int': int, 'float': float, 'str': str, 
+    'NoneType': type(None), 'list': list, 'tuple': tuple, 'dict': dict,
+    'os.PathLike': os.PathLike
+}
+
+def read_params_manifest(module_folder_path):
+    """Parameters manifest (see `cellacdc.params_manifests`) in the folder 
+    of a model or tracker module. None if missing or not readable."""
+    manifest_path = os.path.join(module_folder_path, 'params_manifest.json')
+    if not os.path.exists(manifest_path):
+        return
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as json_file:
+            return json.load(json_file)
+    except Exception as e:
+        return
+
+def _params_manifest_to_ArgSpecs(params):
+    ArgSpec = namedtuple('ArgSpec', ['name', 'default', 'type', 'desc'])
+    ArgSpecs = []
+    for param in params:
+        _type = PARAMS_MANIFEST_TYPES[param['type']]
+        default = param['default']
+        if _type == tuple:
+            default = tuple(default)
+        ArgSpecs.append(ArgSpec(
+            name=param['name'], default=default, type=_type, 
+            desc=param.get('desc', '')
+        ))
+    return ArgSpecs
+
+def _get_model_folder_path(model_name):
+    model_folder_path = os.path.join(cellacdc_path, 'models', model_name)
+    if os.path.exists(model_folder_path):
+        return model_folder_path
+    cp = config.ConfigParser()
+    cp.read(models_list_file_path)
+    try:
+        return os.path.dirname(cp[model_name]['path'])
+    except KeyError:
+        return model_folder_path
+
+def get_model_params(model_name):
+    """Init and segment parameters (lists of ArgSpec) and help url of the 
+    model `model_name`.
+    
+    The parameters are read from the model's parameters manifest, so that 
+    the model module (and its deep learning framework) is not imported. 
+    Without a valid manifest the module is imported and inspected with 
+    `getModelArgSpec`.
+    """
+    manifest = read_params_manifest(_get_model_folder_path(model_name))
+    try:
+        init_params = _params_manifest_to_ArgSpecs(manifest['init'])
+        segment_params = _params_manifest_to_ArgSpecs(manifest['segment'])
+        return init_params, segment_params, manifest['url']
+    except Exception as e:
+        pass
+    
+    acdcSegment = import_segment_module(model_name)
+    init_params, segment_params = getModelArgSpec(acdcSegment)
+    try:
+        url = acdcSegment.url_help()
+    except AttributeError:
+        url = None
+    return init_params, segment_params, url
+
+def get_tracker_params(trackerName, realTime=False):
+    """Init and track (or track_frame if `realTime`) parameters (lists of 
+    ArgSpec) and help url of the tracker `trackerName`, from its parameters 
+    manifest if valid (see `get_model_params`)."""
+    tracker_folder_path = os.path.join(cellacdc_path, 'trackers', trackerName)
+    manifest = read_params_manifest(tracker_folder_path)
+    track_key = 'track_frame' if realTime else 'track'
+    try:
+        init_params = _params_manifest_to_ArgSpecs(manifest['init'])
+        track_params = _params_manifest_to_ArgSpecs(manifest[track_key])
+        return init_params, track_params, manifest['url']
+    except Exception as e:
+        pass
+
+    trackerModule = import_module(
+        f'trackers.{trackerName}.{trackerName}_tracker'
+    )
+    init_params, track_params = getTrackerArgSpec(
+        trackerModule, realTime=realTime
+    )
+    try:
+        url = trackerModule.url_help()
+    except AttributeError:
+        url = None
+    return init_params, track_params, url
+
 def getDefault_SegmInfo_df(posData, filename):
     mid_slice = int(posData.SizeZ/2)
     df = pd.DataFrame({
@@ -1202,8 +1306,12 @@ def imagej_tiffwriter(
     if data.dtype != np.uint8 and data.dtype != np.uint16:
         data = scale_float(data)
         data = skimage.img_as_uint(data)
-    with TiffWriter(new_path, bigtiff=True) as new_tif:
+    # Write to a sibling temp file and replace so that existing memory maps 
+    # of `new_path` (see `load.imread_tif`) keep pointing to the old data
+    temp_path = f'{new_path}.tmp'
+    with TiffWriter(temp_path, bigtiff=True) as new_tif:
         new_tif.save(data)
+    os.replace(temp_path, new_path)
 
 def from_lab_to_imagej_rois(lab, ImagejRoi, t=0, SizeT=1, max_ID=None):
     if max_ID is None:
@@ -1572,9 +1680,6 @@ def install_tensorflow():
     subprocess.check_call(args)
 
 def import_tracker(posData, trackerName, realTime=False, qparent=None):
-    trackerModule = import_module(
-        f'trackers.{trackerName}.{trackerName}_tracker'
-    )
     init_params = {}
     track_params = {}
     paramsWin = None
@@ -1606,14 +1711,10 @@ def import_tracker(posData, trackerName, realTime=False, qparent=None):
         if not paramsWin.cancel:
             init_params = paramsWin.params
     else:
-        init_argspecs, track_argspecs = getTrackerArgSpec(
-            trackerModule, realTime=realTime
+        init_argspecs, track_argspecs, url = get_tracker_params(
+            trackerName, realTime=realTime
         )
         if init_argspecs or track_argspecs:
-            try:
-                url = trackerModule.url_help()
-            except AttributeError:
-                url = None
             paramsWin = apps.QDialogTrackerParams(
                 init_argspecs, track_argspecs, trackerName, url=url,
                 channels=posData.chNames, 
@@ -1636,6 +1737,10 @@ def import_tracker(posData, trackerName, realTime=False, qparent=None):
         if paramsWin.cancel:
             return None, None
     
+    # Import the tracker module only when it is actually used
+    trackerModule = import_module(
+        f'trackers.{trackerName}.{trackerName}_tracker'
+    )
     tracker = trackerModule.tracker(**init_params)
     return tracker, track_params
 
@@ -0,0 +1,230 @@
+"""
+Generate the parameters manifests of the segmentation models and trackers.
+
+Every model (`models/<name>/acdcSegment.py`) and tracker
+(`trackers/<name>/<name>_tracker.py`) ships a `params_manifest.json` file with
+the names, defaults, types and descriptions of the parameters shown in the
+parameters dialogs. The GUI reads the manifest instead of importing the module
+(see `myutils.get_model_params` and `myutils.get_tracker_params`), so that
+TensorFlow, PyTorch etc. are imported only when the model or tracker runs.
+
+The manifests are generated from the source code with `ast`, without
+importing the modules, following the same rules of `myutils.getModelArgSpec`
+and `myutils.getTrackerArgSpec`. Regenerate them after changing the signature
+of a model or tracker with
+
+    python -m cellacdc.params_manifests
+
+and check that they are up-to-date with
+
+    python -m cellacdc.params_manifests --check
+"""
+import os
+import re
+import ast
+import sys
+import json
+import argparse
+
+cellacdc_path = os.path.dirname(os.path.abspath(__file__))
+models_path = os.path.join(cellacdc_path, 'models')
+trackers_path = os.path.join(cellacdc_path, 'trackers')
+
+params_manifest_filename = 'params_manifest.json'
+
+# Parameters of the tracking methods that are set by the GUI
+TRACKER_SKIP_PARAMS = ('signals', 'export_to')
+
+def _get_class_def(tree, class_name):
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef) and node.name == class_name:
+            return node
+
+def _get_function_def(node, func_name):
+    if node is None:
+        return
+    for child in node.body:
+        if isinstance(child, ast.FunctionDef) and child.name == func_name:
+            return child
+
+def _get_url_help(tree):
+    func_def = _get_function_def(tree, 'url_help')
+    if func_def is None:
+        return
+    for node in ast.walk(func_def):
+        if isinstance(node, ast.Return):
+            try:
+                return ast.literal_eval(node.value)
+            except ValueError:
+                return
+
+def _parse_params_descriptions(func_def):
+    """Descriptions of the parameters from the 'Parameters' section of a
+    numpydoc docstring"""
+    docstring = ast.get_docstring(func_def)
+    if not docstring:
+        return {}
+    match = re.search(
+        r'Parameters\n-+\n(.*?)(?:\n\s*\n[A-Z][a-z ]+\n-+\n|\Z)', docstring,
+        flags=re.S
+    )
+    if match is None:
+        return {}
+    descriptions = {}
+    name = None
+    for line in match.group(1).splitlines():
+        if line and not line[0].isspace():
+            name = line.split(':')[0].strip()
+            descriptions[name] = []
+        elif name is not None and line.strip():
+            descriptions[name].append(line.strip())
+    return {name: ' '.join(lines) for name, lines in descriptions.items()}
+
+def _get_params(
+        func_def, num_skip_args=1, use_type_hints=False, skip=()
+    ):
+    """Parameters of the function as list of dictionaries with keys 'name',
+    'default', 'type' and 'desc'. Only arguments with a default are
+    parameters."""
+    if func_def is None:
+        return []
+    args = func_def.args.args[num_skip_args:]
+    defaults = func_def.args.defaults
+    if len(defaults) > len(args):
+        defaults = defaults[len(defaults)-len(args):]
+    args = args[len(args)-len(defaults):]
+    descriptions = _parse_params_descriptions(func_def)
+    params = []
+    for arg, default_node in zip(args, defaults):
+        if arg.arg in skip:
+            continue
+        try:
+            default = ast.literal_eval(default_node)
+        except ValueError:
+            raise TypeError(
+                f'Default value of "{arg.arg}" in "{func_def.name}" '
+                f'is not a literal: "{ast.unparse(default_node)}"'
+            )
+        if use_type_hints and arg.annotation is not None:
+            _type = ast.unparse(arg.annotation)
+        else:
+            _type = type(default).__name__
+        params.append({
+            'name': arg.arg,
+            'default': default,
+            'type': _type,
+            'desc': descriptions.get(arg.arg, '')
+        })
+    return params
+
+def _get_public_methods(class_def):
+    return [
+        node.name for node in class_def.body
+        if isinstance(node, ast.FunctionDef) and not node.name.startswith('_')
+    ]
+
+def _parse(module_path):
+    with open(module_path, 'r', encoding='utf-8') as py_file:
+        return ast.parse(py_file.read(), filename=module_path)
+
+def generate_model_manifest(acdcSegment_path):
+    tree = _parse(acdcSegment_path)
+    class_def = _get_class_def(tree, 'Model')
+    if class_def is None:
+        raise TypeError(f'Missing "Model" class in "{acdcSegment_path}"')
+    return {
+        'init': _get_params(
+            _get_function_def(class_def, '__init__'), use_type_hints=True
+        ),
+        'segment': _get_params(
+            _get_function_def(class_def, 'segment'), num_skip_args=2
+        ),
+        'methods': _get_public_methods(class_def),
+        'url': _get_url_help(tree)
+    }
+
+def generate_tracker_manifest(tracker_path):
+    tree = _parse(tracker_path)
+    class_def = _get_class_def(tree, 'tracker')
+    if class_def is None:
+        raise TypeError(f'Missing "tracker" class in "{tracker_path}"')
+    manifest = {
+        'init': _get_params(
+            _get_function_def(class_def, '__init__'), use_type_hints=True
+        ),
+        'track': _get_params(
+            _get_function_def(class_def, 'track'), skip=TRACKER_SKIP_PARAMS
+        ),
+        'methods': _get_public_methods(class_def),
+        'url': _get_url_help(tree)
+    }
+    track_frame_def = _get_function_def(class_def, 'track_frame')
+    if track_frame_def is not None:
+        manifest['track_frame'] = _get_params(
+            track_frame_def, skip=TRACKER_SKIP_PARAMS
+        )
+    return manifest
+
+def iter_modules():
+    """Yield (manifest path, module path, generator function) of the
+    models and trackers shipped with Cell-ACDC"""
+    for name in sorted(os.listdir(models_path)):
+        module_path = os.path.join(models_path, name, 'acdcSegment.py')
+        if os.path.exists(module_path):
+            manifest_path = os.path.join(
+                models_path, name, params_manifest_filename
+            )
+            yield manifest_path, module_path, generate_model_manifest
+    for name in sorted(os.listdir(trackers_path)):
+        module_path = os.path.join(trackers_path, name, f'{name}_tracker.py')
+        if os.path.exists(module_path):
+            manifest_path = os.path.join(
+                trackers_path, name, params_manifest_filename
+            )
+            yield manifest_path, module_path, generate_tracker_manifest
+
+def _to_json(manifest):
+    return json.dumps(manifest, indent=4) + '\n'
+
+def write_manifests():
+    for manifest_path, module_path, generate_manifest in iter_modules():
+        with open(manifest_path, 'w', encoding='utf-8') as json_file:
+            json_file.write(_to_json(generate_manifest(module_path)))
+        print(f'Written "{os.path.relpath(manifest_path, cellacdc_path)}"')
+
+def get_outdated_manifests():
+    """Relative paths of the manifests that are missing or not matching the
+    source code"""
+    outdated = []
+    for manifest_path, module_path, generate_manifest in iter_modules():
+        expected = _to_json(generate_manifest(module_path))
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as json_file:
+                is_outdated = json_file.read() != expected
+        except FileNotFoundError:
+            is_outdated = True
+        if is_outdated:
+            outdated.append(os.path.relpath(manifest_path, cellacdc_path))
+    return outdated
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Generate the parameters manifests of models and trackers'
+    )
+    parser.add_argument(
+        '--check', action='store_true',
+        help='Only check that the manifests are up-to-date'
+    )
+    args = parser.parse_args()
+    if not args.check:
+        write_manifests()
+        return
+
+    outdated = get_outdated_manifests()
+    for manifest_path in outdated:
+        print(f'Outdated parameters manifest: "{manifest_path}"')
+    if outdated:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -29,7 +29,7 @@ from PyQt5 import QtGui
 
 # Custom modules
 from . import prompts, load, myutils, apps, core, dataPrep, widgets
-from . import qrc_resources, html_utils, printl
+from . import qrc_resources, html_utils, printl, model_server
 
 if os.name == 'nt':
     try:
@@ -156,10 +156,7 @@ class segmWorker(QRunnable):
             self.signals.progress.emit(
                 f'Loading second channel "{self.secondChannelName}"...'
             )
-            secondChFilePath = load.get_filename_from_channel(
-                posData.images_path, self.secondChannelName
-            )
-            secondChImgData = load.load_image_file(secondChFilePath)
+            secondChImgData = posData.loadChannelData(self.secondChannelName)
 
         if posData.SizeT > 1:
             self.t0 = 0
@@ -228,25 +225,30 @@ class segmWorker(QRunnable):
                         second_ch_data = second_ch_data[:, :, y0:y1, x0:x1]
                     pad_info = ((0, 0), (y0, Y-y1), (x0, X-x1))
         else:
+            # Single timepoint: read the whole image (views of dataPrep
+            # virtual mode are aligned and cropped here)
+            pos_img_data = np.asarray(posData.img_data)
+            if self.secondChannelName is not None:
+                secondChImgData = np.asarray(secondChImgData)
             if posData.SizeZ > 1 and not self.isSegm3D:
                 # 2D segmentation on single 3D image
                 z_info = posData.segmInfo_df.loc[posData.filename].iloc[0]
                 z = z_info.z_slice_used_dataPrep
                 zProjHow = z_info.which_z_proj
                 if zProjHow == 'single z-slice':
-                    img_data = posData.img_data[z]
+                    img_data = pos_img_data[z]
                     if self.secondChannelName is not None:
                         second_ch_data = secondChImgData[z]
                 elif zProjHow == 'max z-projection':
-                    img_data = posData.img_data.max(axis=0)
+                    img_data = pos_img_data.max(axis=0)
                     if self.secondChannelName is not None:
                         second_ch_data = secondChImgData.max(axis=0)
                 elif zProjHow == 'mean z-projection':
-                    img_data = posData.img_data.mean(axis=0)
+                    img_data = pos_img_data.mean(axis=0)
                     if self.secondChannelName is not None:
                         second_ch_data = secondChImgData.mean(axis=0)
                 elif zProjHow == 'median z-proj.':
-                    img_data = np.median(posData.img_data, axis=0)
+                    img_data = np.median(pos_img_data, axis=0)
                     if self.secondChannelName is not None:
                         second_ch_data[i] = np.median(secondChImgData, axis=0)
                 if isROIactive:
@@ -255,7 +257,7 @@ class segmWorker(QRunnable):
                     img_data = img_data[:, y0:y1, x0:x1]
             elif posData.SizeZ > 1 and self.isSegm3D:
                 # 3D segmentation on 3D z-stack
-                img_data = posData.img_data
+                img_data = pos_img_data
                 if self.secondChannelName is not None:
                     second_ch_data = secondChImgData
                 if isROIactive:
@@ -266,7 +268,7 @@ class segmWorker(QRunnable):
                         second_ch_data = second_ch_data[:, y0:y1, x0:x1]
             else:
                 # Single 2D image
-                img_data = posData.img_data
+                img_data = pos_img_data
                 if self.secondChannelName is not None:
                    second_ch_data = secondChImgData
                 if isROIactive:
@@ -280,6 +282,8 @@ class segmWorker(QRunnable):
 
         """Segmentation routine"""
         self.signals.progress.emit(f'Segmenting with {self.model_name}...')
+        if hasattr(self.model, 'set_diameter_cache_key'):
+            self.model.set_diameter_cache_key(posData.pos_path, user_ch_name)
         t0 = time.time()
         # self.signals.progress.emit(f'Segmenting with {model} (Ctrl+C to abort)...')
         if posData.SizeT > 1:
@@ -287,13 +291,11 @@ class segmWorker(QRunnable):
                 self.signals.resetInnerPbar.emit(len(img_data))
 
             if self.is_segment3DT_available:
-                self.segment2D_kwargs['signals'] = (
-                    self.signals, self.innerPbar_available
-                )
+                signals = (self.signals, self.innerPbar_available)
                 if self.secondChannelName is not None:
                     img_data = self.model.to_rgb_stack(img_data, second_ch_data)
                 lab_stack = self.model.segment3DT(
-                    img_data, **self.segment2D_kwargs
+                    img_data, signals=signals, **self.segment2D_kwargs
                 )
                 if self.innerPbar_available:
                     # emit one pos done
@@ -335,13 +337,25 @@ class segmWorker(QRunnable):
             self.signals.progressBar.emit(1)
             # lab_stack = core.smooth_contours(lab_stack, radius=2)
 
+        stitch_IoU = self.removeArtefactsKwargs.get('stitch_3D_min_IoU')
+        doStitch3D = (
+            self.applyPostProcessing and stitch_IoU and self.isSegm3D
+            and posData.SizeZ > 1
+        )
+        if doStitch3D:
+            self.signals.progress.emit('Stitching z-slices labels...')
+            if posData.SizeT > 1:
+                lab_stack = core.label_3d_segm_frames(
+                    lab_stack, IoU_thresh=stitch_IoU
+                )
+            else:
+                lab_stack = core.label_3d_segm(lab_stack, IoU_thresh=stitch_IoU)
+
         if self.applyPostProcessing:
             if posData.SizeT > 1:
-                for t, lab in enumerate(lab_stack):
-                    lab_cleaned = core.remove_artefacts(
-                        lab, **self.removeArtefactsKwargs
-                    )
-                    lab_stack[t] = lab_cleaned
+                lab_stack = core.remove_artefacts_frames(
+                    lab_stack, **self.removeArtefactsKwargs
+                )
             else:
                 lab_stack = core.remove_artefacts(
                     lab_stack, **self.removeArtefactsKwargs
@@ -750,19 +764,11 @@ class segmWin(QMainWindow):
                 self.close()
                 return
         
-        self.log(f'Importing {model_name}...')
         self.model_name = model_name
-        acdcSegment = myutils.import_segment_module(model_name)
-        self.acdcSegment =  acdcSegment
-
-        # Read all models parameters
-        init_params, segment_params = myutils.getModelArgSpec(self.acdcSegment)
 
-        # Prompt user to enter the model parameters
-        try:
-            url = acdcSegment.url_help()
-        except AttributeError:
-            url = None
+        # Read all models parameters from the manifest (the model module 
+        # is imported only when the model is initialized)
+        init_params, segment_params, url = myutils.get_model_params(model_name)
 
         _SizeZ = None
         if self.isSegm3D:
@@ -792,7 +798,8 @@ class segmWin(QMainWindow):
         init_kwargs = win.init_kwargs
 
         # Initialize model
-        self.model = acdcSegment.Model(**init_kwargs)
+        self.log(f'Importing {model_name}...')
+        self.model = model_server.init_model(model_name, init_kwargs)
         try:
             self.model.setupLogger(self.logger)
         except Exception as e:
@@ -802,9 +809,7 @@ class segmWin(QMainWindow):
 
         self.is_segment3DT_available = False
         if posData.SizeT>1 and not self.isSegm3D:
-            self.is_segment3DT_available = any(
-                [name=='segment3DT' for name in dir(acdcSegment.Model)]
-            )
+            self.is_segment3DT_available = hasattr(self.model, 'segment3DT')
 
         self.innerPbar_available = False
         if len(user_ch_file_paths)>1 and posData.SizeT>1:
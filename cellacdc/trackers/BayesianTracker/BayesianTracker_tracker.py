@@ -8,10 +8,77 @@ import pandas as pd
 import btrack
 from btrack.constants import BayesianUpdates
 
-from skimage.measure import regionprops
+from tqdm import tqdm
+
+from cellacdc import core
+
 from ..CellACDC import CellACDC_tracker
 
-from tqdm import tqdm
+TRACKS_TABLE_COLUMNS = ('t', 'ID', 'y', 'x', 'z')
+
+def _tracks_to_table(tracks):
+    """Flatten all the btrack tracks into one columnar table with 
+    one row per (t, track ID) and the y, x, z coordinates.
+    """
+    columns = {col: [] for col in TRACKS_TABLE_COLUMNS}
+    for track in tracks:
+        t = np.asarray(track.t, dtype=int)
+        columns['t'].append(t)
+        columns['ID'].append(np.full(len(t), track.ID, dtype=int))
+        columns['y'].append(np.asarray(track.y, dtype=float))
+        columns['x'].append(np.asarray(track.x, dtype=float))
+        columns['z'].append(np.asarray(track.z, dtype=float))
+    if not tracks:
+        return pd.DataFrame({col: [] for col in TRACKS_TABLE_COLUMNS})
+    table = {col: np.concatenate(arrays) for col, arrays in columns.items()}
+    return pd.DataFrame(table)
+
+def _group_table_by_frame(tracks_table, num_frames):
+    """Split the tracks table into one {column: array} dict per frame. 
+    Within a frame the rows keep the order of the tracks.
+    """
+    tracks_table = tracks_table.sort_values('t', kind='stable')
+    t = tracks_table['t'].to_numpy()
+    bounds = np.searchsorted(t, np.arange(num_frames+1))
+    arrays = {col: tracks_table[col].to_numpy() for col in tracks_table}
+    frames_tracks = []
+    for frame_i in range(num_frames):
+        start, end = bounds[frame_i], bounds[frame_i+1]
+        frames_tracks.append(
+            {col: values[start:end] for col, values in arrays.items()}
+        )
+    return frames_tracks
+
+def _relabel_frame(lab, frame_tracks):
+    """Replace the IDs of `lab` with the IDs of the tracks passing through 
+    each object (see `CellACDC_tracker.indexAssignmentLUT`).
+
+    Returns the relabelled frame and the (old_IDs, tracked_IDs) mapping.
+    """
+    IDs_curr_untracked = core._get_IDs(lab)
+    if len(IDs_curr_untracked) == 0:
+        # No cells segmented
+        return lab.copy(), [], []
+    
+    coords = [frame_tracks['y'], frame_tracks['x']]
+    if lab.ndim == 3:
+        coords.insert(0, frame_tracks['z'])
+    coords = [c.astype(int) for c in coords]
+    # btrack sometimes finds cells that are not existing --> skip them
+    is_valid = np.ones(len(coords[0]), dtype=bool)
+    for c, size in zip(coords, lab.shape):
+        is_valid &= (c >= 0) & (c < size)
+    coords = tuple(c[is_valid] for c in coords)
+    old_IDs = lab[coords]
+    tracked_IDs = frame_tracks['ID'][is_valid]
+    if len(tracked_IDs) == 0:
+        # No cells tracked
+        return lab.copy(), [], []
+    
+    tracked_lab = CellACDC_tracker.indexAssignmentLUT(
+        lab, old_IDs, tracked_IDs, IDs_curr_untracked=IDs_curr_untracked
+    )
+    return tracked_lab, old_IDs, tracked_IDs
 
 class tracker:
     def __init__(self, **params):
@@ -85,60 +152,30 @@ class tracker:
         if signals is not None:
             signals.progress.emit('Applying BayesianTracker tracks...')
 
+        tracks_table = _tracks_to_table(tracks)
+        frames_tracks = _group_table_by_frame(tracks_table, len(segm_video))
+
         # Label the segm_video according to tracks
         tracked_video = np.zeros_like(segm_video)
-        for frame_i, lab in enumerate(tqdm(segm_video, ncols=100)):
-            if frame_i == 0:
-                tracked_video[frame_i] = lab
-                continue
-
-            rp = regionprops(lab.copy())
-            IDs_curr_untracked = [obj.label for obj in rp]
-            if not IDs_curr_untracked:
-                # No cells segmented
-                continue
-
-            old_IDs = []
-            tracked_IDs = []
-            for track in tracks:
-                track_dict = track.to_dict()
-                if frame_i not in track_dict['t']:
-                    continue
-
-                df = pd.DataFrame(track.to_dict()).set_index('t').loc[frame_i]
-
-                yc, xc = df['y'], df['x']
-                try:
-                    old_ID = lab[int(yc), int(xc)]
-                except Exception as e:
-                    # btrack sometimes finds cells that are not existing
-                    # skip them
-                    # traceback.print_exc()
-                    continue
-
-                old_IDs.append(old_ID)
-                tracked_IDs.append(df['ID'])
-
-            if not tracked_IDs:
-                # No cells tracked
-                continue
-
-            uniqueID = max((max(tracked_IDs), max(IDs_curr_untracked)))+1
-
-            if verbose:
+        tracked_video[0] = segm_video[0]
+        _map = core._map_frames(
+            lambda i: _relabel_frame(segm_video[i+1], frames_tracks[i+1]), 
+            len(segm_video)-1
+        )
+        pbar = tqdm(total=len(segm_video)-1, ncols=100)
+        for i, (tracked_lab, old_IDs, tracked_IDs) in _map:
+            frame_i = i+1
+            tracked_video[frame_i] = tracked_lab
+            if verbose and len(tracked_IDs) > 0:
                 print('-------------------------')
                 print(f'Tracking frame n. {frame_i+1}')
                 for old_ID, tracked_ID in zip(old_IDs, tracked_IDs):
                     print(f'Tracking ID {old_ID} --> {tracked_ID}')
                 print('-------------------------')
-
-            tracked_lab = CellACDC_tracker.indexAssignment(
-                old_IDs, tracked_IDs, IDs_curr_untracked,
-                lab.copy(), rp, uniqueID
-            )
-            tracked_video[frame_i] = tracked_lab
+            pbar.update()
             if signals is not None:
                 signals.progressBar.emit(1)
+        pbar.close()
 
         return tracked_video
 
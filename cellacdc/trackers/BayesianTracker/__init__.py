@@ -8,7 +8,6 @@ try:
     minor = version.split('.')[1]
     if int(minor) < 5:
         INSTALL_BTRACK = True
-    import pdb; pdb.set_trace()
 except Exception as e:
     INSTALL_BTRACK = True
 
@@ -121,6 +121,47 @@ def indexAssignment(
         print('='*30)
     return tracked_lab
 
+def indexAssignmentLUT(
+        lab, old_IDs, tracked_IDs, IDs_curr_untracked=None, uniqueID=None,
+        return_lut=False
+    ):
+    """Vectorized version of `indexAssignment` (with unique new IDs) that 
+    relabels `lab` in one pass with a look-up table. If an old ID appears 
+    more than once the first tracked ID wins. New IDs start from `uniqueID` 
+    (default max of current and tracked IDs + 1). 
+    
+    Like `indexAssignment` (and `track_frame`), new IDs are assigned also 
+    when nothing is tracked (empty `tracked_IDs`). Callers that must 
+    leave such frames untouched have to check it before calling this 
+    function (see `BayesianTracker_tracker._relabel_frame`). Returns a new 
+    array (and the look-up table if `return_lut` is True).
+    """
+    if IDs_curr_untracked is None:
+        IDs_curr_untracked = core._get_IDs(lab)
+    IDs_curr_untracked = np.asarray(IDs_curr_untracked, dtype=np.int64)
+    old_IDs = np.asarray(old_IDs, dtype=np.int64)
+    tracked_IDs = np.asarray(tracked_IDs, dtype=np.int64)
+    maxID = IDs_curr_untracked.max(initial=0)
+    lut = np.arange(maxID+1, dtype=np.int64)
+    if len(IDs_curr_untracked) == 0:
+        return (lab.copy(), lut) if return_lut else lab.copy()
+    
+    if uniqueID is None:
+        uniqueID = max(tracked_IDs.max(initial=0), maxID) + 1
+    new_untracked_IDs = np.setdiff1d(IDs_curr_untracked, old_IDs)
+    lut[new_untracked_IDs] = uniqueID + np.arange(len(new_untracked_IDs))
+
+    _, first_idx = np.unique(old_IDs, return_index=True)
+    first_idx = first_idx[
+        (old_IDs[first_idx] > 0) & (old_IDs[first_idx] <= maxID)
+    ]
+    lut[old_IDs[first_idx]] = tracked_IDs[first_idx]
+    if np.issubdtype(lab.dtype, np.integer):
+        if lut.max() <= np.iinfo(lab.dtype).max:
+            lut = lut.astype(lab.dtype)
+    tracked_lab = lut[lab].astype(lab.dtype, copy=False)
+    return (tracked_lab, lut) if return_lut else tracked_lab
+
 def track_frame(
         prev_lab, prev_rp, lab, rp, IDs_curr_untracked=None,
         uniqueID=None, setBrushID_func=None, posData=None,
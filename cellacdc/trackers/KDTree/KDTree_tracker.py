@@ -0,0 +1,307 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import scipy.spatial
+import scipy.sparse
+import scipy.sparse.csgraph
+
+from tqdm import tqdm
+
+from ..CellACDC import CellACDC_tracker
+
+def get_objs_features(lab):
+    """IDs, areas and centroids (N, ndim) of the objects in `lab` computed
+    in one pass over the foreground pixels with np.bincount.
+    """
+    lab_flat = lab.ravel()
+    fg_idx = np.flatnonzero(lab_flat)
+    fg_IDs = lab_flat[fg_idx].astype(np.int64)
+    areas = np.bincount(fg_IDs)
+    IDs = np.nonzero(areas)[0]
+    areas = areas[IDs]
+    centroids = np.column_stack([
+        np.bincount(fg_IDs, weights=axis_coords)[IDs]/areas
+        for axis_coords in np.unravel_index(fg_idx, lab.shape)
+    ]) if len(IDs) > 0 else np.zeros((0, lab.ndim))
+    return IDs, areas, centroids
+
+def get_overlaps(prev_lab, lab):
+    """Overlap area of every pair of overlapping objects (prev ID, curr ID)
+    from the joint histogram of the two frames.
+    """
+    prev_flat = prev_lab.ravel()
+    curr_flat = lab.ravel()
+    is_overlap = (prev_flat > 0) & (curr_flat > 0)
+    prev_flat = prev_flat[is_overlap].astype(np.int64)
+    curr_flat = curr_flat[is_overlap].astype(np.int64)
+    num_curr_IDs = curr_flat.max(initial=0) + 1
+    keys = prev_flat*num_curr_IDs + curr_flat
+    keys, overlaps = np.unique(keys, return_counts=True)
+    return keys // num_curr_IDs, keys % num_curr_IDs, overlaps
+
+def _lookup_pairs(pairs_a, pairs_b, num_b, query_a, query_b, values):
+    """Value of each (query_a, query_b) pair in the sparse table
+    (pairs_a, pairs_b, values), 0 where the pair is missing."""
+    keys = pairs_a*num_b + pairs_b
+    query_keys = query_a*num_b + query_b
+    idx = np.searchsorted(keys, query_keys)
+    idx = np.clip(idx, 0, max(len(keys)-1, 0))
+    found = np.zeros(len(query_keys), dtype=bool)
+    if len(keys) > 0:
+        found = keys[idx] == query_keys
+    out = np.zeros(len(query_keys), dtype=values.dtype)
+    out[found] = values[idx[found]]
+    return out
+
+def match_objects(
+        prev_lab, lab, max_distance=20.0, max_area_ratio=2.0,
+        detect_divisions=True, prev_features=None, features=None
+    ):
+    """Match the objects of `lab` to the objects of `prev_lab`.
+
+    Candidate pairs are the objects whose centroids are closer than
+    `max_distance` (KD-tree neighbour query) and whose area ratio is
+    not larger than `max_area_ratio`. The cost of a candidate pair is the
+    normalized centroid distance plus (1 - IoU), and the assignment is
+    solved on the sparse cost matrix. Every object can also stay unmatched
+    (new object) at a cost higher than any candidate pair.
+
+    Unmatched objects that lie mostly (>= 50% of their area) inside a
+    previous object are daughters of that object if the total area of
+    the daughters is compatible with `max_area_ratio`. If the parent was
+    not matched, the daughter with the largest overlap inherits its ID.
+
+    The output of `get_objs_features` for the two frames can be passed as
+    `prev_features` and `features` to avoid recomputing it.
+
+    Returns
+    -------
+    tuple
+        (old_IDs, tracked_IDs, divisions) where `divisions` is a list
+        of (parent_ID, [daughter IDs in `lab`]).
+    """
+    if prev_features is None:
+        prev_features = get_objs_features(prev_lab)
+    if features is None:
+        features = get_objs_features(lab)
+    prev_IDs, prev_areas, prev_centroids = prev_features
+    IDs, areas, centroids = features
+    if len(IDs) == 0 or len(prev_IDs) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int), []
+
+    # Candidate pairs from KD-tree neighbour queries
+    curr_tree = scipy.spatial.cKDTree(centroids)
+    prev_tree = scipy.spatial.cKDTree(prev_centroids)
+    pairs = curr_tree.sparse_distance_matrix(
+        prev_tree, max_distance, output_type='ndarray'
+    )
+    i, j, dist = pairs['i'], pairs['j'], pairs['v']
+
+    # Area gating
+    area_ratio = (
+        np.maximum(areas[i], prev_areas[j])/np.minimum(areas[i], prev_areas[j])
+    )
+    is_valid = area_ratio <= max_area_ratio
+    i, j, dist = i[is_valid], j[is_valid], dist[is_valid]
+
+    # Overlap (IoU) of the candidate pairs
+    ov_prev, ov_curr, overlaps = get_overlaps(prev_lab, lab)
+    prev_idx = np.searchsorted(prev_IDs, ov_prev)
+    curr_idx = np.searchsorted(IDs, ov_curr)
+    num_curr = len(IDs)
+    order = np.argsort(prev_idx*num_curr + curr_idx)
+    prev_idx, curr_idx, overlaps = (
+        prev_idx[order], curr_idx[order], overlaps[order]
+    )
+    intersection = _lookup_pairs(
+        prev_idx, curr_idx, num_curr, j, i, overlaps
+    )
+    IoU = intersection/(areas[i] + prev_areas[j] - intersection)
+
+    # Sparse assignment. Columns are the previous objects plus one dummy
+    # "new object" column per current object, so that a full matching of
+    # the current objects always exists. +1 because zeros are not edges
+    cost = dist/max_distance + (1 - IoU) + 1
+    unmatched_cost = 3 + 1
+    num_prev = len(prev_IDs)
+    rows = np.concatenate((i, np.arange(num_curr)))
+    cols = np.concatenate((j, num_prev + np.arange(num_curr)))
+    weights = np.concatenate((cost, np.full(num_curr, unmatched_cost)))
+    biadjacency = scipy.sparse.csr_matrix(
+        (weights, (rows, cols)), shape=(num_curr, num_prev+num_curr)
+    )
+    row_ind, col_ind = scipy.sparse.csgraph.min_weight_full_bipartite_matching(
+        biadjacency
+    )
+    is_matched = col_ind < num_prev
+    matched_curr = row_ind[is_matched]
+    matched_prev = col_ind[is_matched]
+
+    old_IDs = IDs[matched_curr]
+    tracked_IDs = prev_IDs[matched_prev]
+    divisions = []
+    if not detect_divisions:
+        return old_IDs, tracked_IDs, divisions
+
+    # Division detection on the unmatched objects
+    curr_to_prev = np.full(num_curr, -1)
+    curr_to_prev[matched_curr] = matched_prev
+    prev_to_curr = np.full(num_prev, -1)
+    prev_to_curr[matched_prev] = matched_curr
+    is_unmatched = curr_to_prev == -1
+    if not np.any(is_unmatched) or len(overlaps) == 0:
+        return old_IDs, tracked_IDs, divisions
+
+    # Parent of each unmatched object is the previous object covering it most
+    IoA = overlaps/areas[curr_idx]
+    is_candidate = is_unmatched[curr_idx] & (IoA >= 0.5)
+    cand_curr, cand_prev = curr_idx[is_candidate], prev_idx[is_candidate]
+    cand_overlap = overlaps[is_candidate]
+    order = np.lexsort((-cand_overlap, cand_curr))
+    cand_curr, cand_prev = cand_curr[order], cand_prev[order]
+    cand_overlap = cand_overlap[order]
+    is_first = np.ones(len(cand_curr), dtype=bool)
+    is_first[1:] = cand_curr[1:] != cand_curr[:-1]
+    daughters, parents = cand_curr[is_first], cand_prev[is_first]
+    daughters_overlap = cand_overlap[is_first]
+
+    new_old_IDs, new_tracked_IDs = [], []
+    for parent in np.unique(parents):
+        is_parent = parents == parent
+        parent_daughters = daughters[is_parent]
+        matched_daughter = prev_to_curr[parent]
+        if matched_daughter == -1:
+            # Parent lost: the daughter with largest overlap inherits its ID
+            inheriting = parent_daughters[
+                np.argmax(daughters_overlap[is_parent])
+            ]
+            new_old_IDs.append(IDs[inheriting])
+            new_tracked_IDs.append(prev_IDs[parent])
+            all_daughters = parent_daughters
+        else:
+            all_daughters = np.append(parent_daughters, matched_daughter)
+
+        if len(all_daughters) < 2:
+            continue
+
+        tot_area = areas[all_daughters].sum()
+        parent_area = prev_areas[parent]
+        ratio = max(tot_area, parent_area)/min(tot_area, parent_area)
+        if ratio > max_area_ratio:
+            continue
+
+        divisions.append((prev_IDs[parent], list(IDs[all_daughters])))
+
+    old_IDs = np.concatenate((old_IDs, new_old_IDs)).astype(np.int64)
+    tracked_IDs = np.concatenate((tracked_IDs, new_tracked_IDs)).astype(np.int64)
+    return old_IDs, tracked_IDs, divisions
+
+class tracker:
+    def __init__(self):
+        self.divisions = []
+
+    def _track_frame(
+            self, prev_lab, lab, max_distance=20.0, max_area_ratio=2.0,
+            detect_divisions=True, uniqueID=None, prev_features=None
+        ):
+        """Track `lab` and return it together with the detected divisions
+        as (parent_ID, [tracked daughter IDs]) and the features of the
+        tracked frame (see `get_objs_features`)."""
+        features = get_objs_features(lab)
+        if len(features[0]) == 0:
+            # Skip empty frames
+            return lab, [], features
+
+        old_IDs, tracked_IDs, divisions = match_objects(
+            prev_lab, lab, max_distance=max_distance,
+            max_area_ratio=max_area_ratio, detect_divisions=detect_divisions,
+            prev_features=prev_features, features=features
+        )
+        if uniqueID is None:
+            uniqueID = max(prev_lab.max(), lab.max()) + 1
+        tracked_lab, lut = CellACDC_tracker.indexAssignmentLUT(
+            lab, old_IDs, tracked_IDs, IDs_curr_untracked=features[0],
+            uniqueID=uniqueID, return_lut=True
+        )
+        divisions = [
+            (parent_ID, lut[daughters].tolist())
+            for parent_ID, daughters in divisions
+        ]
+        # Tracked features sorted by the new IDs
+        IDs, areas, centroids = features
+        tracked_IDs = lut[IDs]
+        order = np.argsort(tracked_IDs)
+        features = (tracked_IDs[order], areas[order], centroids[order])
+        return tracked_lab, divisions, features
+
+    def track_frame(
+            self, prev_lab, lab, max_distance=20.0, max_area_ratio=2.0,
+            detect_divisions=True
+        ):
+        """Track the objects of `lab` to the objects of `prev_lab`.
+
+        Parameters
+        ----------
+        max_distance : float
+            Maximum distance in pixels between the centroids of the same 
+            object in consecutive frames.
+        max_area_ratio : float
+            Maximum ratio between the areas of the same object in 
+            consecutive frames.
+        detect_divisions : bool
+            If True, new objects lying mostly inside a previous object are 
+            detected as daughters of that object.
+        """
+        tracked_lab, _, _ = self._track_frame(
+            prev_lab, lab, max_distance=max_distance,
+            max_area_ratio=max_area_ratio, detect_divisions=detect_divisions
+        )
+        return tracked_lab
+
+    def track(
+            self, segm_video, max_distance=20.0, max_area_ratio=2.0,
+            detect_divisions=True, export_to_extension='.csv', signals=None,
+            export_to: os.PathLike=None
+        ):
+        """Track all the frames of `segm_video`. See `track_frame` for the 
+        parameters. Detected divisions are stored in `self.divisions` and 
+        saved to `export_to` if not None.
+        """
+        tracked_video = np.zeros_like(segm_video)
+        tracked_video[0] = segm_video[0]
+        # Never reuse the IDs of objects that disappeared in previous frames
+        uniqueID = segm_video[0].max() + 1
+        self.divisions = []
+        prev_features = get_objs_features(segm_video[0])
+        for frame_i in tqdm(range(1, len(segm_video)), ncols=100):
+            lab = segm_video[frame_i]
+            uniqueID = max(uniqueID, lab.max() + 1)
+            tracked_lab, divisions, prev_features = self._track_frame(
+                tracked_video[frame_i-1], lab, max_distance=max_distance,
+                max_area_ratio=max_area_ratio,
+                detect_divisions=detect_divisions, uniqueID=uniqueID,
+                prev_features=prev_features
+            )
+            tracked_video[frame_i] = tracked_lab
+            uniqueID = max(uniqueID, tracked_lab.max() + 1)
+            for parent_ID, daughter_IDs in divisions:
+                for daughter_ID in daughter_IDs:
+                    self.divisions.append((frame_i, parent_ID, daughter_ID))
+            if signals is not None:
+                signals.progressBar.emit(1)
+
+        if export_to is not None:
+            self.divisions_df().to_csv(export_to, index=False)
+        return tracked_video
+
+    def divisions_df(self):
+        """Divisions detected by the last `track` call as a table with
+        columns 'frame_i', 'parent_ID' and 'daughter_ID'."""
+        return pd.DataFrame(
+            self.divisions, columns=['frame_i', 'parent_ID', 'daughter_ID']
+        )
+
+    def save_output(self):
+        pass
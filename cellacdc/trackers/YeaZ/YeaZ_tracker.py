@@ -7,9 +7,11 @@ class tracker:
     def __init__(self):
         pass
 
-    def track(self, segm_video, signals=None):
+    def track(self, segm_video, max_distance=0.0, signals=None):
+        # max_distance = 0 means no cutoff on the centroids distance
+        max_dist = max_distance if max_distance > 0 else None
         tracked_stack = tracking.correspondence_stack(
-            segm_video, signals=signals
+            segm_video, signals=signals, max_dist=max_dist
         ).astype(np.uint32)
         return tracked_stack
 
@@ -3,8 +3,6 @@ import sys
 import time
 import numpy as np
 import pandas as pd
-from sklearn.preprocessing import scale
-from sklearn.metrics.pairwise import euclidean_distances
 from scipy.optimize import linear_sum_assignment
 from tqdm import tqdm
 from skimage.measure import regionprops
@@ -12,40 +10,102 @@ from skimage.segmentation import relabel_sequential
 from math import sqrt
 
 from ..CellACDC import CellACDC_tracker
+from cellacdc import core
 
 try:
     from munkres import Munkres
 except ModuleNotFoundError as e:
     pass
 
-def correspondence(prev, curr, use_scipy=True, use_modified_yeaz=True):
+def correspondence(
+        prev, curr, use_scipy=True, use_modified_yeaz=True, max_dist=None,
+        prev_feat=None, return_feat=False
+    ):
     """
     source: YeaZ modified by Cell-ACDC developers
     scipy.optimize.linear_sum_assignment instead of munkres library
+
+    With `use_scipy` and `use_modified_yeaz` the features of all cells are 
+    computed in one pass (see `get_features_table`) and cells whose centroids 
+    are farther than `max_dist` pixels are never matched. `prev_feat` can 
+    be passed to avoid recomputing the features of `prev`, and with 
+    `return_feat` the features of the tracked frame are returned too.
     """
-    if not np.any(curr):
+    if not use_scipy or not use_modified_yeaz:
+        if not np.any(curr):
+            # Skip empty frames
+            return curr
+        if use_scipy:
+            hu_dict = scipy_align(prev, curr, acdc_yeaz=use_modified_yeaz)
+        else:
+            hu_dict = hungarian_align(prev, curr, acdc_yeaz=use_modified_yeaz)
+        IDs_prev = core._get_IDs(prev)
+        IDs_curr_untracked = core._get_IDs(curr)
+        uniqueID = max(IDs_prev.max(initial=0), IDs_curr_untracked.max()) + 1
+        return CellACDC_tracker.indexAssignmentLUT(
+            curr, list(hu_dict.keys()), list(hu_dict.values()), 
+            IDs_curr_untracked=IDs_curr_untracked, uniqueID=uniqueID
+        )
+    
+    if prev_feat is None:
+        prev_feat = get_features_table(prev)
+    curr_feat = get_features_table(curr)
+    if len(curr_feat) == 0 or len(prev_feat) == 0:
         # Skip empty frames
-        return curr
-
-    if use_scipy:
-        hu_dict = scipy_align(prev, curr, acdc_yeaz=use_modified_yeaz)
-    else:
-        hu_dict = hungarian_align(prev, curr, acdc_yeaz=use_modified_yeaz)
-    rp = regionprops(curr)
-    tracked_IDs = [val for val in hu_dict.values()]
-    old_IDs = [key for key in hu_dict.keys()]
-    IDs_curr_untracked = [obj.label for obj in regionprops(curr)]
-    IDs_prev = [obj.label for obj in regionprops(prev)]
-    if IDs_prev or IDs_curr_untracked:
-        uniqueID = max((max(IDs_prev), max(IDs_curr_untracked)))+1
-    else:
-        uniqueID = 1
+        return (curr.copy(), curr_feat) if return_feat else curr.copy()
 
-    tracked_lab = CellACDC_tracker.indexAssignment(
-        old_IDs, tracked_IDs, IDs_curr_untracked,
-        curr.copy(), rp, uniqueID
+    old_IDs, tracked_IDs = align_features(
+        prev_feat, curr_feat, max_dist=max_dist
     )
-    return tracked_lab
+    IDs_curr_untracked = curr_feat['cell'].to_numpy()
+    uniqueID = max(prev_feat['cell'].max(), IDs_curr_untracked.max()) + 1
+    tracked_lab, lut = CellACDC_tracker.indexAssignmentLUT(
+        curr, old_IDs, tracked_IDs, IDs_curr_untracked=IDs_curr_untracked,
+        uniqueID=uniqueID, return_lut=True
+    )
+    if not return_feat:
+        return tracked_lab
+    
+    curr_feat['cell'] = lut[IDs_curr_untracked]
+    return tracked_lab, curr_feat
+
+def align_features(feat1, feat2, max_dist=None, weight_com=3):
+    """
+    Hungarian assignment (scipy) of the cells in feat2 (current frame) to 
+    the cells in feat1 (previous frame) using the features distance as cost.
+    Pairs whose centroids are farther than `max_dist` pixels are pruned: 
+    cells without candidates are left out of the assignment and forbidden 
+    pairs are never returned.
+
+    Returns the arrays (cells in feat2, matched cells in feat1).
+    """
+    dist = features_distance(feat1, feat2, weight_com=weight_com)
+    rows = np.arange(len(feat1))
+    cols = np.arange(len(feat2))
+    if max_dist:
+        com_cols = get_com_cols(feat1)
+        com1 = feat1[com_cols].to_numpy()
+        com2 = feat2[com_cols].to_numpy()
+        com_dist = np.sqrt(
+            np.square(com1[:, np.newaxis] - com2[np.newaxis]).sum(axis=-1)
+        )
+        is_candidate = com_dist <= max_dist
+        rows = rows[is_candidate.any(axis=1)]
+        cols = cols[is_candidate.any(axis=0)]
+        is_candidate = is_candidate[np.ix_(rows, cols)]
+        dist = dist[np.ix_(rows, cols)]
+        # Cost higher than any full assignment of candidate pairs
+        forbidden_cost = dist[is_candidate].sum() + 1
+        dist[~is_candidate] = forbidden_cost
+    
+    row_ind, col_ind = linear_sum_assignment(dist)
+    if max_dist:
+        is_valid = is_candidate[row_ind, col_ind]
+        row_ind, col_ind = row_ind[is_valid], col_ind[is_valid]
+    
+    cells1 = feat1['cell'].to_numpy()[rows[row_ind]]
+    cells2 = feat2['cell'].to_numpy()[cols[col_ind]]
+    return cells2, cells1
 
 def scipy_align(m1, m2, acdc_yeaz=True):
     """
@@ -69,7 +129,7 @@ def scipy_align(m1, m2, acdc_yeaz=True):
     d.pop(-1, None)
     return d
 
-def correspondence_stack(stack, signals=None):
+def correspondence_stack(stack, signals=None, max_dist=None):
     """
     source: YeaZ
     corrects correspondence of a stack of segmented and labeled masks, by
@@ -77,13 +137,14 @@ def correspondence_stack(stack, signals=None):
     """
     tracked_stack = np.empty(stack.shape, dtype=np.uint32)
     tracked_stack[0] = stack[0]
-    for idx in tqdm(range(len(stack)), ncols=100):
-        try:
-            curr = stack[idx+1]
-            prev = tracked_stack[idx]
-        except IndexError:
-            continue
-        tracked_stack[idx+1] = correspondence(prev, curr)
+    prev_feat = get_features_table(tracked_stack[0])
+    for idx in tqdm(range(len(stack)-1), ncols=100):
+        curr = stack[idx+1]
+        prev = tracked_stack[idx]
+        tracked_stack[idx+1], prev_feat = correspondence(
+            prev, curr, max_dist=max_dist, prev_feat=prev_feat, 
+            return_feat=True
+        )
         if signals is not None:
             signals.progressBar.emit(1)
     # tracked_stack = relabel_sequential(tracked_stack)[0]
@@ -135,27 +196,43 @@ def cell_to_features(im, c, nsamples=None, time=None):
             'com_x': com[0],
             'com_y': com[1]}
 
+def get_features_table(m, t=None):
+    """
+    Features of all the cells in m (area and center of mass) computed 
+    in one pass over the foreground pixels with np.bincount. 3D masks get 
+    an additional 'com_z' column.
+    """
+    m_flat = m.ravel()
+    fg_idx = np.flatnonzero(m_flat)
+    fg_cells = m_flat[fg_idx].astype(np.int64)
+    area = np.bincount(fg_cells)
+    cells = np.nonzero(area)[0]
+    area = area[cells]
+    com = [
+        np.bincount(fg_cells, weights=axis_coords)[cells]/area
+        for axis_coords in np.unravel_index(fg_idx, m.shape)
+    ]
+    features = pd.DataFrame({
+        'cell': cells,
+        'time': t,
+        'sqrtarea': np.sqrt(area),
+        'area': area,
+        'com_x': com[-2],
+        'com_y': com[-1]
+    })
+    if m.ndim == 3:
+        features['com_z'] = com[0]
+    return features
+
+def get_com_cols(features):
+    com_cols = ['com_x', 'com_y']
+    if 'com_z' in features.columns:
+        com_cols.append('com_z')
+    return com_cols
+
 def get_features_acdc(m, t):
-    rp = regionprops(m)
-    features = {
-        'cell': [],
-        'time': [],
-        'sqrtarea': [],
-        'area': [],
-        'com_x': [],
-        'com_y': []
-    }
-    for obj in rp:
-        area = obj.area
-        y, x = obj.centroid
-        features['cell'].append(obj.label)
-        features['time'].append(t)
-        features['sqrtarea'].append(sqrt(area))
-        features['area'].append(area)
-        features['com_x'].append(y)
-        features['com_y'].append(x)
-    df = pd.DataFrame(features)
-    return df, dict(enumerate(features['cell']))
+    df = get_features_table(m, t=t)
+    return df, dict(enumerate(df['cell'].to_list()))
 
 
 def get_features(m, t):
@@ -165,6 +242,31 @@ def get_features(m, t):
     features = [cell_to_features(m, c, time=t) for c in cells]
     return pd.DataFrame(features), dict(enumerate(cells))
 
+def features_distance(feat1, feat2, weight_com=3):
+    """
+    Distance matrix between the cells of two features tables. Features are 
+    standardized together (like sklearn.preprocessing.scale) and the 
+    pairwise euclidean distances are computed with broadcasting.
+    """
+    cols = get_com_cols(feat1) + ['area']
+    X1 = feat1[cols].to_numpy(dtype=float)
+    X2 = feat2[cols].to_numpy(dtype=float)
+    X = np.concatenate((X1, X2))
+    std = X.std(axis=0)
+    std[std == 0] = 1.0
+    mean = X.mean(axis=0)
+    X1 = (X1 - mean)/std
+    X2 = (X2 - mean)/std
+
+    # give more importance to center of mass
+    num_com_cols = len(cols) - 1
+    X1[:, :num_com_cols] *= weight_com
+    X2[:, :num_com_cols] *= weight_com
+
+    # pairwise euclidean dist
+    diff = X1[:, np.newaxis] - X2[np.newaxis]
+    return np.sqrt(np.square(diff).sum(axis=-1))
+
 def cell_distance(m1, m2, weight_com=3, acdc_yeaz=True):
     """
     source: YeaZ
@@ -173,33 +275,17 @@ def cell_distance(m1, m2, weight_com=3, acdc_yeaz=True):
     as features, with center of mass weighted with factor weight_com (to
     make it more important).
     """
-    # Modify to compute use more computed features
-    #cols = ['com_x', 'com_y', 'roundness', 'sqrtarea']
-    cols = ['com_x', 'com_y', 'area']
-
     get_features_func = get_features_acdc if acdc_yeaz else get_features
 
-    # Create df, rescale
+    # Create df
     feat1, ix_to_cell1 = get_features_func(m1, 1)
     feat2, ix_to_cell2 = get_features_func(m2, 2)
 
-    # feat1_acdc, ix_to_cell1_acdc = get_features_acdc(m1, 1)
-
     # Check if one of matrices doesn't contain cells
     if len(feat1)==0 or len(feat2)==0:
         return None, None, None
 
-    df = pd.concat((feat1, feat2))
-    df[cols] = scale(df[cols])
-
-    # give more importance to center of mass
-    df[['com_x', 'com_y']] = df[['com_x', 'com_y']] * weight_com
-
-    # pairwise euclidean dist
-    dist = euclidean_distances(
-        df.loc[df['time']==1][cols],
-        df.loc[df['time']==2][cols]
-    )
+    dist = features_distance(feat1, feat2, weight_com=weight_com)
     return dist, ix_to_cell1, ix_to_cell2
 
 
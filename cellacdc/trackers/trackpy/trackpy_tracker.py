@@ -5,7 +5,7 @@ import trackpy as tp
 import skimage.measure
 from ..CellACDC import CellACDC_tracker
 
-from cellacdc import apps, printl
+from cellacdc import apps, core, printl
 
 DEBUG = False
 
@@ -13,14 +13,37 @@ class tracker:
     def __init__(self) -> None:
         pass
 
-    def _set_frame_features(self, lab, frame_i, tp_df):
-        rp = skimage.measure.regionprops(lab)
-        for obj in rp:
-            yc, xc = obj.centroid
-            tp_df['x'].append(xc)
-            tp_df['y'].append(yc)
-            tp_df['frame'].append(frame_i)
-            tp_df['ID'].append(obj.label)
+    def _get_frame_features(self, lab, frame_i):
+        rp_table = skimage.measure.regionprops_table(
+            lab, properties=('label', 'centroid')
+        )
+        frame_df = pd.DataFrame({
+            'x': rp_table[f'centroid-{lab.ndim-1}'],
+            'y': rp_table[f'centroid-{lab.ndim-2}'],
+        })
+        if lab.ndim == 3:
+            frame_df['z'] = rp_table['centroid-0']
+        frame_df['frame'] = frame_i
+        frame_df['ID'] = rp_table['label']
+        return frame_df
+    
+    def _get_features(self, segm_video):
+        frames_dfs = [None]*len(segm_video)
+        _map = core._map_frames(
+            lambda i: self._get_frame_features(segm_video[i], i), 
+            len(segm_video)
+        )
+        for frame_i, frame_df in _map:
+            frames_dfs[frame_i] = frame_df
+        return pd.concat(frames_dfs, ignore_index=True)
+    
+    def _relabel_frame(self, lab, old_IDs, tracked_IDs):
+        if DEBUG and len(tracked_IDs) > 0:
+            print('-------------------------')
+            for old_ID, tracked_ID in zip(old_IDs, tracked_IDs):
+                print(f'Tracking ID {old_ID} --> {tracked_ID}')
+            print('-------------------------')
+        return CellACDC_tracker.indexAssignmentLUT(lab, old_IDs, tracked_IDs)
 
     def track(
             self, segm_video,
@@ -43,10 +66,7 @@ class tracker:
                 adaptive_stop = float(adaptive_stop)
         
         # Build tp DataFrame --> https://soft-matter.github.io/trackpy/v0.5.0/generated/trackpy.link.html#trackpy.link
-        tp_df = {'x': [], 'y': [], 'frame': [], 'ID': []}
-        for frame_i, lab in enumerate(segm_video):
-            self._set_frame_features(lab, frame_i, tp_df)
-        tp_df = pd.DataFrame(tp_df)
+        tp_df = self._get_features(segm_video)
 
         # Run tracker
         if dynamic_predictor:
@@ -68,47 +88,25 @@ class tracker:
         
         tp_df['particle'] += 1 # trackpy starts from 0 with tracked ids
 
-        # Generate tracked video data
-        tracked_video = np.zeros_like(segm_video)
-        for frame_i, lab in enumerate(segm_video):
-            rp = skimage.measure.regionprops(lab)
-            tracked_lab = lab.copy()
-            tp_df_frame = tp_df.loc[frame_i]
-
-            IDs_curr_untracked = [obj.label for obj in rp]
-
-            if DEBUG:
-                printl(f'Current untracked IDs: {IDs_curr_untracked}')
-
-            if not IDs_curr_untracked:
-                # No cells segmented
-                continue
-            
-            try:
-                tracked_IDs = tp_df_frame['particle'].astype(int).to_list()
-                old_IDs = tp_df_frame['ID'].astype(int).to_list()
-            except AttributeError:
-                # Single cell
-                tracked_IDs = [int(tp_df_frame['particle'])]
-                old_IDs = [int(tp_df_frame['ID'])]
-            
-            if not tracked_IDs:
-                # No cells tracked
-                continue
-
-            uniqueID = max((max(tracked_IDs), max(IDs_curr_untracked)))+1
-
-            if DEBUG:
-                print('-------------------------')
-                print(f'Tracking frame n. {frame_i+1}')
-                for old_ID, tracked_ID in zip(old_IDs, tracked_IDs):
-                    print(f'Tracking ID {old_ID} --> {tracked_ID}')
-                print('-------------------------')
-            
-            tracked_lab = CellACDC_tracker.indexAssignment(
-                old_IDs, tracked_IDs, IDs_curr_untracked,
-                lab.copy(), rp, uniqueID
+        # Generate tracked video data with one LUT relabel per frame
+        frames = tp_df.index.to_numpy()
+        sort_idx = np.argsort(frames, kind='stable')
+        bounds = np.searchsorted(
+            frames[sort_idx], np.arange(len(segm_video)+1)
+        )
+        old_IDs = tp_df['ID'].to_numpy(dtype=np.int64)[sort_idx]
+        tracked_IDs = tp_df['particle'].to_numpy(dtype=np.int64)[sort_idx]
+        
+        def relabel(frame_i):
+            start, end = bounds[frame_i], bounds[frame_i+1]
+            return self._relabel_frame(
+                segm_video[frame_i], old_IDs[start:end], 
+                tracked_IDs[start:end]
             )
+
+        tracked_video = np.zeros_like(segm_video)
+        _map = core._map_frames(relabel, len(segm_video))
+        for frame_i, tracked_lab in _map:
             tracked_video[frame_i] = tracked_lab
 
             # Used to update the progressbar of the gui
@@ -133,7 +133,7 @@ class LabelRoiWorker(QObject):
                     img, **self.Gui.segment2D_kwargs
                 )
                 if self.Gui.applyPostProcessing:
-                    lab = core.remove_artefacts(
+                    lab = core.post_process_segm(
                         lab, **self.Gui.removeArtefactsKwargs
                     )
                 self.sigLabellingDone.emit(lab)
@@ -448,9 +448,13 @@ class segmWorker(QObject):
         if self.secondChannelData is not None:
             img = self.mainWin.model.to_rgb_stack(img, self.secondChannelData)
 
+        if hasattr(self.mainWin.model, 'set_diameter_cache_key'):
+            self.mainWin.model.set_diameter_cache_key(
+                posData.pos_path, posData.user_ch_name
+            )
         _lab = self.mainWin.model.segment(img, **self.mainWin.segment2D_kwargs)
         if self.mainWin.applyPostProcessing:
-            _lab = core.remove_artefacts(
+            _lab = core.post_process_segm(
                 _lab, **self.mainWin.removeArtefactsKwargs
             )
         
@@ -491,13 +495,17 @@ class segmVideoWorker(QObject):
     def run(self):
         t0 = time.perf_counter()
         img_data = self.posData.img_data[self.startFrameNum-1:self.stopFrameNum]
+        if hasattr(self.model, 'set_diameter_cache_key'):
+            self.model.set_diameter_cache_key(
+                self.posData.pos_path, self.posData.user_ch_name
+            )
         for i, img in enumerate(img_data):
             frame_i = i+self.startFrameNum-1
             if self.secondChannelData is not None:
                 img = self.model.to_rgb_stack(img, self.secondChannelData)
             lab = self.model.segment(img, **self.segment2D_kwargs)
             if self.applyPostProcessing:
-                lab = core.remove_artefacts(
+                lab = core.post_process_segm(
                     lab, **self.removeArtefactsKwargs
                 )
             self.posData.segm_data[frame_i] = lab
@@ -749,6 +757,7 @@ class calcMetricsWorker(QObject):
                         f'"{posData.pos_path}"'
                     )
 
+                centroids_dfs = {}
                 acdc_df_li = []
                 keys = []
                 self.signals.initProgressBar.emit(stopFrameNum)
@@ -794,11 +803,10 @@ class calcMetricsWorker(QObject):
                         self.standardMetricsErrors[str(error)] = traceback_format
                     
                     try:
-                        prev_data_dict = posData.allData_li[frame_i-1]
-                        prev_lab = prev_data_dict['labels']
-                        acdc_df = addVelocityMeasurement(
-                            acdc_df, prev_lab, lab, posData
-                        )
+                        if frame_i > 0:
+                            acdc_df = addVelocityMeasurement(
+                                acdc_df, frame_i, posData, centroids_dfs
+                            )
                     except Exception as error:
                         traceback_format = traceback.format_exc()
                         print('-'*30)      
@@ -1185,6 +1193,12 @@ class reapplyDataPrepWorker(QObject):
             for chName in self.selectedChannels:
                 filePath = load.get_filename_from_channel(imagesPath, chName)
                 posData = load.loadData(filePath, chName)
+                if posData.getVirtualDataPrepParams() is not None:
+                    self.progress.emit(
+                        f'Channel "{chName}" is aligned and cropped when '
+                        'loaded (dataPrep in virtual mode). Nothing to save.'
+                    )
+                    continue
                 posData.getBasenameAndChNames()
                 posData.buildPaths()
                 posData.loadImgData()
@@ -1209,7 +1223,9 @@ class reapplyDataPrepWorker(QObject):
                         align_func = core.align_frames_3D
                     else:
                         align_func = core.align_frames_2D 
-                    imageData, _ = align_func(imageData, user_shifts=shifts)
+                    imageData, _ = align_func(
+                        imageData, user_shifts=shifts, out=imageData
+                    )
                     prepped = True
                     isAligned = True
                 
@@ -2597,7 +2613,15 @@ class AlignWorker(BaseWorkerUtil):
                             'Skipping this positon.'
                         )
                         continue
-                    
+                
+                if posData.getVirtualDataPrepParams() is not None:
+                    # dataPrep in virtual mode applies the saved shifts at 
+                    # read time (see `load.AlignedCroppedData`), hence we 
+                    # only update the shifts instead of the image files
+                    self.updateVirtualShifts(posData, zz, savedShiftsHow)
+                    continue
+
+                if savedShiftsHow == 'rever_alignment':
                     # Revert alignment and save selected channel
                     for chName in chNames:
                         self.logger.log(
@@ -2640,9 +2664,11 @@ class AlignWorker(BaseWorkerUtil):
                             data = load.load_image_file(file_path)
                         self.signals.sigInitInnerPbar.emit(len(data)-1)
                         
+                        # Align in place data that is not displayed
+                        out = None if chName == posData.user_ch_name else data
                         alignedImgData, shifts = align_func(
                             data, slices=zz, user_shifts=user_shifts,
-                            sigPyqt=self.signals.sigUpdateInnerPbar
+                            sigPyqt=self.signals.sigUpdateInnerPbar, out=out
                         )
                         self.logger.log(f'Saving "{chName}"...')
                         np.save(posData.align_shifts_path, shifts)
@@ -2660,6 +2686,31 @@ class AlignWorker(BaseWorkerUtil):
                 
         self.signals.finished.emit(self)
     
+    def updateVirtualShifts(self, posData, zz, savedShiftsHow):
+        if savedShiftsHow == 'use_saved_shifts':
+            if posData.loaded_shifts is not None:
+                self.logger.log(
+                    f'Saved shifts of "{posData.relPath}" are already applied '
+                    'when loading the data (dataPrep virtual mode).'
+                )
+                return
+
+        if savedShiftsHow == 'rever_alignment':
+            self.logger.log(f'Reverting alignment of "{posData.relPath}"...')
+            shifts = np.zeros_like(posData.loaded_shifts)
+        else:
+            self.logger.log(
+                f'Registering frames of "{posData.user_ch_name}"...'
+            )
+            # Register the raw frames (memory-mapped when possible)
+            raw_data = load.load_image_file(posData.imgPath)
+            self.signals.sigInitInnerPbar.emit(len(raw_data)-1)
+            shifts = core.register_frames(
+                raw_data, slices=zz, sigPyqt=self.signals.sigUpdateInnerPbar
+            )
+            self.signals.sigInitInnerPbar.emit(0)
+        np.save(posData.align_shifts_path, shifts)
+
     def saveAlignedData(
             self, data, imagesPath, basename, chName, endname, ext='.tif'
         ):
@@ -2679,4 +2730,6 @@ class AlignWorker(BaseWorkerUtil):
         elif ext == '.npz':
             np.savez_compressed(filePath, data)
         elif ext == '.h5':
-            load.save_to_h5(filePath, data)
+            # z-stacks are read in blocks of z-slices (e.g., 3D segmentation)
+            access = 'zblock' if data.ndim == 4 else 'frame'
+            load.save_to_h5(filePath, data, access=access)
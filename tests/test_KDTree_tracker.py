@@ -0,0 +1,148 @@
+# Test the KDTree tracker (KD-tree candidate pairs and sparse assignment)
+# against a dense matching over all the pairs of objects
+
+import numpy as np
+import pytest
+import scipy.optimize
+import skimage.draw
+import skimage.measure
+
+from cellacdc.trackers.KDTree import KDTree_tracker
+
+def _dense_match_objects(prev_lab, lab, max_distance, max_area_ratio):
+    """Same cost of `KDTree_tracker.match_objects` computed for every pair
+    of objects with masks and solved with a dense `linear_sum_assignment`.
+    Pairs farther than `max_distance` or with a larger area ratio than
+    `max_area_ratio` are forbidden."""
+    prev_rp = skimage.measure.regionprops(prev_lab)
+    rp = skimage.measure.regionprops(lab)
+    num_prev, num_curr = len(prev_rp), len(rp)
+    forbidden = 1e9
+    cost = np.full((num_curr, num_prev+num_curr), forbidden)
+    for i, obj in enumerate(rp):
+        # Every object can stay unmatched (new object)
+        cost[i, num_prev+i] = 3
+        for j, prev_obj in enumerate(prev_rp):
+            dist = np.linalg.norm(
+                np.subtract(obj.centroid, prev_obj.centroid)
+            )
+            if dist > max_distance:
+                continue
+            area_ratio = (
+                max(obj.area, prev_obj.area)/min(obj.area, prev_obj.area)
+            )
+            if area_ratio > max_area_ratio:
+                continue
+            mask, prev_mask = lab == obj.label, prev_lab == prev_obj.label
+            IoU = (
+                np.count_nonzero(mask & prev_mask)
+                / np.count_nonzero(mask | prev_mask)
+            )
+            cost[i, j] = dist/max_distance + (1 - IoU)
+    row_ind, col_ind = scipy.optimize.linear_sum_assignment(cost)
+    is_matched = col_ind < num_prev
+    old_IDs = [rp[i].label for i in row_ind[is_matched]]
+    tracked_IDs = [prev_rp[j].label for j in col_ind[is_matched]]
+    return dict(zip(old_IDs, tracked_IDs))
+
+def _moving_objects_frames(seed, num_objs=40, shape=(200, 200), speed=6):
+    """Two frames of ellipses that move and change size. IDs of the second
+    frame are shuffled and some objects disappear or appear."""
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(15, np.subtract(shape, 15), size=(num_objs, 2))
+    radii = rng.uniform(3, 7, size=(num_objs, 2))
+    prev_lab = np.zeros(shape, dtype=np.uint32)
+    lab = np.zeros(shape, dtype=np.uint32)
+    IDs = rng.permutation(num_objs+5) + 1
+    for ID, (center, r) in enumerate(zip(centers, radii), start=1):
+        rr, cc = skimage.draw.ellipse(*center, *r, shape=shape)
+        prev_lab[rr, cc] = ID
+        if rng.random() < 0.1:
+            # Object disappears
+            continue
+        center = center + rng.normal(0, speed, size=2)
+        r = r*rng.uniform(0.8, 1.25, size=2)
+        rr, cc = skimage.draw.ellipse(*center, *r, shape=shape)
+        lab[rr, cc] = IDs[ID-1]
+    for ID in IDs[num_objs:]:
+        # New objects
+        center = rng.uniform(15, np.subtract(shape, 15))
+        rr, cc = skimage.draw.ellipse(*center, 4, 4, shape=shape)
+        lab[rr, cc] = ID
+    return prev_lab, lab
+
+@pytest.mark.parametrize('seed', range(4))
+@pytest.mark.parametrize('max_distance', [5.0, 10.0, 20.0])
+def test_match_objects_dense(seed, max_distance):
+    prev_lab, lab = _moving_objects_frames(seed)
+    expected = _dense_match_objects(
+        prev_lab, lab, max_distance=max_distance, max_area_ratio=2.0
+    )
+    old_IDs, tracked_IDs, _ = KDTree_tracker.match_objects(
+        prev_lab, lab, max_distance=max_distance, max_area_ratio=2.0,
+        detect_divisions=False
+    )
+    result = dict(zip(old_IDs.tolist(), tracked_IDs.tolist()))
+    assert result == expected
+
+def _disk_lab(disks, shape=(80, 80)):
+    lab = np.zeros(shape, dtype=np.uint32)
+    for (y, x, r), ID in disks:
+        rr, cc = skimage.draw.disk((y, x), r, shape=shape)
+        lab[rr, cc] = ID
+    return lab
+
+def test_max_distance_cut_off():
+    prev_lab = _disk_lab([((20, 20, 5), 1), ((60, 20, 5), 2)])
+    # Object 1 moves by 8 pixels, object 2 by 15 pixels
+    lab = _disk_lab([((20, 28, 5), 7), ((60, 35, 5), 9)])
+    video = np.array([prev_lab, lab])
+
+    tracked_video = KDTree_tracker.tracker().track(video, max_distance=10)
+    assert tracked_video[1][20, 28] == 1
+    # Farther than max_distance --> new ID
+    assert tracked_video[1][60, 35] not in (0, 1, 2)
+
+    tracked_video = KDTree_tracker.tracker().track(video, max_distance=20)
+    assert tracked_video[1][20, 28] == 1
+    assert tracked_video[1][60, 35] == 2
+
+def test_division_detection():
+    # Mother 1 divides into two daughters with random IDs, cell 2 moves
+    prev_lab = _disk_lab([((30, 30, 12), 1), ((65, 65, 5), 2)])
+    lab = np.zeros_like(prev_lab)
+    lab[20:30, 22:39] = 5
+    lab[31:41, 22:39] = 3
+    lab[prev_lab == 2] = 4
+    video = np.array([prev_lab, lab])
+
+    tracker = KDTree_tracker.tracker()
+    tracked_video = tracker.track(video, max_distance=20)
+
+    daughters_IDs = {tracked_video[1][25, 30], tracked_video[1][35, 30]}
+    assert tracked_video[1][65, 65] == 2
+    # The daughter with the largest overlap keeps the ID of the mother
+    assert 1 in daughters_IDs
+    assert len(daughters_IDs) == 2
+    new_ID = (daughters_IDs - {1}).pop()
+    assert new_ID not in (2, 3, 4, 5)
+    divisions_df = tracker.divisions_df()
+    assert len(divisions_df) == 2
+    assert (divisions_df['parent_ID'] == 1).all()
+    assert (divisions_df['frame_i'] == 1).all()
+    assert set(divisions_df['daughter_ID']) == daughters_IDs
+
+    # Without division detection the unmatched daughter is a new object
+    tracker = KDTree_tracker.tracker()
+    tracker.track(video, max_distance=20, detect_divisions=False)
+    assert len(tracker.divisions_df()) == 0
+
+def test_no_division_if_daughters_too_large():
+    prev_lab = _disk_lab([((30, 30, 8), 1)])
+    lab = np.zeros_like(prev_lab)
+    # Daughters much larger than the mother (area ratio > max_area_ratio)
+    lab[10:30, 10:50] = 1
+    lab[30:50, 10:50] = 2
+    tracker = KDTree_tracker.tracker()
+    tracker.track(np.array([prev_lab, lab]), max_distance=30)
+    assert len(tracker.divisions_df()) == 0
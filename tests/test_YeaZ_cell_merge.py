@@ -0,0 +1,132 @@
+# Test that YeaZ `cell_merge` (adjacency graph and union-find) gives the
+# same output of the previous implementation (copied below as
+# `_baseline_cell_merge`) on synthetic watershed labels
+
+import os
+import importlib.util
+
+import numpy as np
+import pytest
+import scipy.ndimage
+from skimage.morphology import dilation
+
+import cellacdc
+
+# The YeaZ package imports tensorflow, load only the post-processing module
+_segment_path = os.path.join(
+    os.path.dirname(cellacdc.__file__), 'models', 'YeaZ', 'unet', 'segment.py'
+)
+_spec = importlib.util.spec_from_file_location('yeaz_segment', _segment_path)
+segment = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(segment)
+
+def _baseline_cell_merge(wsh, pred, q=0.75):
+    wshshape=wsh.shape
+    objs = np.zeros((wsh.max()+1,wshshape[0],wshshape[1]), dtype=bool)
+    dil_objs = np.zeros((wsh.max()+1,wshshape[0],wshshape[1]), dtype=bool)
+    obj_coords = np.zeros((wsh.max()+1,4))
+    wshclean = np.zeros((wshshape[0],wshshape[1]))
+    kernel = np.ones((3,3), dtype=bool)
+
+    for obj1 in range(wsh.max()):
+        objs[obj1,:,:] = wsh==(obj1+1)
+        dil_objs[obj1,:,:] = dilation(objs[obj1,:,:], kernel)
+        obj_coords[obj1,:] = segment.get_bounding_box(dil_objs[obj1,:,:])
+
+    objcounter = 0
+    for obj1 in range(wsh.max()):
+        dil1 = dil_objs[obj1,:,:]
+        if np.sum(dil1) == 0:
+            continue
+
+        objcounter = objcounter + 1
+        orig1 = objs[obj1,:,:]
+
+        for obj2 in range(obj1+1,wsh.max()):
+            dil2 = dil_objs[obj2,:,:]
+            if (segment.do_box_overlap(obj_coords[obj1,:], obj_coords[obj2,:])
+                and np.sum(dil2) > 0):
+
+                border = dil1 * dil2
+                border_pred = pred[border]
+                if len(border_pred) < 32:
+                    continue
+
+                q75 = np.quantile(border_pred, q)
+                top_border_pred = border_pred[border_pred >= q75]
+                top_border_height = top_border_pred.sum()
+                top_border_area = len(top_border_pred)
+
+                if top_border_height / top_border_area > .99:
+                    orig1 = np.logical_or(orig1, objs[obj2,:,:])
+                    dil_objs[obj1,:,:] = np.logical_or(dil1, dil2)
+                    dil_objs[obj2,:,:] = np.zeros((wshshape[0], wshshape[1]))
+                    obj_coords[obj1,:] = segment.get_bounding_box(
+                        dil_objs[obj1,:,:]
+                    )
+
+        wshclean = wshclean + orig1*objcounter
+
+    return wshclean
+
+def _groups_pred(wsh, groups):
+    """Prediction that is 1 inside the groups of objects (cells split by
+    the watershed) and 0 at the borders between different groups"""
+    groups_max = scipy.ndimage.maximum_filter(groups, size=5)
+    groups_min = scipy.ndimage.minimum_filter(groups, size=5)
+    pred = ((groups_max == groups_min) & (groups > 0)).astype(float)
+    pred[groups > 0] = np.maximum(pred[groups > 0], 0.5)
+    return pred
+
+def _tiles_wsh_pred(seed, grid=(5, 6), tile=(18, 22)):
+    """Watershed labels of touching rectangular tiles grouped in random
+    rectangular blocks of tiles"""
+    rng = np.random.default_rng(seed)
+    nrows, ncols = grid
+    tiles_IDs = np.arange(1, nrows*ncols+1).reshape(grid)
+    wsh = np.pad(np.kron(tiles_IDs, np.ones(tile, dtype=int)), 4)
+
+    row_blocks = np.cumsum(rng.random(nrows) < 0.5)
+    col_blocks = np.cumsum(rng.random(ncols) < 0.5)
+    tiles_groups = row_blocks[:, np.newaxis]*ncols + col_blocks + 1
+    groups = np.concatenate(([0], tiles_groups.ravel()))[wsh]
+    return wsh, _groups_pred(wsh, groups)
+
+@pytest.mark.parametrize('seed', range(6))
+def test_cell_merge_tiles(seed):
+    wsh, pred = _tiles_wsh_pred(seed)
+    expected = _baseline_cell_merge(wsh, pred)
+    merged = segment.cell_merge(wsh, pred)
+    assert np.array_equal(merged, expected.astype(int))
+    # Something was merged and something was not
+    assert 1 < merged.max() < wsh.max()
+
+def test_cell_merge_small_borders():
+    # Borders shorter than 32 pixels are never merged
+    wsh = np.zeros((30, 30), dtype=int)
+    wsh[5:15, 5:15] = 1
+    wsh[5:15, 15:25] = 2
+    wsh[15:25, 5:15] = 3
+    pred = np.ones(wsh.shape)
+    expected = _baseline_cell_merge(wsh, pred)
+    merged = segment.cell_merge(wsh, pred)
+    assert np.array_equal(merged, expected.astype(int))
+    assert merged.max() == 3
+
+def test_cell_merge_chained_objects():
+    # 2 is only diagonally adjacent to 3. The previous implementation
+    # merged 4 into 2 and then skipped the border between 3 and the
+    # (deleted) 4, leaving 3 separate. Merges are now resolved together.
+    wsh = np.zeros((50, 50), dtype=int)
+    wsh[5:25, 5:25] = 1
+    wsh[5:25, 25:45] = 2
+    wsh[25:45, 5:25] = 3
+    wsh[25:45, 25:45] = 4
+    groups = np.where(wsh == 1, 1, 2*(wsh > 0))
+    pred = _groups_pred(wsh, groups)
+    merged = segment.cell_merge(wsh, pred)
+    assert merged.max() == 2
+    assert np.array_equal(merged > 0, wsh > 0)
+    assert len(np.unique(merged[wsh == 1])) == 1
+    assert len(np.unique(merged[wsh > 1])) == 1
+    assert merged[10, 10] != merged[30, 30]
@@ -0,0 +1,95 @@
+# Test the headless cell cycle annotation (`core.auto_cca_acdc_df`) against
+# the annotation of the GUI (`gui.autoCca_df` and `gui.checkScellsGone`)
+# on a synthetic mother/bud time-lapse
+
+import numpy as np
+import pandas as pd
+import skimage.draw
+
+from cellacdc import core
+
+CCA_COLS = [
+    'cell_cycle_stage', 'generation_num', 'relative_ID', 'relationship',
+    'emerg_frame_i', 'division_frame_i', 'is_history_known',
+    'corrected_assignment'
+]
+
+def _disk(lab, center, radius, ID):
+    rr, cc = skimage.draw.disk(center, radius, shape=lab.shape)
+    lab[rr, cc] = ID
+
+def _mother_bud_video():
+    """Mother 1 and dead cell 5 in every frame. Bud 2 emerges at frame 1
+    between them (closer to 5) and it disappears at frame 3."""
+    video = np.zeros((4, 40, 60), dtype=np.uint32)
+    for frame_i, lab in enumerate(video):
+        _disk(lab, (20, 15), 8, 1)
+        _disk(lab, (20, 45), 8, 5)
+        if frame_i in (1, 2):
+            _disk(lab, (20, 33), 3, 2)
+    return video
+
+def _acdc_df(video):
+    index = pd.MultiIndex.from_tuples(
+        [
+            (frame_i, int(ID)) for frame_i, lab in enumerate(video)
+            for ID in np.unique(lab) if ID > 0
+        ],
+        names=['frame_i', 'Cell_ID']
+    )
+    acdc_df = pd.DataFrame(index=index)
+    acdc_df['is_cell_dead'] = (
+        acdc_df.index.get_level_values('Cell_ID') == 5
+    ).astype(int)
+    acdc_df['cell_area_pxl'] = 100.0
+    return acdc_df
+
+def _expected_cca_df():
+    base = ('G1', 2, -1, 'mother', -1, -1, False, False)
+    S_mother = ('S', 2, 2, 'mother', -1, -1, False, False)
+    bud = ('S', 0, 1, 'bud', 1, -1, True, False)
+    # Division annotated on the previous frame when the bud disappears
+    divided_mother = ('G1', 3, 2, 'mother', -1, 3, False, False)
+    divided_bud = ('G1', 1, 1, 'mother', 1, 3, True, False)
+    rows = {
+        (0, 1): base, (0, 5): base,
+        (1, 1): S_mother, (1, 2): bud, (1, 5): base,
+        (2, 1): divided_mother, (2, 2): divided_bud, (2, 5): base,
+        (3, 1): divided_mother, (3, 5): base,
+    }
+    index = pd.MultiIndex.from_tuples(rows.keys(), names=['frame_i', 'Cell_ID'])
+    return pd.DataFrame(list(rows.values()), index=index, columns=CCA_COLS)
+
+def test_auto_cca_acdc_df_matches_gui_annotation():
+    video = _mother_bud_video()
+    acdc_df = _acdc_df(video)
+
+    annotated_df = core.auto_cca_acdc_df(video, acdc_df, logger=lambda *a: None)
+
+    expected_df = _expected_cca_df()
+    assert annotated_df.index.equals(acdc_df.index)
+    pd.testing.assert_frame_equal(
+        annotated_df[CCA_COLS].astype(object),
+        expected_df.loc[acdc_df.index].astype(object)
+    )
+    # The other columns are not modified
+    pd.testing.assert_frame_equal(
+        annotated_df[acdc_df.columns], acdc_df
+    )
+
+def test_auto_cca_acdc_df_start_frame_annotations():
+    video = _mother_bud_video()
+    acdc_df = _acdc_df(video)
+    expected_df = _expected_cca_df()
+    # Frame 1 already annotated and the rest not annotated yet
+    acdc_df[CCA_COLS] = expected_df.loc[acdc_df.index].astype(object)
+    acdc_df.loc[[2, 3], CCA_COLS] = None
+
+    annotated_df = core.auto_cca_acdc_df(
+        video, acdc_df, start_frame_i=1, logger=lambda *a: None
+    )
+
+    pd.testing.assert_frame_equal(
+        annotated_df[CCA_COLS].astype(object).loc[[1, 2, 3]],
+        expected_df.loc[[1, 2, 3]].astype(object)
+    )
@@ -0,0 +1,62 @@
+# Test that the cellpose masks recomputed from the cached flows are the same
+# masks computed by cellpose `eval`.
+
+import numpy as np
+import pytest
+
+cellpose_models = pytest.importorskip('cellpose.models')
+torch = pytest.importorskip('torch')
+
+import skimage.draw
+
+from cellacdc.models.cellpose import acdcSegment
+
+CellposeModel = cellpose_models.CellposeModel
+
+def _untrained_cellpose_model(gpu=False, net_avg=False, model_type=None):
+    # Random weights, the pretrained weights are not required to compare
+    # two ways of computing masks from the same network output
+    return CellposeModel(gpu=gpu, net_avg=net_avg)
+
+@pytest.fixture
+def model(monkeypatch):
+    monkeypatch.setattr(
+        acdcSegment.models, 'CellposeModel', _untrained_cellpose_model
+    )
+    torch.manual_seed(0)
+    return acdcSegment.Model(model_type='nuclei')
+
+def _synthetic_image():
+    rng = np.random.default_rng(0)
+    img = np.zeros((128, 128), dtype=np.float32)
+    for r, c in rng.integers(15, 113, size=(12, 2)):
+        rr, cc = skimage.draw.disk((r, c), 8, shape=img.shape)
+        img[rr, cc] = 1
+    img += rng.normal(0, 0.1, size=img.shape)
+    return img
+
+def test_masks_from_cached_flows_match_eval(model, monkeypatch):
+    img = _synthetic_image()
+    # Non-default diameter (the model diam_mean is 30)
+    kwargs = {'diameter': 60.0, 'flow_threshold': 0.0}
+
+    model.enable_inference_cache()
+    model.segment(img, cellprob_threshold=-0.02, **kwargs)
+
+    num_eval_calls = 0
+    model_eval = model.model.eval
+    def count_eval_calls(*args, **kwargs):
+        nonlocal num_eval_calls
+        num_eval_calls += 1
+        return model_eval(*args, **kwargs)
+    monkeypatch.setattr(model.model, 'eval', count_eval_calls)
+
+    cached_lab = model.segment(img, cellprob_threshold=-0.05, **kwargs)
+    assert num_eval_calls == 0
+
+    model.inference_cache = None
+    eval_lab = model.segment(img, cellprob_threshold=-0.05, **kwargs)
+    assert num_eval_calls > 0
+
+    assert eval_lab.max() > 0
+    assert np.array_equal(cached_lab, eval_lab)
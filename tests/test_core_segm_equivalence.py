@@ -0,0 +1,373 @@
+# Test that the vectorized segmentation utilities of `core` give the same
+# output of the previous per-object implementations (copied below as
+# `_baseline_*`) on synthetic labels
+
+import numpy as np
+import pytest
+import scipy.optimize
+import skimage.draw
+import skimage.measure
+
+from cellacdc import core
+
+def _random_labels(shape, num_objs, seed, max_radius=8):
+    """Labels with random ellipses (also touching or overlapping)"""
+    rng = np.random.default_rng(seed)
+    lab = np.zeros(shape, dtype=np.uint32)
+    for ID in range(1, num_objs+1):
+        center = rng.uniform(0, shape)
+        radii = rng.uniform(1, max_radius, size=2)
+        rr, cc = skimage.draw.ellipse(
+            *center, *radii, shape=shape, rotation=rng.uniform(0, np.pi)
+        )
+        lab[rr, cc] = ID
+    return lab
+
+def _random_labels_3D(shape, num_objs, seed):
+    rng = np.random.default_rng(seed)
+    SizeZ = shape[0]
+    labels = np.zeros(shape, dtype=np.uint32)
+    for ID in range(1, num_objs+1):
+        lab = _random_labels(shape[1:], 1, rng.integers(1e6))
+        z0 = rng.integers(0, SizeZ)
+        z1 = rng.integers(z0+1, SizeZ+1)
+        labels[z0:z1][:, lab > 0] = ID
+    return labels
+
+# ---------------------------------------------------------------------------
+# remove_artefacts
+# ---------------------------------------------------------------------------
+
+def _baseline_remove_artefacts_lab2D(
+        lab, min_solidity=None, min_area=None, max_elongation=None
+    ):
+    rp = skimage.measure.regionprops(lab.astype(int))
+    delIDs = []
+    for obj in rp:
+        if min_area is not None:
+            if obj.area < min_area:
+                lab[obj.slice][obj.image] = 0
+                delIDs.append(obj.label)
+                continue
+
+        if min_solidity is not None:
+            if obj.solidity < min_solidity:
+                lab[obj.slice][obj.image] = 0
+                delIDs.append(obj.label)
+                continue
+
+        if max_elongation is not None:
+            minor_axis_length = max(1, obj.minor_axis_length)
+            elongation = obj.major_axis_length/minor_axis_length
+            if elongation > max_elongation:
+                lab[obj.slice][obj.image] = 0
+                delIDs.append(obj.label)
+    return lab, delIDs
+
+def _baseline_remove_artefacts(labels, **kwargs):
+    min_solidity = kwargs.get('min_solidity')
+    min_area = kwargs.get('min_area')
+    max_elongation = kwargs.get('max_elongation')
+    min_obj_no_zslices = kwargs.get('min_obj_no_zslices')
+    if labels.ndim != 3:
+        return _baseline_remove_artefacts_lab2D(
+            labels, min_solidity, min_area, max_elongation
+        )
+
+    delIDs = set()
+    if min_obj_no_zslices is not None:
+        for obj in skimage.measure.regionprops(labels):
+            obj_no_zslices = np.sum(
+                np.count_nonzero(obj.image, axis=(1, 2)).astype(bool)
+            )
+            if obj_no_zslices < min_obj_no_zslices:
+                labels[obj.slice][obj.image] = 0
+                delIDs.add(obj.label)
+
+    for z, lab in enumerate(labels):
+        lab, _delIDs = _baseline_remove_artefacts_lab2D(
+            lab, min_solidity, min_area, max_elongation
+        )
+        delIDs.update(_delIDs)
+        labels[z] = lab
+    return labels, delIDs
+
+ARTEFACTS_KWARGS = [
+    {'min_area': 30},
+    {'min_solidity': 0.9},
+    {'max_elongation': 2.0},
+    {'min_area': 20, 'min_solidity': 0.8, 'max_elongation': 3.0},
+]
+
+@pytest.mark.parametrize('kwargs', ARTEFACTS_KWARGS)
+@pytest.mark.parametrize('seed', [0, 1])
+def test_remove_artefacts_2D(kwargs, seed):
+    lab = _random_labels((80, 100), 40, seed)
+    expected_lab, expected_delIDs = _baseline_remove_artefacts(
+        lab.copy(), **kwargs
+    )
+    lab, delIDs = core.remove_artefacts(lab, return_delIDs=True, **kwargs)
+    assert np.array_equal(lab, expected_lab)
+    assert sorted(delIDs) == sorted(expected_delIDs)
+
+@pytest.mark.parametrize(
+    'kwargs', ARTEFACTS_KWARGS + [{'min_obj_no_zslices': 3, 'min_area': 25}]
+)
+def test_remove_artefacts_3D(kwargs):
+    labels = _random_labels_3D((6, 60, 70), 25, seed=2)
+    expected_labels, expected_delIDs = _baseline_remove_artefacts(
+        labels.copy(), **kwargs
+    )
+    labels, delIDs = core.remove_artefacts(
+        labels, return_delIDs=True, **kwargs
+    )
+    assert np.array_equal(labels, expected_labels)
+    assert delIDs == expected_delIDs
+
+def test_remove_IDs():
+    lab = _random_labels((50, 50), 20, seed=3)
+    IDs = [2, 5, 11, 19]
+    expected = lab.copy()
+    for ID in IDs:
+        expected[expected == ID] = 0
+    assert np.array_equal(core._remove_IDs(lab.copy(), IDs), expected)
+    assert np.array_equal(core._remove_IDs(lab.copy(), []), lab)
+    # IDs not present in lab are ignored
+    assert np.array_equal(
+        core._remove_IDs(lab.copy(), [2, 5, 11, 19, 100]), expected
+    )
+    mask = lab > 0
+    core._remove_IDs(mask, [True])
+    assert not mask.any()
+
+# ---------------------------------------------------------------------------
+# track_sub_cell_objects
+# ---------------------------------------------------------------------------
+
+def _baseline_track_sub_cell_objects(
+        cells_segm_data, subobj_segm_data, IoAthresh, how='delete_sub'
+    ):
+    tracked_cells_segm_data = None
+    tracked_subobj_segm_data = np.zeros_like(subobj_segm_data)
+
+    segm_data_zip = zip(cells_segm_data, subobj_segm_data)
+    old_tracked_sub_obj_IDs = set()
+    all_num_objects_per_cells = []
+    all_cells_IDs_with_sub_obj = []
+    all_old_sub_ids = [{} for _ in range(len(cells_segm_data))]
+    for frame_i, (lab, lab_sub) in enumerate(segm_data_zip):
+        rp = skimage.measure.regionprops(lab)
+        num_objects_per_cells = {obj.label:0 for obj in rp}
+        rp_sub = skimage.measure.regionprops(lab_sub)
+        tracked_lab_sub = tracked_subobj_segm_data[frame_i]
+        cells_IDs_with_sub_obj = []
+        for sub_obj in rp_sub:
+            intersect_mask = lab[sub_obj.slice][sub_obj.image]
+            intersect_IDs, I_counts = np.unique(
+                intersect_mask, return_counts=True
+            )
+            for intersect_ID, I in zip(intersect_IDs, I_counts):
+                if intersect_ID == 0:
+                    continue
+
+                IoA = I/sub_obj.area
+                if IoA < IoAthresh:
+                    continue
+
+                all_old_sub_ids[frame_i][sub_obj.label] = intersect_ID
+                tracked_lab_sub[sub_obj.slice][sub_obj.image] = intersect_ID
+                num_objects_per_cells[intersect_ID] += 1
+                old_tracked_sub_obj_IDs.add(sub_obj.label)
+                cells_IDs_with_sub_obj.append(intersect_ID)
+
+        all_num_objects_per_cells.append(num_objects_per_cells)
+        all_cells_IDs_with_sub_obj.append(cells_IDs_with_sub_obj)
+
+    if how == 'delete_both' or how == 'delete_cells':
+        tracked_cells_segm_data = cells_segm_data.copy()
+        for frame_i, lab in enumerate(tracked_cells_segm_data):
+            rp = skimage.measure.regionprops(lab)
+            tracked_lab = tracked_cells_segm_data[frame_i]
+            cells_IDs_with_sub_obj = all_cells_IDs_with_sub_obj[frame_i]
+            for obj in rp:
+                if obj.label in cells_IDs_with_sub_obj:
+                    continue
+
+                tracked_lab[obj.slice][obj.image] = 0
+
+    if how == 'only_track' or how == 'delete_cells':
+        maxSubObjID = tracked_subobj_segm_data.max() + 1
+        for sub_obj_ID in np.unique(subobj_segm_data):
+            if sub_obj_ID == 0:
+                continue
+
+            if sub_obj_ID in old_tracked_sub_obj_IDs:
+                continue
+
+            tracked_subobj_segm_data[subobj_segm_data == sub_obj_ID] = (
+                maxSubObjID
+            )
+
+            for frame_i, lab_sub in enumerate(subobj_segm_data):
+                if sub_obj_ID not in lab_sub:
+                    continue
+                all_old_sub_ids[frame_i][sub_obj_ID] = maxSubObjID
+            maxSubObjID += 1
+
+    return (
+        tracked_subobj_segm_data, tracked_cells_segm_data,
+        all_num_objects_per_cells, all_old_sub_ids
+    )
+
+def _sub_cell_video(seed):
+    rng = np.random.default_rng(seed)
+    cells = np.array([
+        _random_labels((60, 80), 15, rng.integers(1e6), max_radius=12)
+        for _ in range(3)
+    ])
+    subobjs = np.array([
+        _random_labels((60, 80), 25, rng.integers(1e6), max_radius=4)
+        for _ in range(3)
+    ])
+    return cells, subobjs
+
+def _to_int_dicts(dicts):
+    return [{int(k): int(v) for k, v in d.items()} for d in dicts]
+
+# Thresholds >= 0.5 because with lower thresholds the baseline assigned
+# a sub-object to every cell reaching the threshold (the last one wins)
+@pytest.mark.parametrize(
+    'how', ['delete_sub', 'delete_cells', 'delete_both', 'only_track']
+)
+@pytest.mark.parametrize('IoAthresh', [0.5, 0.9])
+def test_track_sub_cell_objects(how, IoAthresh):
+    cells, subobjs = _sub_cell_video(seed=4)
+    expected = _baseline_track_sub_cell_objects(
+        cells, subobjs, IoAthresh, how=how
+    )
+    result = core.track_sub_cell_objects(cells, subobjs, IoAthresh, how=how)
+
+    assert np.array_equal(result[0], expected[0])
+    if expected[1] is None:
+        assert result[1] is None
+    else:
+        assert np.array_equal(result[1], expected[1])
+    assert _to_int_dicts(result[2]) == _to_int_dicts(expected[2])
+    assert _to_int_dicts(result[3]) == _to_int_dicts(expected[3])
+
+# ---------------------------------------------------------------------------
+# label_3d_segm
+# ---------------------------------------------------------------------------
+
+def _reference_label_3d_segm(labels, IoU_thresh=0.5):
+    """Per-object implementation: objects of adjacent z-slices are the same
+    3D object if their IoU >= IoU_thresh. 3D objects are numbered in
+    the order of their first (z-slice, ID). The baseline `label_3d_segm`
+    was a stub returning its input, so this is the reference."""
+    parents = {}
+
+    def find(node):
+        while parents[node] != node:
+            node = parents[node]
+        return node
+
+    for z, lab in enumerate(labels):
+        for obj in skimage.measure.regionprops(lab):
+            parents[(z, obj.label)] = (z, obj.label)
+
+    for z in range(len(labels)-1):
+        lower, upper = labels[z], labels[z+1]
+        for obj in skimage.measure.regionprops(lower):
+            mask = lower == obj.label
+            for upper_ID in np.unique(upper[mask]):
+                if upper_ID == 0:
+                    continue
+                upper_mask = upper == upper_ID
+                IoU = (
+                    np.count_nonzero(mask & upper_mask)
+                    / np.count_nonzero(mask | upper_mask)
+                )
+                if IoU < IoU_thresh:
+                    continue
+                root_a = find((z, obj.label))
+                root_b = find((z+1, upper_ID))
+                if root_a != root_b:
+                    parents[max(root_a, root_b)] = min(root_a, root_b)
+
+    roots = sorted({find(node) for node in parents})
+    new_IDs = {root: ID for ID, root in enumerate(roots, start=1)}
+    out = np.zeros_like(labels)
+    for (z, ID) in parents:
+        out[z][labels[z] == ID] = new_IDs[find((z, ID))]
+    return out
+
+def _same_partition(a, b):
+    """True if the two labels arrays have the same objects"""
+    if not np.array_equal(a > 0, b > 0):
+        return False
+    pairs = np.unique(np.column_stack((a[a > 0], b[b > 0])), axis=0)
+    return (
+        len(pairs) == len(np.unique(pairs[:, 0]))
+        and len(pairs) == len(np.unique(pairs[:, 1]))
+    )
+
+@pytest.mark.parametrize('IoU_thresh', [0.3, 0.5, 0.8])
+def test_label_3d_segm(IoU_thresh):
+    rng = np.random.default_rng(5)
+    # Per-slice 2D segmentation of 3D objects: independent IDs per z-slice
+    # and jittered shapes so that some links are below the threshold
+    labels_3D = _random_labels_3D((7, 60, 70), 20, seed=5)
+    labels = np.zeros_like(labels_3D)
+    for z, lab in enumerate(labels_3D):
+        shift = rng.integers(-2, 3, size=2)
+        lab = np.roll(lab, shift, axis=(0, 1))
+        perm = np.concatenate(([0], rng.permutation(lab.max()) + 1))
+        labels[z] = perm[lab]
+
+    expected = _reference_label_3d_segm(labels, IoU_thresh=IoU_thresh)
+    result = core.label_3d_segm(labels.copy(), IoU_thresh=IoU_thresh)
+    assert _same_partition(result, expected)
+
+# ---------------------------------------------------------------------------
+# assign_buds_to_mothers
+# ---------------------------------------------------------------------------
+
+def _baseline_assign_buds_to_mothers(moth_contours, bud_contours):
+    """Dense cost matrix of the minimum contour-to-contour distances solved
+    with `linear_sum_assignment` (previous `gui.autoCca_df`)"""
+    cost = np.full((len(moth_contours), len(bud_contours)), np.inf)
+    for i, cont in enumerate(moth_contours):
+        for j, bud_cont in enumerate(bud_contours):
+            diff = cont[:, np.newaxis] - bud_cont
+            cost[i, j] = np.min(np.linalg.norm(diff, axis=2))
+    row_idx, col_idx = scipy.optimize.linear_sum_assignment(cost)
+    return row_idx, col_idx, cost
+
+@pytest.mark.parametrize('seed', range(5))
+def test_assign_buds_to_mothers(seed):
+    rng = np.random.default_rng(seed)
+    lab = _random_labels((150, 150), 30, seed, max_radius=10)
+    IDs = core._get_IDs(lab)
+    numBuds = rng.integers(1, len(IDs)//3)
+    bud_IDs = rng.choice(IDs, size=numBuds, replace=False)
+    moth_IDs = np.setdiff1d(IDs, bud_IDs)
+    moth_contours = core._get_objs_contours(lab, moth_IDs)
+    bud_contours = core._get_objs_contours(lab, bud_IDs)
+
+    expected_rows, expected_cols, cost = _baseline_assign_buds_to_mothers(
+        moth_contours, bud_contours
+    )
+    # Small cut-off to force the cut-off doubling
+    for max_dist in (None, 1):
+        row_idx, col_idx = core.assign_buds_to_mothers(
+            moth_contours, bud_contours, max_dist=max_dist
+        )
+        assert np.isclose(
+            cost[row_idx, col_idx].sum(),
+            cost[expected_rows, expected_cols].sum()
+        )
+        assert sorted(col_idx.tolist()) == list(range(numBuds))
+        if len(np.unique(cost)) == cost.size:
+            # Optimal assignment is unique
+            assert np.array_equal(row_idx, expected_rows)
+            assert np.array_equal(col_idx, expected_cols)
@@ -0,0 +1,77 @@
+# Test the read-time alignment and cropping of data prepared by dataPrep in
+# virtual mode (see `load.AlignedCroppedData`)
+
+import os
+
+import numpy as np
+import tifffile
+
+from cellacdc import load
+
+class _ReadCounter:
+    """Array wrapper that records the indexes that are read"""
+    def __init__(self, data):
+        self.data = data
+        self.shape = data.shape
+        self.dtype = data.dtype
+        self.ndim = data.ndim
+        self.keys = []
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, key):
+        self.keys.append(key)
+        return self.data[key]
+
+def _write_position(tmp_path, video, roi):
+    images_path = tmp_path / 'Position_1' / 'Images'
+    os.makedirs(images_path)
+    basename = 'test_s1_'
+    tifffile.imwrite(images_path / f'{basename}phase.tif', video)
+    SizeT = len(video)
+    (images_path / f'{basename}metadata.csv').write_text(
+        'Description,values\n'
+        f'SizeT,{SizeT}\n'
+        'SizeZ,1\n'
+        f'basename,{basename}\n'
+        'channel_0_name,phase\n'
+    )
+    y0, y1, x0, x1 = roi
+    (images_path / f'{basename}dataPrepROIs_coords.csv').write_text(
+        'description,value\n'
+        f'x_left,{x0}\n'
+        f'x_right,{x1}\n'
+        f'y_top,{y0}\n'
+        f'y_bottom,{y1}\n'
+        'cropped,1\n'
+        'virtual,1'
+    )
+    return str(images_path / f'{basename}phase.tif')
+
+def test_crop_only_timelapse_reads_one_frame():
+    video = np.arange(5*20*30, dtype=np.uint16).reshape(5, 20, 30)
+    roi = (2, 12, 5, 25)
+    data = _ReadCounter(video)
+    view = load.AlignedCroppedData(data, roi=roi, is_timelapse=True)
+
+    assert view.shape == (5, 10, 20)
+    frame = view[3]
+    assert np.array_equal(frame, video[3, 2:12, 5:25])
+    assert data.keys == [(3, slice(2, 12), slice(5, 25))]
+
+def test_loadData_crop_only_timelapse(tmp_path):
+    video = np.arange(5*20*30, dtype=np.uint16).reshape(5, 20, 30)
+    roi = (2, 12, 5, 25)
+    imgPath = _write_position(tmp_path, video, roi)
+
+    posData = load.loadData(imgPath, 'phase')
+    posData.getBasenameAndChNames()
+    posData.buildPaths()
+    posData.loadImgData()
+
+    assert posData.img_data.shape == (5, 10, 20)
+    # Frames are read one by one and not as a single z-stack
+    assert posData.img_data.is_timelapse
+    assert np.array_equal(posData.img_data[1], video[1, 2:12, 5:25])
+    assert posData.img_data.max() == video[:, 2:12, 5:25].max()
@@ -0,0 +1,32 @@
+# Test that the experiment manifest does not reuse stale file info
+
+import os
+
+import numpy as np
+
+from cellacdc import load
+
+def test_file_info_after_overwrite_in_place(tmp_path, monkeypatch):
+    monkeypatch.setattr(load, 'manifests_path', str(tmp_path / 'manifests'))
+    monkeypatch.setattr(load, '_racy_mtime_window_ns', 0)
+    monkeypatch.setattr(load, '_manifests', {})
+
+    images_path = tmp_path / 'exp' / 'Position_1' / 'Images'
+    os.makedirs(images_path)
+    filepath = str(images_path / 'test_s1_phase.npy')
+    np.save(filepath, np.zeros((3, 4, 5), dtype=np.uint16))
+
+    manifest = load.get_manifest(str(tmp_path / 'exp'))
+    assert manifest.file_info(filepath)['shape'] == [3, 4, 5]
+
+    # Overwriting the file does not change the folder modification time
+    folder_mtime_ns = os.stat(images_path).st_mtime_ns
+    np.save(filepath, np.zeros((2, 4, 5, 6), dtype=np.float32))
+    stat = os.stat(filepath)
+    os.utime(filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns+10**9))
+    os.utime(images_path, ns=(folder_mtime_ns, folder_mtime_ns))
+
+    info = manifest.file_info(filepath)
+    assert info['shape'] == [2, 4, 5, 6]
+    assert info['dtype'] == np.dtype(np.float32).str
+    assert info['size'] == os.stat(filepath).st_size
@@ -0,0 +1,8 @@
+# Test that the parameters manifests of models and trackers are up-to-date.
+# Regenerate them with `python -m cellacdc.params_manifests`
+
+from cellacdc import params_manifests
+
+def test_params_manifests_up_to_date():
+    outdated = params_manifests.get_outdated_manifests()
+    assert not outdated, f'Outdated parameters manifests: {outdated}'
@@ -0,0 +1,105 @@
+# Regression tests of the look-up table relabelling shared by the trackers
+# (`CellACDC_tracker.indexAssignmentLUT`) when nothing is tracked
+
+import numpy as np
+import pytest
+import skimage.measure
+
+from cellacdc.trackers.CellACDC import CellACDC_tracker
+from cellacdc.trackers.KDTree import KDTree_tracker
+
+def _squares_lab(centers, IDs, shape=(60, 60), half_side=3):
+    lab = np.zeros(shape, dtype=np.uint32)
+    for (y, x), ID in zip(centers, IDs):
+        lab[y-half_side:y+half_side, x-half_side:x+half_side] = ID
+    return lab
+
+@pytest.mark.parametrize('tracked', [False, True])
+def test_indexAssignmentLUT_matches_indexAssignment(tracked):
+    lab = _squares_lab([(10, 10), (10, 40), (40, 10), (40, 40)], [1, 2, 5, 7])
+    if tracked:
+        old_IDs, tracked_IDs = [5, 1], [2, 9]
+    else:
+        old_IDs, tracked_IDs = [], []
+    IDs_curr_untracked = [1, 2, 5, 7]
+    uniqueID = 10
+    expected = CellACDC_tracker.indexAssignment(
+        old_IDs, tracked_IDs, IDs_curr_untracked, lab.copy(),
+        skimage.measure.regionprops(lab), uniqueID
+    )
+    tracked_lab = CellACDC_tracker.indexAssignmentLUT(
+        lab, old_IDs, tracked_IDs, IDs_curr_untracked=IDs_curr_untracked,
+        uniqueID=uniqueID
+    )
+    assert np.array_equal(tracked_lab, expected)
+
+def test_KDTree_nothing_tracked_gets_new_IDs():
+    prev_lab = _squares_lab([(10, 10), (10, 20)], [1, 2])
+    # Same IDs but farther than `max_distance` from the previous objects
+    lab = _squares_lab([(50, 50), (50, 30)], [2, 1])
+    video = np.array([prev_lab, lab])
+    tracked_video = KDTree_tracker.tracker().track(video, max_distance=10)
+
+    assert np.array_equal(tracked_video[0], prev_lab)
+    assert np.array_equal(tracked_video[1] > 0, lab > 0)
+    # Nothing is tracked --> no false links to the IDs of the previous frame
+    assert set(np.unique(tracked_video[1])) == {0, 3, 4}
+
+def test_KDTree_empty_previous_frame():
+    lab = _squares_lab([(10, 10), (40, 40)], [1, 2])
+    video = np.array([np.zeros_like(lab), lab, lab])
+    tracked_video = KDTree_tracker.tracker().track(video)
+
+    assert not np.any(tracked_video[0])
+    assert np.array_equal(tracked_video[1] > 0, lab > 0)
+    assert len(np.unique(tracked_video[1])) == 3
+    assert np.array_equal(tracked_video[2], tracked_video[1])
+
+def test_trackpy_empty_and_new_objects():
+    pytest.importorskip('trackpy')
+    from cellacdc.trackers.trackpy import trackpy_tracker
+
+    lab = _squares_lab([(10, 10), (40, 40)], [1, 2])
+    lab_new = _squares_lab([(10, 11), (40, 41), (25, 50)], [3, 1, 2])
+    video = np.array([lab, np.zeros_like(lab), lab_new, lab_new])
+    tracked_video = trackpy_tracker.tracker().track(video, memory=1)
+
+    for tracked_lab, lab in zip(tracked_video, video):
+        assert np.array_equal(tracked_lab > 0, lab > 0)
+    # Objects that moved 1 pixel keep their ID across the empty frame
+    assert tracked_video[2][10, 10] == tracked_video[0][10, 10]
+    assert tracked_video[2][40, 40] == tracked_video[0][40, 40]
+    assert np.array_equal(tracked_video[3], tracked_video[2])
+
+def test_btrack_nothing_tracked_keeps_frame():
+    pytest.importorskip('btrack')
+    from cellacdc.trackers.BayesianTracker import BayesianTracker_tracker
+
+    lab = _squares_lab([(10, 10), (40, 40)], [1, 2])
+    no_tracks = {
+        'ID': np.zeros(0, dtype=int),
+        'y': np.zeros(0), 'x': np.zeros(0), 'z': np.zeros(0)
+    }
+    tracked_lab, old_IDs, tracked_IDs = BayesianTracker_tracker._relabel_frame(
+        lab, no_tracks
+    )
+    assert np.array_equal(tracked_lab, lab)
+    assert len(tracked_IDs) == 0
+
+    # Tracks outside of the frame are skipped
+    outside_tracks = {
+        'ID': np.array([5]),
+        'y': np.array([100.0]), 'x': np.array([100.0]), 'z': np.array([0.0])
+    }
+    tracked_lab, _, tracked_IDs = BayesianTracker_tracker._relabel_frame(
+        lab, outside_tracks
+    )
+    assert np.array_equal(tracked_lab, lab)
+    assert len(tracked_IDs) == 0
+
+    tracks = {
+        'ID': np.array([7]),
+        'y': np.array([40.0]), 'x': np.array([40.0]), 'z': np.array([0.0])
+    }
+    tracked_lab, _, _ = BayesianTracker_tracker._relabel_frame(lab, tracks)
+    assert set(np.unique(tracked_lab)) == {0, 7, 8}